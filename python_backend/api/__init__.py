@@ -1,142 +1,634 @@
 """
 API路由模块
 """
-from fastapi import APIRouter, Depends
+import asyncio
+import base64
+import time
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, or_, and_, select, union
 from datetime import datetime, timedelta
 from typing import List, Optional
+import orjson
 from models.database import (
     get_db, NetworkTraffic, OnlineDevice, NetworkLatency,
-    RouterStatus, BandwidthUsage, ConnectionQuality
+    RouterStatus, BandwidthUsage, ConnectionQuality, DevicePresence,
+    AnomalyEvent, UsageDaily, UsageMonthly, HeatmapCell
 )
+from services.data_collector import data_collector
+from services.shared_state import shared_state
+from services.timeseries_store import bucket_series, interpolate_gaps, rows_to_columns, from_epoch, to_epoch
+from services.compression import COMPRESSION_MAX_INTERVAL
+from services.archive import archive
+from services.bucket_cache import bucket_cache
+from services.usage import local_periods
+from services.talkers import TALKER_WINDOWS
+from services.highres import HIGHRES_TRAFFIC_ENABLED, ROLLUPS
+from services.heatmap import HEATMAP_WEEKS, HEATMAP_METRICS, oldest_week, summarize
+from services.export import EXPORT_MODELS, EXPORT_FORMATS, resolve_columns, export_stream
+from utils.fast_json import FastJSONResponse, records, columnar
+from utils.clock import to_utc_naive
 
 router = APIRouter()
 
+# 时间戳格式参数：iso（默认）或 ms（epoch毫秒）
+TS_QUERY = Query("iso", alias="ts", pattern="^(iso|ms)$")
+
+# 响应字段 -> 列，查询时直接取列元组，不构造ORM对象
+TRAFFIC_FIELDS = {
+    "id": NetworkTraffic.id,
+    "timestamp": NetworkTraffic.timestamp,
+    "uploadSpeed": NetworkTraffic.upload_speed,
+    "downloadSpeed": NetworkTraffic.download_speed,
+    "totalUpload": NetworkTraffic.total_upload,
+    "totalDownload": NetworkTraffic.total_download,
+}
+
+DEVICE_FIELDS = {
+    "id": OnlineDevice.id,
+    "macAddress": OnlineDevice.mac_address,
+    "ipAddress": OnlineDevice.ip_address,
+    "hostname": OnlineDevice.hostname,
+    "deviceType": OnlineDevice.device_type,
+    "vendor": OnlineDevice.vendor,
+    "isOnline": OnlineDevice.is_online,
+    "lastSeen": OnlineDevice.last_seen,
+    "uploadSpeed": OnlineDevice.upload_speed,
+    "downloadSpeed": OnlineDevice.download_speed,
+}
+
+LATENCY_FIELDS = {
+    "id": NetworkLatency.id,
+    "timestamp": NetworkLatency.timestamp,
+    "target": NetworkLatency.target,
+    "latency": NetworkLatency.latency,
+    "packetLoss": NetworkLatency.packet_loss,
+}
+
+ROUTER_FIELDS = {
+    "id": RouterStatus.id,
+    "timestamp": RouterStatus.timestamp,
+    "cpuUsage": RouterStatus.cpu_usage,
+    "memoryUsage": RouterStatus.memory_usage,
+    "temperature": RouterStatus.temperature,
+    "uptime": RouterStatus.uptime,
+    "wanStatus": RouterStatus.wan_status,
+}
+
+QUALITY_FIELDS = {
+    "id": ConnectionQuality.id,
+    "timestamp": ConnectionQuality.timestamp,
+    "signalStrength": ConnectionQuality.signal_strength,
+    "stability": ConnectionQuality.stability,
+    "errorRate": ConnectionQuality.error_rate,
+    "retransmitRate": ConnectionQuality.retransmit_rate,
+}
+
+TS_KEYS = ("timestamp", "lastSeen")
+
+def _shared_snapshot() -> Optional[dict]:
+    """采集器不在本进程运行时（APP_ROLE=api 或未抢到采集器锁），读取采集进程发布的状态快照"""
+    return None if data_collector.is_running else shared_state.read()
+
+# 查询最新数据时的时间下界（按天分区时只扫描最近的分区）
+LATEST_LOOKBACK = timedelta(days=1)
+
+def _latest(db: Session, fields: dict, ts_format: str):
+    """最新一行：优先使用采集器内存（或共享快照）中的最新样本（压缩存储时数据库可能滞后），否则查询数据库"""
+    table = fields["timestamp"].class_.__tablename__
+    cached = data_collector.latest.get(table) if data_collector.is_running else shared_state.latest(table)
+    if cached:
+        now, data = cached
+        row = [
+            None if key == "id" else now if key == "timestamp" else data.get(column.key)
+            for key, column in fields.items()
+        ]
+    else:
+        row = db.query(*fields.values()).filter(
+            fields["timestamp"] >= datetime.utcnow() - LATEST_LOOKBACK
+        ).order_by(desc(fields["timestamp"])).first()
+    return records([row], list(fields), ts_format, TS_KEYS)[0] if row else None
+
+# 历史曲线的最大点数
+HISTORY_BUCKETS = 288
+
+# 结束时间早于 当前时间 - 该秒数 的桶视为已关闭，可以缓存（容纳入库延迟）
+HISTORY_SETTLE_SECONDS = 30
+
+TRAFFIC_AGGREGATIONS = {
+    "upload_speed": "mean",
+    "download_speed": "mean",
+    "total_upload": "last",
+    "total_download": "last",
+}
+
+ROUTER_AGGREGATIONS = {
+    "cpu_usage": "mean",
+    "memory_usage": "mean",
+    "temperature": "mean",
+}
+
+def _load_series(db: Session, model, metric: str, names: List[str], start: float, end: float):
+    """读取 [start, end) 的列式数据：内存窗口内的部分直接取内存，更早的部分查询数据库和归档"""
+    covered_from = data_collector.memory_store.covered_from(metric)
+    timestamps, columns = [], {name: [] for name in names}
+    
+    if covered_from is None or covered_from > start:
+        db_end = min(covered_from, end) if covered_from is not None else end
+        # 已归档的部分从归档文件读取（数据库中可能还有未删除的副本），之后的部分查询数据库
+        split = archive.split_point(model.__tablename__, from_epoch(start), from_epoch(db_end))
+        for chunk in archive.iter_chunks(model.__tablename__, ["timestamp"] + names, from_epoch(start), split):
+            chunk_timestamps, chunk_columns = rows_to_columns(chunk, names)
+            timestamps.extend(chunk_timestamps)
+            for name in names:
+                columns[name].extend(chunk_columns[name])
+        
+        rows = db.query(model.timestamp, *[getattr(model, name) for name in names]).filter(
+            model.timestamp >= split,
+            model.timestamp < from_epoch(db_end)
+        ).order_by(model.timestamp)
+        db_timestamps, db_columns = rows_to_columns(rows, names)
+        timestamps.extend(db_timestamps)
+        for name in names:
+            columns[name].extend(db_columns[name])
+    
+    if covered_from is not None and covered_from < end:
+        mem_timestamps, mem_columns = data_collector.memory_store.range(metric, max(start, covered_from), end)
+        timestamps.extend(mem_timestamps)
+        for name in names:
+            columns[name].extend(mem_columns[name])
+    
+    return timestamps, columns
+
+def _bucketed_history(db: Session, model, metric: str, aggregations: dict, hours: float, now: float):
+    """
+    按 HISTORY_BUCKETS 个等宽时间桶聚合历史数据，最后一个桶包含当前时间
+    桶对齐到epoch，已关闭的桶从缓存读取，只计算未缓存的桶
+    """
+    names = list(aggregations)
+    width = hours * 3600 / HISTORY_BUCKETS
+    first = int(now // width) - HISTORY_BUCKETS + 1
+    compressed = model.__tablename__ in data_collector.compressor.deviations
+    # 压缩存储的表最多滞后一个最大存储间隔才写入数据库
+    settle = COMPRESSION_MAX_INTERVAL if compressed else HISTORY_SETTLE_SECONDS
+    
+    def compute(start: float, count: int):
+        timestamps, columns = _load_series(db, model, metric, names, start, start + count * width)
+        return bucket_series(timestamps, columns, start, width, count, aggregations)
+    
+    series = (metric, data_collector.istoreos_client.router_url, tuple(sorted(aggregations.items())))
+    buckets = bucket_cache.assemble(series, width, first, HISTORY_BUCKETS, now - settle, compute)
+    # 旋转门压缩后的表：在最大存储间隔内的空桶按斜线补齐
+    if compressed:
+        buckets = interpolate_gaps(buckets, width, COMPRESSION_MAX_INTERVAL)
+    return buckets
+
 @router.get("/dashboard/overview")
-async def get_dashboard_overview(db: Session = Depends(get_db)):
+async def get_dashboard_overview(ts_format: str = TS_QUERY, db: Session = Depends(get_db)):
     """获取仪表板概览数据"""
     
-    # 最新网络流量
-    latest_traffic = db.query(NetworkTraffic).order_by(desc(NetworkTraffic.timestamp)).first()
-    
     # 在线设备列表
-    online_devices = db.query(OnlineDevice).filter(OnlineDevice.is_online == True).all()
+    online_devices = db.query(*DEVICE_FIELDS.values()).filter(OnlineDevice.is_online == True)
     
     # 最近的延迟数据
-    recent_latency = db.query(NetworkLatency).order_by(desc(NetworkLatency.timestamp)).limit(10).all()
-    
-    # 最新路由器状态
-    latest_router_status = db.query(RouterStatus).order_by(desc(RouterStatus.timestamp)).first()
-    
-    # 最新连接质量
-    latest_connection_quality = db.query(ConnectionQuality).order_by(desc(ConnectionQuality.timestamp)).first()
-    
-    return {
-        "networkTraffic": {
-            "id": latest_traffic.id if latest_traffic else None,
-            "timestamp": latest_traffic.timestamp.isoformat() if latest_traffic else None,
-            "uploadSpeed": latest_traffic.upload_speed if latest_traffic else 0,
-            "downloadSpeed": latest_traffic.download_speed if latest_traffic else 0,
-            "totalUpload": latest_traffic.total_upload if latest_traffic else 0,
-            "totalDownload": latest_traffic.total_download if latest_traffic else 0,
-        } if latest_traffic else None,
-        "onlineDevices": [
-            {
-                "id": device.id,
-                "macAddress": device.mac_address,
-                "ipAddress": device.ip_address,
-                "hostname": device.hostname,
-                "deviceType": device.device_type,
-                "isOnline": device.is_online,
-                "lastSeen": device.last_seen.isoformat(),
-                "uploadSpeed": device.upload_speed,
-                "downloadSpeed": device.download_speed,
-            }
-            for device in online_devices
-        ],
-        "latency": [
-            {
-                "id": lat.id,
-                "timestamp": lat.timestamp.isoformat(),
-                "target": lat.target,
-                "latency": lat.latency,
-                "packetLoss": lat.packet_loss,
-            }
-            for lat in recent_latency
-        ],
-        "routerStatus": {
-            "id": latest_router_status.id if latest_router_status else None,
-            "timestamp": latest_router_status.timestamp.isoformat() if latest_router_status else None,
-            "cpuUsage": latest_router_status.cpu_usage if latest_router_status else 0,
-            "memoryUsage": latest_router_status.memory_usage if latest_router_status else 0,
-            "temperature": latest_router_status.temperature if latest_router_status else 0,
-            "uptime": latest_router_status.uptime if latest_router_status else 0,
-            "wanStatus": latest_router_status.wan_status if latest_router_status else "unknown",
-        } if latest_router_status else None,
-        "connectionQuality": {
-            "id": latest_connection_quality.id if latest_connection_quality else None,
-            "timestamp": latest_connection_quality.timestamp.isoformat() if latest_connection_quality else None,
-            "signalStrength": latest_connection_quality.signal_strength if latest_connection_quality else 0,
-            "stability": latest_connection_quality.stability if latest_connection_quality else 0,
-            "errorRate": latest_connection_quality.error_rate if latest_connection_quality else 0,
-            "retransmitRate": latest_connection_quality.retransmit_rate if latest_connection_quality else 0,
-        } if latest_connection_quality else None,
-    }
+    recent_latency = db.query(*LATENCY_FIELDS.values()).filter(
+        NetworkLatency.timestamp >= datetime.utcnow() - LATEST_LOOKBACK
+    ).order_by(desc(NetworkLatency.timestamp)).limit(10)
+    
+    return FastJSONResponse({
+        "networkTraffic": _latest(db, TRAFFIC_FIELDS, ts_format),
+        "onlineDevices": records(online_devices, list(DEVICE_FIELDS), ts_format, TS_KEYS),
+        "latency": records(recent_latency, list(LATENCY_FIELDS), ts_format, TS_KEYS),
+        "routerStatus": _latest(db, ROUTER_FIELDS, ts_format),
+        "connectionQuality": _latest(db, QUALITY_FIELDS, ts_format),
+    })
+
+def _history_payload(buckets, keys: dict, ts_format: str, shape: str):
+    """分桶结果 -> 行列表或列式结构；keys: 列名 -> 响应字段名"""
+    if shape == "columnar":
+        return columnar(
+            [ts for ts, _ in buckets],
+            {key: [row[name] for _, row in buckets] for name, key in keys.items()},
+            ts_format,
+        )
+    return records(
+        ([ts] + [row[name] for name in keys] for ts, row in buckets),
+        ["timestamp"] + list(keys.values()),
+        ts_format,
+    )
 
 @router.get("/dashboard/historical")
-async def get_historical_data(hours: int = 24, db: Session = Depends(get_db)):
-    """获取历史数据"""
+async def get_historical_data(
+    hours: int = Query(24, ge=1),
+    ts_format: str = TS_QUERY,
+    shape: str = Query("rows", pattern="^(rows|columnar)$"),
+    db: Session = Depends(get_db),
+):
+    """获取历史数据（按时间分桶，最多288个点；shape=columnar 返回列式结构）"""
     
-    time_threshold = datetime.utcnow() - timedelta(hours=hours)
+    now = to_epoch(datetime.utcnow())
     
     # 网络流量历史
-    traffic_history = db.query(NetworkTraffic).filter(
-        NetworkTraffic.timestamp >= time_threshold
-    ).order_by(NetworkTraffic.timestamp).limit(288).all()
+    traffic_history = _bucketed_history(
+        db, NetworkTraffic, "network_traffic", TRAFFIC_AGGREGATIONS, hours, now
+    )
     
     # 路由器状态历史
-    router_history = db.query(RouterStatus).filter(
-        RouterStatus.timestamp >= time_threshold
-    ).order_by(RouterStatus.timestamp).limit(288).all()
-    
-    return {
-        "networkTraffic": [
-            {
-                "timestamp": t.timestamp.isoformat(),
-                "uploadSpeed": t.upload_speed,
-                "downloadSpeed": t.download_speed,
-                "totalUpload": t.total_upload,
-                "totalDownload": t.total_download,
-            }
-            for t in traffic_history
-        ],
-        "routerStatus": [
-            {
-                "timestamp": r.timestamp.isoformat(),
-                "cpuUsage": r.cpu_usage,
-                "memoryUsage": r.memory_usage,
-                "temperature": r.temperature,
-            }
-            for r in router_history
-        ],
-    }
+    router_history = _bucketed_history(
+        db, RouterStatus, "router_status", ROUTER_AGGREGATIONS, hours, now
+    )
+    
+    return FastJSONResponse({
+        "networkTraffic": _history_payload(traffic_history, {
+            "upload_speed": "uploadSpeed",
+            "download_speed": "downloadSpeed",
+            "total_upload": "totalUpload",
+            "total_download": "totalDownload",
+        }, ts_format, shape),
+        "routerStatus": _history_payload(router_history, {
+            "cpu_usage": "cpuUsage",
+            "memory_usage": "memoryUsage",
+            "temperature": "temperature",
+        }, ts_format, shape),
+    })
+
+# 设备列表分页
+DEVICE_PAGE_DEFAULT = 500
+DEVICE_PAGE_MAX = 5000
+
+def _encode_cursor(last_seen: datetime, device_id: int) -> str:
+    raw = f"{last_seen.isoformat()}|{device_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        last_seen, device_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(last_seen), int(device_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+def _prefix_range(column, prefix: str):
+    """前缀匹配写成索引可用的范围条件：prefix <= column < prefix的后继"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(column >= prefix, column < upper)
 
 @router.get("/devices")
-async def get_devices(db: Session = Depends(get_db)):
-    """获取所有设备"""
-    devices = db.query(OnlineDevice).all()
-    return [
-        {
-            "id": device.id,
-            "macAddress": device.mac_address,
-            "ipAddress": device.ip_address,
-            "hostname": device.hostname,
-            "deviceType": device.device_type,
-            "isOnline": device.is_online,
-            "lastSeen": device.last_seen.isoformat(),
-            "uploadSpeed": device.upload_speed,
-            "downloadSpeed": device.download_speed,
-        }
-        for device in devices
-    ]
+async def get_devices(
+    online: Optional[bool] = None,
+    device_type: Optional[str] = None,
+    prefix: Optional[str] = None,
+    seen_after: Optional[datetime] = None,
+    seen_before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=DEVICE_PAGE_MAX),
+    fields: Optional[str] = None,
+    ts_format: str = TS_QUERY,
+    db: Session = Depends(get_db),
+):
+    """
+    获取设备列表
+    按 last_seen 倒序；传入 limit 或 cursor 时按 (last_seen, id) 键集分页（只传 cursor 时每页
+    DEVICE_PAGE_DEFAULT 条），下一页游标通过 X-Next-Cursor 响应头返回，都不传时返回全部设备
+    """
+    if fields:
+        keys = [key.strip() for key in fields.split(",") if key.strip()]
+        unknown = [key for key in keys if key not in DEVICE_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知的字段: {', '.join(unknown)}")
+    else:
+        keys = list(DEVICE_FIELDS)
+    # 游标需要 lastSeen 和 id，未请求时额外查询后再去掉
+    query_keys = keys + [key for key in ("lastSeen", "id") if key not in keys]
+    
+    query = db.query(*[DEVICE_FIELDS[key] for key in query_keys])
+    if online is not None:
+        query = query.filter(OnlineDevice.is_online == online)
+    if device_type:
+        query = query.filter(OnlineDevice.device_type == device_type)
+    if prefix:
+        # 主机名（不区分大小写）或MAC前缀：两个索引范围查询的并集
+        matches = union(
+            select(OnlineDevice.id).where(_prefix_range(OnlineDevice.hostname_lower, prefix.lower())),
+            select(OnlineDevice.id).where(_prefix_range(OnlineDevice.mac_address, prefix.upper())),
+        )
+        query = query.filter(OnlineDevice.id.in_(select(matches.subquery().c.id)))
+    if seen_after:
+        query = query.filter(OnlineDevice.last_seen >= to_utc_naive(seen_after))
+    if seen_before:
+        query = query.filter(OnlineDevice.last_seen < to_utc_naive(seen_before))
+    if cursor:
+        cursor_seen, cursor_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            OnlineDevice.last_seen < cursor_seen,
+            and_(OnlineDevice.last_seen == cursor_seen, OnlineDevice.id < cursor_id),
+        ))
+    
+    query = query.order_by(desc(OnlineDevice.last_seen), desc(OnlineDevice.id))
+    if limit is None and cursor:
+        limit = DEVICE_PAGE_DEFAULT
+    rows = query.limit(limit + 1).all() if limit is not None else query.all()
+    headers = {}
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = _encode_cursor(
+            last[query_keys.index("lastSeen")], last[query_keys.index("id")]
+        )
+    
+    devices = records(rows, query_keys, ts_format, TS_KEYS)
+    if len(query_keys) > len(keys):
+        devices = [{key: device[key] for key in keys} for device in devices]
+    return FastJSONResponse(devices, headers=headers)
+
+@router.get("/devices/{mac}/sessions")
+async def get_device_sessions(
+    mac: str,
+    limit: int = Query(50, ge=1, le=1000),
+    ts_format: str = TS_QUERY,
+    db: Session = Depends(get_db),
+):
+    """获取设备的在线区间（最近的在前，onlineUntil 为空表示仍在线）"""
+    sessions = db.query(
+        DevicePresence.online_from, DevicePresence.online_until
+    ).filter(
+        DevicePresence.mac_address == mac.upper()
+    ).order_by(desc(DevicePresence.online_from)).limit(limit)
+    return FastJSONResponse(records(
+        sessions, ["onlineFrom", "onlineUntil"], ts_format, ("onlineFrom", "onlineUntil")
+    ))
+
+@router.get("/anomalies")
+async def get_anomalies(
+    hours: int = 24,
+    metric: Optional[str] = None,
+    target: Optional[str] = None,
+    limit: int = Query(200, ge=1, le=5000),
+    ts_format: str = TS_QUERY,
+    db: Session = Depends(get_db),
+):
+    """获取检测到的异常事件（最新的在前）"""
+    query = db.query(
+        AnomalyEvent.timestamp, AnomalyEvent.metric, AnomalyEvent.target, AnomalyEvent.kind,
+        AnomalyEvent.value, AnomalyEvent.expected, AnomalyEvent.score
+    ).filter(AnomalyEvent.timestamp >= datetime.utcnow() - timedelta(hours=hours))
+    if metric:
+        query = query.filter(AnomalyEvent.metric == metric)
+    if target:
+        query = query.filter(AnomalyEvent.target == target)
+    events = query.order_by(desc(AnomalyEvent.timestamp)).limit(limit)
+    return FastJSONResponse(records(
+        events, ["timestamp", "metric", "target", "kind", "value", "expected", "score"], ts_format
+    ))
+
+@router.get("/alerts")
+async def get_alerts():
+    """获取当前触发中的告警和最近的告警事件"""
+    snapshot = _shared_snapshot()
+    if snapshot:
+        alerts = snapshot["alerts"]
+        return FastJSONResponse(dict(alerts, recent=list(reversed(alerts["recent"]))))
+    engine = data_collector.alert_engine
+    return FastJSONResponse({
+        "active": list(engine.active.values()),
+        "recent": list(reversed(engine.recent)),
+        "dropped": engine.dropped,
+    })
+
+@router.get("/alerts/stream")
+async def stream_alerts(request: Request):
+    """告警推送通道（Server-Sent Events）"""
+    if not data_collector.is_running:
+        return StreamingResponse(_poll_shared_alerts(request), media_type="text/event-stream")
+    push = data_collector.alert_engine.sink("push")
+    if push is None:
+        raise HTTPException(status_code=404, detail="未启用推送通道")
+    
+    async def events():
+        queue = push.subscribe()
+        try:
+            while not await request.is_disconnected():
+                try:
+                    alert = await asyncio.wait_for(queue.get(), timeout=15)
+                    yield b"data: " + orjson.dumps(alert) + b"\n\n"
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            push.unsubscribe(queue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+# API进程轮询共享快照的间隔（秒）
+SHARED_ALERT_POLL_SECONDS = 2
+
+def _alert_key(alert: dict) -> tuple:
+    return alert["rule"], alert["target"], alert["status"], alert["timestamp"]
+
+async def _poll_shared_alerts(request: Request):
+    """采集器在其他进程运行时，通过轮询共享快照中的最近告警推送新事件"""
+    snapshot = shared_state.read()
+    seen = {_alert_key(alert) for alert in snapshot["alerts"]["recent"]} if snapshot else set()
+    idle = 0.0
+    while not await request.is_disconnected():
+        await asyncio.sleep(SHARED_ALERT_POLL_SECONDS)
+        idle += SHARED_ALERT_POLL_SECONDS
+        snapshot = shared_state.read()
+        if not snapshot:
+            continue
+        recent = snapshot["alerts"]["recent"]
+        for alert in recent:
+            if _alert_key(alert) not in seen:
+                idle = 0.0
+                yield b"data: " + orjson.dumps(alert) + b"\n\n"
+        seen = {_alert_key(alert) for alert in recent}
+        if idle >= 15:
+            idle = 0.0
+            yield b": keepalive\n\n"
+
+@router.get("/latency/stats")
+async def get_latency_stats(target: Optional[List[str]] = Query(None)):
+    """获取各目标的延迟分位数、抖动和丢包率（1分钟/15分钟/1小时窗口，内存计算）"""
+    snapshot = _shared_snapshot()
+    if snapshot:
+        stats = snapshot["latencyStats"]
+        return FastJSONResponse({name: stats[name] for name in (target or stats) if name in stats})
+    return FastJSONResponse(data_collector.latency_stats.summary(time.time(), target))
+
+@router.get("/talkers")
+async def get_talkers(
+    window: str = Query("15m", pattern="^(" + "|".join(TALKER_WINDOWS) + ")$"),
+    by: str = Query("pair", pattern="^(pair|src|dst)$"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    获取流量大户（基于连接跟踪表的字节增量）
+    by=pair 按 (源, 目的, 协议)，by=src 按局域网主机，by=dst 按远端地址；bytes 为近似值，上界误差为 error
+    """
+    snapshot = _shared_snapshot()
+    if snapshot:
+        return FastJSONResponse(snapshot["talkers"][window][by][:limit])
+    return FastJSONResponse(data_collector.talkers.top(time.time(), window, by, limit))
+
+def _highres():
+    """高精度流量数据只在采集进程的内存中"""
+    if not HIGHRES_TRAFFIC_ENABLED:
+        raise HTTPException(status_code=404, detail="未启用高精度流量采样")
+    if not data_collector.is_running:
+        raise HTTPException(status_code=503, detail="高精度流量数据在采集进程中，当前进程未运行采集器")
+    return data_collector.highres
+
+@router.get("/traffic/highres")
+async def get_highres_current():
+    """各接口最近一秒的接收/发送速率（字节/秒，按路由器时钟计算）"""
+    highres = _highres()
+    return FastJSONResponse({
+        "samples": highres.samples,
+        "resets": highres.resets,
+        "interfaces": {
+            name: {"rxRate": rx, "txRate": tx}
+            for name, (rx, tx) in highres.current.items()
+        },
+    })
+
+HIGHRES_KEYS = {
+    "rx_rate": "rxRate",
+    "tx_rate": "txRate",
+    "rx_mean": "rxMean",
+    "rx_max": "rxMax",
+    "tx_mean": "txMean",
+    "tx_max": "txMax",
+}
+
+@router.get("/traffic/highres/{interface}")
+async def get_highres_series(
+    interface: str,
+    resolution: str = Query("1s", pattern="^(1s|" + "|".join(ROLLUPS) + ")$"),
+    seconds: int = Query(300, ge=1, le=6 * 3600),
+    ts_format: str = TS_QUERY,
+):
+    """
+    接口的高精度速率序列（列式）
+    resolution=1s 为原始数据，10s/1m 为汇总（均值和峰值，只包含已结束的桶）
+    """
+    now = time.time()
+    series = _highres().series(interface, resolution, now - seconds, now + 1)
+    if series is None:
+        raise HTTPException(status_code=404, detail=f"未知的接口: {interface}")
+    timestamps, columns = series
+    return FastJSONResponse(columnar(
+        timestamps, {HIGHRES_KEYS[name]: values for name, values in columns.items()}, ts_format
+    ))
+
+@router.get("/wifi/stations")
+async def get_wifi_stations():
+    """获取当前关联的无线终端（信号、速率、重传率，按MAC关联在线设备信息）"""
+    snapshot = _shared_snapshot()
+    if snapshot:
+        return FastJSONResponse(snapshot["wifiStations"])
+    return FastJSONResponse(data_collector.wifi.stations)
+
+HEATMAP_METRIC_NAMES = [f"{table}.{field}" for table, fields in HEATMAP_METRICS.items() for field in fields]
+
+@router.get("/heatmap/{metric}")
+async def get_heatmap(
+    metric: str,
+    target: str = "",
+    weeks: int = Query(HEATMAP_WEEKS, ge=1, le=HEATMAP_WEEKS),
+    db: Session = Depends(get_db),
+):
+    """
+    获取指标按 星期几×小时（本地时间）的热力图：最近 weeks 周合并后的均值、峰值和样本数，
+    均为 7×24 矩阵（第一行为周一）；target 为ping目标（network_latency.*）或设备MAC（device.traffic）
+    """
+    if metric not in HEATMAP_METRIC_NAMES:
+        raise HTTPException(status_code=404, detail=f"未知的热力图指标: {metric}")
+    if metric.startswith("device."):
+        target = target.upper()
+    now = datetime.utcnow()
+    since = oldest_week(now, weeks)
+    if data_collector.is_running:
+        grid = data_collector.heatmap.grid(metric, target, now, weeks)
+    else:
+        # 采集器在其他进程：读取已写入的格子（最多 168×周数 行）
+        rows = db.query(HeatmapCell.cell, HeatmapCell.total, HeatmapCell.count, HeatmapCell.peak).filter(
+            HeatmapCell.metric == metric, HeatmapCell.target == target, HeatmapCell.week >= since
+        ).all()
+        grid = summarize(rows) if rows else None
+    if grid is None:
+        raise HTTPException(status_code=404, detail=f"没有热力图数据: {metric}[{target}]")
+    return FastJSONResponse(dict(grid, metric=metric, target=target, since=since.isoformat(), weeks=weeks))
+
+USAGE_MODELS = {"day": UsageDaily, "month": UsageMonthly}
+
+@router.get("/usage")
+async def get_usage(
+    period: str = Query("month", pattern="^(day|month)$"),
+    date: Optional[str] = None,
+    kind: Optional[str] = Query(None, pattern="^(interface|device)$"),
+    name: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    获取某一天（date=YYYY-MM-DD）或某个月（date=YYYY-MM）的累计用量，默认当前账期
+    按接口/设备返回接收和发送字节数（路由器视角，跨路由器重启累计）
+    """
+    model = USAGE_MODELS[period]
+    if date:
+        try:
+            value = datetime.strptime(date, "%Y-%m-%d" if period == "day" else "%Y-%m").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"无效的日期: {date}")
+    else:
+        day, month = local_periods(datetime.utcnow())
+        value = day if period == "day" else month
+    
+    query = db.query(model.kind, model.name, model.rx_bytes, model.tx_bytes).filter(model.period == value)
+    if kind:
+        query = query.filter(model.kind == kind)
+    if name:
+        query = query.filter(model.name == (name.upper() if kind == "device" else name))
+    return FastJSONResponse({
+        "period": period,
+        "date": value.isoformat() if period == "day" else value.strftime("%Y-%m"),
+        "usage": records(query.order_by(model.kind, model.name), ["kind", "name", "rxBytes", "txBytes"]),
+    })
+
+@router.get("/export/{metric}")
+async def export_metric(
+    metric: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    fmt: str = Query("csv", alias="format"),
+    gzip: bool = False,
+    columns: Optional[str] = None,
+    target: Optional[str] = None,
+    device_mac: Optional[str] = None,
+):
+    """流式导出任意时间范围的原始时序数据（CSV / NDJSON，可选gzip和列选择）"""
+    model = EXPORT_MODELS.get(metric)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"未知的指标: {metric}")
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的格式: {fmt}")
+    try:
+        names = resolve_columns(model, columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    end = to_utc_naive(end) if end else datetime.utcnow()
+    start = to_utc_naive(start) if start else end - timedelta(hours=24)
+    
+    filters = {}
+    for name, value in (("target", target), ("device_mac", device_mac)):
+        if value is not None:
+            if name not in model.__table__.columns:
+                raise HTTPException(status_code=400, detail=f"{metric} 不支持按 {name} 过滤")
+            filters[name] = value
+    
+    filename = f"{metric}.{fmt}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_stream(metric, names, start, end, fmt, gzip, filters),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,51 @@
+"""
+贾维斯智能监控系统 - 独立采集进程
+与 APP_ROLE=api 的API进程配合使用，API可以用多个worker运行:
+    APP_ROLE=api API_WORKERS=4 python main.py
+    python collector.py
+同时启动多个采集进程时只有持有采集器锁的一个在采集，其余作为备用
+"""
+import asyncio
+import logging
+import signal
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+from models.database import init_db
+from services.data_collector import data_collector
+from services.leader import LeaderLock, run_as_leader
+
+
+async def main():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    logger.info("初始化数据库...")
+    init_db()
+
+    lock = LeaderLock()
+    # 获得锁后采集，失去锁时暂停采集并重新作为备用等待
+    leader = asyncio.create_task(run_as_leader(lock, data_collector.start, data_collector.step_down))
+    await stop_event.wait()
+    leader.cancel()
+
+    logger.info("停止数据收集服务...")
+    await data_collector.stop()
+    lock.release()
+    logger.info("采集进程已退出")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
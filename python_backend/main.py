@@ -1,11 +1,16 @@
 """
 贾维斯智能监控系统 - Python FastAPI后端
 """
+import time
+
+# 启动计时起点（包含依赖导入耗时）
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, Response
 from dotenv import load_dotenv
 import uvicorn
 import logging
@@ -24,6 +29,16 @@ logger = logging.getLogger(__name__)
 from api import router as api_router
 from services.data_collector import data_collector
 from models.database import init_db
+from services.leader import LeaderLock, run_as_leader
+from services.shared_state import shared_state
+from utils.static_files import SPAStaticFiles
+from utils.gzip_middleware import ApiGZipMiddleware
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+# 启动各阶段耗时（毫秒）
+startup_timings = {"imports": elapsed_ms(IMPORT_STARTED)}
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -41,41 +56,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# API响应gzip压缩
+app.add_middleware(ApiGZipMiddleware, minimum_size=1024, compresslevel=6)
+
 # 注册API路由
 app.include_router(api_router, prefix="/api")
 
-# 静态文件服务（前端）
-# 支持本地开发和Docker环境
-frontend_dist = "client/dist" if os.path.exists("client/dist") else "../client/dist"
+# 进程角色：all = API + 采集器（多个worker时只有持有采集器锁的进程采集）
+#           api = 只提供API，采集器由 collector.py 独立运行
+APP_ROLE = os.getenv("APP_ROLE", "all")
+collector_lock = LeaderLock()
+leader_task = None
+init_task = None
+db_ready = False
 
-if os.path.exists(frontend_dist):
-    logger.info(f"找到前端构建文件: {frontend_dist}")
-    app.mount("/assets", StaticFiles(directory=f"{frontend_dist}/assets"), name="assets")
-    
-    @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
-        """服务前端SPA"""
-        file_path = f"{frontend_dist}/{full_path}"
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            return FileResponse(file_path)
-        return FileResponse(f"{frontend_dist}/index.html")
-else:
-    logger.warning("未找到前端构建文件，只提供API服务")
+async def initialize():
+    """后台初始化：建表在线程中执行，采集器登录和预热也在后台进行，均不阻塞HTTP服务"""
+    global leader_task, db_ready
+    try:
+        started = time.perf_counter()
+        logger.info("初始化数据库...")
+        await asyncio.to_thread(init_db)
+        startup_timings["dbInit"] = elapsed_ms(started)
+        db_ready = True
+        
+        if APP_ROLE == "api":
+            logger.info("APP_ROLE=api，本进程只提供API，采集数据来自独立采集进程")
+        else:
+            # 持有采集器锁的worker采集，其他worker作为备用；失去锁时暂停采集并重新等待
+            leader_task = asyncio.create_task(
+                run_as_leader(collector_lock, data_collector.start, data_collector.step_down)
+            )
+        startup_timings["total"] = elapsed_ms(IMPORT_STARTED)
+        logger.info(f"应用初始化完成，耗时(ms): {startup_timings}")
+    except Exception as e:
+        logger.error(f"应用初始化失败: {e}")
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动事件"""
-    logger.info("初始化数据库...")
-    init_db()
-    logger.info("启动数据收集服务...")
-    await data_collector.start()
-    logger.info("应用启动完成")
+    """应用启动事件：立即开始提供HTTP服务，初始化在后台完成"""
+    global init_task
+    init_task = asyncio.create_task(initialize())
+    logger.info("HTTP服务已启动，后台初始化中...")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭事件"""
+    for task in (init_task, leader_task):
+        if task is not None:
+            task.cancel()
     logger.info("停止数据收集服务...")
     await data_collector.stop()
+    collector_lock.release()
     logger.info("应用已关闭")
 
 @app.get("/health")
@@ -84,14 +116,80 @@ async def health_check():
     return {
         "status": "ok",
         "message": "贾维斯智能监控系统运行正常",
-        "collector_running": data_collector.is_running
+        "role": APP_ROLE,
+        "collector_running": data_collector.is_running,
+        "storage": storage_stats(),
+        "retention": retention_stats(),
     }
 
+def storage_stats():
+    """写入队列和缓冲文件的深度、丢弃数和端到端延迟（采集器在其他进程时读取其状态快照）"""
+    if data_collector.is_running:
+        return data_collector.storage.stats()
+    snapshot = shared_state.read()
+    return snapshot.get("storage") if snapshot else None
+
+def retention_stats():
+    """最近一次清理的删除行数、回收字节数和持锁时间"""
+    if data_collector.is_running:
+        return data_collector.retention.last_report
+    snapshot = shared_state.read()
+    return snapshot.get("retention") if snapshot else None
+
+@app.get("/health/live")
+async def liveness_check():
+    """存活检查：进程能响应请求即可"""
+    return {"status": "ok"}
+
+def is_ready() -> bool:
+    """数据库已初始化；本进程运行采集器时还需完成登录和预热"""
+    return db_ready and (not data_collector.is_running or data_collector.ready)
+
+@app.get("/health/ready")
+async def readiness_check():
+    """就绪检查：未就绪时返回503"""
+    ready = is_ready()
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "starting",
+            "role": APP_ROLE,
+            "collector_running": data_collector.is_running,
+            "startup_ms": dict(startup_timings, collectorWarmup=data_collector.warmup_ms),
+        },
+        status_code=200 if ready else 503,
+    )
+
+# 静态文件服务（前端）
+# 支持本地开发和Docker环境
+frontend_dist = "client/dist" if os.path.exists("client/dist") else "../client/dist"
+
+def mount_spa(directory: str):
+    """注册前端SPA路由；catch-all 路由必须最后注册，否则会遮住 /health 等路由"""
+    spa_files = SPAStaticFiles(directory)
+    
+    @app.get("/{full_path:path}")
+    async def serve_spa(full_path: str, request: Request):
+        """服务前端SPA（内存索引，未知路径回退到index.html）"""
+        if full_path.startswith("api/"):
+            return Response(status_code=404)
+        entry = spa_files.lookup(full_path)
+        if entry is None:
+            return Response(status_code=404)
+        return spa_files.response(entry, request)
+
+if os.path.exists(frontend_dist):
+    logger.info(f"找到前端构建文件: {frontend_dist}")
+    mount_spa(frontend_dist)
+else:
+    logger.warning("未找到前端构建文件，只提供API服务")
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "3000"))
+    workers = int(os.getenv("API_WORKERS", "1"))
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=os.getenv("NODE_ENV") != "production"
+        workers=workers,
+        reload=os.getenv("NODE_ENV") != "production" and workers == 1
     )
@@ -1,16 +1,22 @@
 """
 数据库模型定义
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Float, Date, DateTime, Boolean, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # 数据库连接
 # 默认使用SQLite进行测试，生产环境可配置为MySQL
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/network_monitor.db")
 
+# SQLite使用增量自动清理：删除数据后的空闲页可以分批归还给文件系统
+SQLITE_INCREMENTAL_VACUUM = os.getenv("SQLITE_INCREMENTAL_VACUUM", "true").lower() == "true"
+
 engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=3600)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -28,7 +34,7 @@ class NetworkTraffic(Base):
     __tablename__ = "network_traffic"
     
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     upload_speed = Column(Float)
     download_speed = Column(Float)
     total_upload = Column(Float)
@@ -42,19 +48,41 @@ class OnlineDevice(Base):
     mac_address = Column(String(17), unique=True, index=True)
     ip_address = Column(String(15))
     hostname = Column(String(255))
+    hostname_lower = Column(String(255))  # 小写的主机名，供前缀搜索按索引范围查询
     device_type = Column(String(50))
+    vendor = Column(String(128))  # 按MAC前缀查询的厂商
     is_online = Column(Boolean, default=True)
     last_seen = Column(DateTime, default=datetime.utcnow)
     upload_speed = Column(Float, default=0)
     download_speed = Column(Float, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 设备列表按 (last_seen, id) 键集分页，过滤条件作为前缀列
+    __table_args__ = (
+        Index("ix_online_devices_last_seen_id", "last_seen", "id"),
+        Index("ix_online_devices_online_last_seen_id", "is_online", "last_seen", "id"),
+        Index("ix_online_devices_type_last_seen_id", "device_type", "last_seen", "id"),
+        Index("ix_online_devices_hostname_lower", "hostname_lower"),
+    )
+
+class DevicePresence(Base):
+    __tablename__ = "device_presence"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    mac_address = Column(String(17), index=True)
+    online_from = Column(DateTime, default=datetime.utcnow)
+    online_until = Column(DateTime, nullable=True)  # 为空表示仍在线
+    
+    __table_args__ = (
+        Index("ix_device_presence_mac_from", "mac_address", "online_from"),
+    )
 
 class NetworkLatency(Base):
     __tablename__ = "network_latency"
     
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     target = Column(String(255))
     latency = Column(Float)
     packet_loss = Column(Float, default=0)
@@ -64,7 +92,7 @@ class RouterStatus(Base):
     __tablename__ = "router_status"
     
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     cpu_usage = Column(Float)
     memory_usage = Column(Float)
     temperature = Column(Float)
@@ -76,23 +104,213 @@ class BandwidthUsage(Base):
     __tablename__ = "bandwidth_usage"
     
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     device_mac = Column(String(17))
     upload_bytes = Column(Float)
     download_bytes = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class WifiStationStats(Base):
+    """无线终端统计：计数类字段为与上一行之间的增量"""
+    __tablename__ = "wifi_station_stats"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    device_mac = Column(String(17))
+    interface = Column(String(16))
+    signal = Column(Float)  # dBm
+    tx_bitrate = Column(Float)  # MBit/s
+    rx_bitrate = Column(Float)
+    rx_bytes = Column(Float)
+    tx_bytes = Column(Float)
+    tx_packets = Column(Float)
+    tx_retries = Column(Float)
+    airtime = Column(Float)  # 毫秒
+    
+    __table_args__ = (
+        Index("ix_wifi_station_stats_mac_timestamp", "device_mac", "timestamp"),
+    )
+
+class UsageDaily(Base):
+    __tablename__ = "usage_daily"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(Date)  # 本地日期
+    kind = Column(String(20))  # interface / device
+    name = Column(String(64))  # 接口名或设备MAC
+    rx_bytes = Column(Float, default=0)
+    tx_bytes = Column(Float, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_usage_daily_period_kind_name", "period", "kind", "name", unique=True),
+    )
+
+class UsageMonthly(Base):
+    __tablename__ = "usage_monthly"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(Date)  # 本地月份的第一天
+    kind = Column(String(20))
+    name = Column(String(64))
+    rx_bytes = Column(Float, default=0)
+    tx_bytes = Column(Float, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_usage_monthly_period_kind_name", "period", "kind", "name", unique=True),
+    )
+
+class UsageCounter(Base):
+    """字节计数器的拼接状态：路由器计数器最后读数和跨重启累计值"""
+    __tablename__ = "usage_counters"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20))
+    name = Column(String(64))
+    last_rx = Column(Float, default=0)
+    last_tx = Column(Float, default=0)
+    total_rx = Column(Float, default=0)
+    total_tx = Column(Float, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_usage_counters_kind_name", "kind", "name", unique=True),
+    )
+
+class HeatmapCell(Base):
+    """按周×小时（本地时间）累计的指标：每周168个格子，每格保存和、样本数和峰值"""
+    __tablename__ = "heatmap_cells"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    metric = Column(String(100))  # 表名.字段，如 network_latency.latency
+    target = Column(String(255))  # ping目标或设备MAC，无维度时为空字符串
+    week = Column(Date)  # 本地周一
+    cell = Column(Integer)  # 星期几 * 24 + 小时，周一0点为0
+    total = Column(Float, default=0)
+    count = Column(Integer, default=0)
+    peak = Column(Float)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_heatmap_cells_metric_target_week_cell", "metric", "target", "week", "cell", unique=True),
+    )
+
 class ConnectionQuality(Base):
     __tablename__ = "connection_quality"
     
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     signal_strength = Column(Float)
     stability = Column(Float)
     error_rate = Column(Float)
     retransmit_rate = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class AnomalyEvent(Base):
+    __tablename__ = "anomaly_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    metric = Column(String(100), index=True)
+    target = Column(String(255))
+    value = Column(Float, nullable=True)
+    expected = Column(Float, nullable=True)
+    score = Column(Float, nullable=True)
+    kind = Column(String(20))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 # 创建所有表
 def init_db():
+    _ensure_auto_vacuum()
     Base.metadata.create_all(bind=engine)
+    _ensure_columns()
+    _ensure_indexes()
+    _backfill_hostname_lower()
+
+def _ensure_auto_vacuum(bind=None):
+    """
+    SQLite 使用 auto_vacuum=INCREMENTAL（之后由清理任务执行 incremental_vacuum）。
+    模式写在文件头中：新建的空库在建表前直接设置即可；已有的库需要 VACUUM 重写整个文件，
+    启动时不做转换，只提示手动执行 python -m models.database --enable-incremental-vacuum
+    """
+    bind = bind or engine
+    if bind.dialect.name != "sqlite" or not SQLITE_INCREMENTAL_VACUUM:
+        return
+    with bind.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            return
+        if conn.exec_driver_sql("PRAGMA page_count").scalar():
+            logger.info("SQLite数据库未启用增量自动清理，删除数据后文件不会缩小；"
+                        "停止服务后执行 python -m models.database --enable-incremental-vacuum 转换")
+            return
+        # 空库的 VACUUM 只写入文件头，立即完成
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+def enable_incremental_vacuum(bind=None):
+    """
+    一次性迁移：把已有的 SQLite 库切换为 auto_vacuum=INCREMENTAL。
+    VACUUM 期间持有排他锁，并需要约等于数据库大小的临时磁盘空间，应在停止服务后执行。
+    返回 (转换前字节数, 转换后字节数)，已是增量模式时返回 None
+    """
+    bind = bind or engine
+    if bind.dialect.name != "sqlite":
+        raise ValueError("只有SQLite数据库需要转换")
+    with bind.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            logger.info("SQLite数据库已是增量自动清理模式，无需转换")
+            return None
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        before = conn.exec_driver_sql("PRAGMA page_count").scalar() * page_size
+        logger.info(f"开始转换为增量自动清理：VACUUM重写数据库文件（{before / 1048576:.1f}MB，"
+                    f"需要约同样大小的临时空间）...")
+        started = datetime.now()
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        after = conn.exec_driver_sql("PRAGMA page_count").scalar() * page_size
+        mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+    if mode != 2:
+        raise RuntimeError(f"转换失败，auto_vacuum={mode}")
+    seconds = (datetime.now() - started).total_seconds()
+    logger.info(f"转换完成：{before / 1048576:.1f}MB -> {after / 1048576:.1f}MB，耗时{seconds:.1f}秒")
+    return before, after
+
+def _ensure_columns():
+    """为已存在的表补建新增的可空列（create_all 不修改已有的表）"""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+def _backfill_hostname_lower():
+    """为新增 hostname_lower 列之前的设备补全小写主机名（之后由采集器写入）"""
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            "SELECT id, hostname FROM online_devices WHERE hostname_lower IS NULL AND hostname IS NOT NULL"
+        )).all()
+        for device_id, hostname in rows:
+            conn.execute(
+                text("UPDATE online_devices SET hostname_lower = :value WHERE id = :id"),
+                {"value": hostname.lower(), "id": device_id}
+            )
+
+def _ensure_indexes():
+    """为已存在的表补建新增的索引（create_all 只在建表时创建索引）"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if sys.argv[1:] != ["--enable-incremental-vacuum"]:
+        print("用法: python -m models.database --enable-incremental-vacuum")
+        sys.exit(1)
+    enable_incremental_vacuum()
@@ -0,0 +1,118 @@
+"""
+贾维斯智能监控系统 - 回放录制的路由器响应
+在现场录制（CAPTURE_FILE=./data/router.jrc python main.py）后离线复现采集负载：
+    python replay.py ./data/router.jrc --speed 100
+--speed 为相对录制时间的加速倍数，0 表示不等待、尽可能快地回放（用于基准测试）；
+回放写入独立的数据库、归档目录和写入缓冲文件，结束时输出各任务的调用次数和耗时
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 回放中按录制时间轴定时执行的任务（不发起RPC请求，录制文件中没有它们的调用）
+TIMED_JOBS = ("cleanup_old_data",)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="回放录制的路由器RPC响应")
+    parser.add_argument("capture", help="录制文件路径")
+    parser.add_argument("--speed", type=float, default=1.0, help="加速倍数，0为不等待（默认1，即实时）")
+    parser.add_argument("--database", default="sqlite:///./data/replay.db", help="回放使用的数据库")
+    parser.add_argument("--archive-dir", default="./data/replay_archive", help="回放使用的归档目录")
+    parser.add_argument("--spool", default="./data/replay.spool", help="回放使用的写入缓冲文件")
+    return parser.parse_args()
+
+
+async def replay(path: str, speed: float):
+    from models.database import init_db
+    from services.data_collector import DataCollector, COLLECTION_JOBS
+    from utils.capture import ReplayTransport, read_capture, group_invocations
+    from utils.clock import clock
+    from utils.istoreos_client import IStoreOSClient
+
+    init_db()
+    invocations = group_invocations(read_capture(path))
+    if not invocations:
+        logger.warning("录制文件中没有采集任务调用")
+        return
+
+    transport = ReplayTransport(clock)
+    collector = DataCollector()
+    collector.istoreos_client = IStoreOSClient(transport=transport)
+    collector.alert_engine.start()
+    collector.storage.start()
+    known_jobs = {name for name, _ in COLLECTION_JOBS} | {"prime_router"}
+    intervals = dict(COLLECTION_JOBS)
+
+    first = invocations[0][0]
+    timed = {name: first + intervals[name] for name in TIMED_JOBS}
+    calls = defaultdict(int)
+    durations = defaultdict(float)
+    previous = first
+    started = time.perf_counter()
+
+    for job_started, job, records in invocations:
+        if job not in known_jobs:
+            continue
+        if speed > 0 and job_started > previous:
+            await asyncio.sleep((job_started - previous) / speed)
+        previous = max(previous, job_started)
+
+        for name, due in timed.items():
+            if due <= job_started:
+                clock.set(due)
+                await collector.run_job(name)
+                timed[name] = due + intervals[name]
+
+        transport.load(records)
+        clock.set(job_started)
+        job_begin = time.perf_counter()
+        await collector.run_job(job)
+        durations[job] += time.perf_counter() - job_begin
+        calls[job] += 1
+
+    await collector._flush_compressed()
+    await collector.storage.stop()
+    await collector.alert_engine.stop()
+    await collector.istoreos_client.close()
+    clock.set(None)
+
+    elapsed = time.perf_counter() - started
+    span = previous - first
+    logger.info(f"回放完成: 录制时长 {span:.0f}s，回放耗时 {elapsed:.1f}s（{span / elapsed if elapsed else 0:.0f}倍速）")
+    logger.info(f"响应命中 {transport.served} 次，未匹配 {transport.misses} 次")
+    logger.info(f"写入队列: {collector.storage.stats()}")
+    for job in sorted(calls):
+        logger.info(
+            f"  {job}: {calls[job]} 次，共 {durations[job] * 1000:.0f}ms，"
+            f"平均 {durations[job] * 1000 / calls[job]:.2f}ms"
+        )
+
+
+def main():
+    args = parse_args()
+    # 数据库和归档目录在导入模块时读取，必须先设置
+    os.environ["DATABASE_URL"] = args.database
+    os.environ["ARCHIVE_DIR"] = args.archive_dir
+    os.environ["SPOOL_FILE"] = args.spool
+    os.makedirs("./data", exist_ok=True)
+    asyncio.run(replay(args.capture, args.speed))
+
+
+if __name__ == "__main__":
+    main()
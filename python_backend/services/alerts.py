@@ -0,0 +1,286 @@
+"""
+告警规则引擎
+声明式规则在启动时编译为按指标索引的求值器，采集器对每个样本在内存中求值；
+支持持续时间窗口、滑动窗口聚合、迟滞和去重，触发/恢复事件通过有界异步队列
+发送到可插拔的输出（日志、Webhook、推送通道），队列满时丢弃而不阻塞采集
+
+规则示例（ALERT_RULES_FILE 指向的JSON数组）:
+    {"name": "high_temperature", "metric": "router_status.temperature",
+     "op": ">", "threshold": 75, "clear": 70, "for": 120}
+    {"name": "packet_loss", "metric": "network_latency.packet_loss", "target": "*",
+     "op": ">", "threshold": 5, "clear": 1, "window": 60, "agg": "avg"}
+    {"name": "unknown_device", "metric": "online_devices.new", "type": "event"}
+"""
+import asyncio
+import fnmatch
+import json
+import logging
+import operator
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE", "")
+ALERT_SINKS = os.getenv("ALERT_SINKS", "log,push")
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL", "")
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "1000"))
+
+DEFAULT_ALERT_RULES = [
+    {"name": "high_temperature", "metric": "router_status.temperature",
+     "op": ">", "threshold": 75, "clear": 70, "for": 120},
+    {"name": "high_cpu", "metric": "router_status.cpu_usage",
+     "op": ">", "threshold": 90, "clear": 80, "for": 300},
+    {"name": "packet_loss", "metric": "network_latency.packet_loss", "target": "*",
+     "op": ">", "threshold": 5, "clear": 1, "window": 60, "agg": "avg"},
+    {"name": "unknown_device", "metric": "online_devices.new", "type": "event"},
+]
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+AGGREGATES = {
+    "avg": lambda values: sum(values) / len(values),
+    "max": max,
+    "min": min,
+}
+
+
+def load_rules() -> List[Dict]:
+    if ALERT_RULES_FILE and os.path.exists(ALERT_RULES_FILE):
+        with open(ALERT_RULES_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_ALERT_RULES
+
+
+class RuleState:
+    """规则在单个目标上的状态"""
+
+    __slots__ = ("pending_since", "firing", "window")
+
+    def __init__(self):
+        self.pending_since: Optional[float] = None
+        self.firing = False
+        self.window = deque()  # (ts, value)
+
+
+class CompiledRule:
+    """编译后的阈值规则"""
+
+    def __init__(self, spec: Dict):
+        self.name = spec["name"]
+        self.metric = spec["metric"]
+        self.target = spec.get("target", "*")
+        self.kind = spec.get("type", "threshold")
+        self.severity = spec.get("severity", "warning")
+        self.op = OPERATORS[spec.get("op", ">")]
+        self.threshold = float(spec.get("threshold", 0))
+        # 迟滞：恢复阈值默认等于触发阈值
+        self.clear = float(spec.get("clear", self.threshold))
+        self.duration = float(spec.get("for", 0))
+        self.window = float(spec.get("window", 0))
+        self.aggregate = AGGREGATES[spec.get("agg", "avg")]
+        self.states: Dict[str, RuleState] = {}
+
+    def matches(self, target: str) -> bool:
+        return self.target == "*" or fnmatch.fnmatchcase(target, self.target)
+
+    def _value(self, state: RuleState, value: float, ts: float) -> float:
+        if not self.window:
+            return value
+        state.window.append((ts, value))
+        while state.window and state.window[0][0] <= ts - self.window:
+            state.window.popleft()
+        return self.aggregate([v for _, v in state.window])
+
+    def evaluate(self, target: str, value: float, ts: float) -> Optional[str]:
+        """返回 "firing" / "resolved" 状态转换，无变化返回None"""
+        state = self.states.get(target)
+        if state is None:
+            state = self.states[target] = RuleState()
+        current = self._value(state, value, ts)
+
+        if not state.firing:
+            if self.op(current, self.threshold):
+                if state.pending_since is None:
+                    state.pending_since = ts
+                if ts - state.pending_since >= self.duration:
+                    state.firing = True
+                    return "firing"
+            else:
+                state.pending_since = None
+            return None
+
+        if not self.op(current, self.clear):
+            state.firing = False
+            state.pending_since = None
+            return "resolved"
+        return None
+
+
+class LogSink:
+    name = "log"
+
+    async def send(self, alert: Dict):
+        logger.warning(f"[告警] {alert['rule']} {alert['status']}: {alert['metric']}[{alert['target']}] = {alert['value']}")
+
+    async def close(self):
+        pass
+
+
+class WebhookSink:
+    name = "webhook"
+
+    def __init__(self, url: str):
+        self.url = url
+        # 第一次发送时创建，关闭后再次发送时重新创建（采集器可能停止后再启动）
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def send(self, alert: Dict):
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=5.0)
+        await self.client.post(self.url, json=alert)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+class PushSink:
+    """推送通道：向所有订阅者（如SSE连接）广播，订阅者队列满时丢弃"""
+    name = "push"
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.subscribers: List[asyncio.Queue] = []
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+
+    async def send(self, alert: Dict):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(alert)
+            except asyncio.QueueFull:
+                pass
+
+    async def close(self):
+        pass
+
+
+def build_sinks() -> List:
+    sinks = []
+    for name in [item.strip() for item in ALERT_SINKS.split(",") if item.strip()]:
+        if name == "log":
+            sinks.append(LogSink())
+        elif name == "push":
+            sinks.append(PushSink())
+        elif name == "webhook" and ALERT_WEBHOOK_URL:
+            sinks.append(WebhookSink(ALERT_WEBHOOK_URL))
+    return sinks
+
+
+class AlertEngine:
+    """规则求值 + 有界分发队列"""
+
+    def __init__(self, rules: Optional[List[Dict]] = None, sinks: Optional[List] = None,
+                 queue_size: int = ALERT_QUEUE_SIZE):
+        self.rules: Dict[str, List[CompiledRule]] = {}
+        for spec in (rules if rules is not None else load_rules()):
+            rule = CompiledRule(spec)
+            self.rules.setdefault(rule.metric, []).append(rule)
+        self.sinks = sinks if sinks is not None else build_sinks()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.recent = deque(maxlen=200)
+        self.active: Dict[tuple, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def sink(self, name: str):
+        return next((sink for sink in self.sinks if sink.name == name), None)
+
+    def observe(self, metric: str, target: str, value: float, ts: float):
+        """对单个数值求值（无规则的指标只有一次字典查找）"""
+        rules = self.rules.get(metric)
+        if not rules:
+            return
+        for rule in rules:
+            if rule.kind != "threshold" or not rule.matches(target):
+                continue
+            transition = rule.evaluate(target, value, ts)
+            if transition:
+                self._emit(rule, transition, metric, target, value, ts)
+
+    def observe_sample(self, table: str, data: Dict, ts: float, target: str = ""):
+        for field, value in data.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.observe(f"{table}.{field}", target, float(value), ts)
+
+    def observe_event(self, metric: str, target: str, ts: float, details: Optional[Dict] = None):
+        """事件类规则（如发现新设备）：每次事件触发一次"""
+        for rule in self.rules.get(metric, ()):
+            if rule.kind == "event" and rule.matches(target):
+                self._emit(rule, "firing", metric, target, None, ts, details)
+
+    def _emit(self, rule: CompiledRule, status: str, metric: str, target: str,
+              value: Optional[float], ts: float, details: Optional[Dict] = None):
+        alert = {
+            "rule": rule.name,
+            "severity": rule.severity,
+            "status": status,
+            "metric": metric,
+            "target": target,
+            "value": value,
+            "threshold": rule.threshold if rule.kind == "threshold" else None,
+            "timestamp": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+        }
+        if details:
+            alert["details"] = details
+        key = (rule.name, target)
+        if rule.kind == "threshold":
+            if status == "firing":
+                self.active[key] = alert
+            else:
+                self.active.pop(key, None)
+        self.recent.append(alert)
+        try:
+            self.queue.put_nowait(alert)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _dispatch(self):
+        while True:
+            alert = await self.queue.get()
+            for sink in self.sinks:
+                try:
+                    await sink.send(alert)
+                except Exception as e:
+                    logger.error(f"告警发送失败 ({sink.name}): {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for sink in self.sinks:
+            await sink.close()
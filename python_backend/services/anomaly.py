@@ -0,0 +1,164 @@
+"""
+流式异常检测
+每个 指标/目标 维护常数大小的状态：EWMA 均值/方差 + 168 个“周内小时”季节基线，
+样本到达时立即打分，不读取数据库；只有检测到异常时才写入事件。
+季节基线按本地时间划分小时（与热力图一致），每个小时结束时用该小时的均值更新一次，
+即每个格子每周更新一次，平滑系数作用在周与周之间
+"""
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+from services.usage import USAGE_UTC_OFFSET_HOURS
+
+# 判定为异常的分数阈值（标准差倍数）
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "4"))
+# 同一指标/目标两次事件的最小间隔（秒）
+ANOMALY_COOLDOWN = float(os.getenv("ANOMALY_COOLDOWN", "300"))
+
+HOURS_PER_WEEK = 168
+# 1970-01-01 是星期四，本地小时序号加上该偏移后对168取模即为周内小时（周一0点为0）
+EPOCH_HOUR_OF_WEEK = 3 * 24
+
+
+class Ewma:
+    """指数加权均值/方差"""
+
+    __slots__ = ("mean", "var", "count")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+
+    def std(self, floor: float) -> float:
+        return max(math.sqrt(self.var), abs(self.mean) * 0.05, floor)
+
+    def update(self, value: float, alpha: float):
+        if self.count == 0:
+            self.mean = value
+        else:
+            delta = value - self.mean
+            self.mean += alpha * delta
+            self.var = (1 - alpha) * (self.var + alpha * delta * delta)
+        self.count += 1
+
+
+class SeriesState:
+    """单个序列的检测状态"""
+
+    __slots__ = ("short", "seasonal", "hour", "hour_total", "hour_count", "last_event")
+
+    def __init__(self):
+        self.short = Ewma()
+        self.seasonal: List[Optional[Ewma]] = [None] * HOURS_PER_WEEK
+        # 当前小时（本地小时序号）的累计，小时结束时并入季节基线
+        self.hour: Optional[int] = None
+        self.hour_total = 0.0
+        self.hour_count = 0
+        self.last_event = 0.0
+
+
+def local_hour(ts: float, offset_hours: float = USAGE_UTC_OFFSET_HOURS) -> int:
+    """epoch秒 -> 本地时间的小时序号"""
+    return int((ts + offset_hours * 3600) // 3600)
+
+
+def hour_of_week(ts: float, offset_hours: float = USAGE_UTC_OFFSET_HOURS) -> int:
+    """本地时间的周内小时，周一0点为0（与热力图的格子序号相同）"""
+    return (local_hour(ts, offset_hours) + EPOCH_HOUR_OF_WEEK) % HOURS_PER_WEEK
+
+
+class AnomalyDetector:
+    """
+    对每个样本打分：季节基线积累 seasonal_warmup 周后用它作为期望值，否则使用短期EWMA；
+    季节基线的方差是各周小时均值之间的差异，打分时加上短期EWMA的方差（小时内样本的波动）。
+    异常样本在更新基线时被截断，避免把异常本身学进基线（季节基线成熟前只截断短期EWMA）
+    """
+
+    def __init__(self, alpha: float = 0.05, seasonal_alpha: float = 0.3, threshold: float = ANOMALY_THRESHOLD,
+                 warmup: int = 30, seasonal_warmup: int = 2, cooldown: float = ANOMALY_COOLDOWN,
+                 min_std: Optional[Dict[str, float]] = None):
+        self.alpha = alpha
+        self.seasonal_alpha = seasonal_alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.seasonal_warmup = seasonal_warmup
+        self.cooldown = cooldown
+        self.min_std = min_std or {}
+        self.series: Dict[Tuple[str, str], SeriesState] = {}
+        self.states: Dict[Tuple[str, str], str] = {}
+
+    def observe(self, metric: str, target: str, value: float, ts: float) -> Optional[Dict]:
+        """提交一个样本，返回异常事件或None"""
+        key = (metric, target)
+        state = self.series.get(key)
+        if state is None:
+            state = self.series[key] = SeriesState()
+
+        floor = self.min_std.get(metric, 1e-6)
+        hour = local_hour(ts)
+        if hour != state.hour:
+            self._close_hour(state)
+            state.hour = hour
+        seasonal = state.seasonal[hour_of_week(ts)]
+
+        expected = std = None
+        seasonal_ready = seasonal is not None and seasonal.count >= self.seasonal_warmup
+        if seasonal_ready and state.short.count >= self.warmup:
+            expected = seasonal.mean
+            std = max(math.sqrt(seasonal.var + state.short.var), abs(expected) * 0.05, floor)
+        elif state.short.count >= self.warmup:
+            expected = state.short.mean
+            std = state.short.std(floor)
+
+        event = None
+        update_value = value
+        if expected is not None:
+            score = (value - expected) / std
+            if abs(score) >= self.threshold:
+                # 截断后再更新基线
+                update_value = expected + math.copysign(self.threshold * std, score)
+                if ts - state.last_event >= self.cooldown:
+                    state.last_event = ts
+                    event = {
+                        "metric": metric,
+                        "target": target,
+                        "value": value,
+                        "expected": expected,
+                        "score": score,
+                        "kind": "spike" if score > 0 else "drop",
+                    }
+
+        state.short.update(update_value, self.alpha)
+        # 按短期EWMA截断的值会压平每天重复出现的变化，季节基线成熟前用原始值
+        state.hour_total += update_value if seasonal_ready else value
+        state.hour_count += 1
+        return event
+
+    def _close_hour(self, state: SeriesState):
+        """把上一个小时的均值并入对应格子的季节基线"""
+        if state.hour_count:
+            slot = (state.hour + EPOCH_HOUR_OF_WEEK) % HOURS_PER_WEEK
+            seasonal = state.seasonal[slot]
+            if seasonal is None:
+                seasonal = state.seasonal[slot] = Ewma()
+            seasonal.update(state.hour_total / state.hour_count, self.seasonal_alpha)
+        state.hour_total = 0.0
+        state.hour_count = 0
+
+    def observe_state(self, metric: str, target: str, value: str, normal: str) -> Optional[Dict]:
+        """状态类指标（如WAN状态）：离开/回到正常值时各产生一次事件"""
+        key = (metric, target)
+        previous = self.states.get(key, normal)
+        self.states[key] = value
+        if value == previous:
+            return None
+        return {
+            "metric": metric,
+            "target": target,
+            "value": None,
+            "expected": None,
+            "score": None,
+            "kind": "recovered" if value == normal else "down",
+        }
@@ -0,0 +1,256 @@
+"""
+过期数据的压缩列式归档
+超过保留期的数据在删除前按 表/天 写入压缩列式文件，
+历史查询和导出接口可透明读取归档范围。
+归档与删除分开进行（分批删除可能未完成，也可能按分区删除），数据库中可能还留有已归档的行；
+读取时以最后一个归档日的次日零点为界，之前读归档，之后读数据库，两边不重叠
+
+文件格式（每表每天一个 .jca 文件）:
+    b"JVCA" + 版本号(1字节) + 头部长度(uint32) + 头部JSON + 各列 zlib 压缩数据
+列编码:
+    t  时间戳，int64 微秒，差分编码
+    d  数值，float64，NULL 记为 NaN
+    s  字符串，JSON 列表
+"""
+import json
+import logging
+import math
+import os
+import struct
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, Float, Integer, func
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./data/archive")
+
+MAGIC = b"JVCA"
+VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+
+
+def column_codec(column) -> str:
+    """根据SQLAlchemy列类型选择编码"""
+    if isinstance(column.type, DateTime):
+        return "t"
+    if isinstance(column.type, (Float, Integer)):
+        return "d"
+    return "s"
+
+
+def archive_columns(model) -> List[Tuple[str, str]]:
+    """归档的列（不含 id / created_at），timestamp 固定在第一列"""
+    columns = [
+        (c.name, column_codec(c))
+        for c in model.__table__.columns
+        if c.name not in ("id", "created_at", "timestamp")
+    ]
+    return [("timestamp", "t")] + columns
+
+
+def _encode_column(codec: str, values: Sequence) -> bytes:
+    if codec == "t":
+        micros = array('q')
+        previous = 0
+        for value in values:
+            current = (value - EPOCH) // timedelta(microseconds=1)
+            micros.append(current - previous)
+            previous = current
+        raw = micros.tobytes()
+    elif codec == "d":
+        raw = array('d', (float('nan') if v is None else float(v) for v in values)).tobytes()
+    else:
+        raw = json.dumps(list(values), ensure_ascii=False).encode("utf-8")
+    return zlib.compress(raw, 9)
+
+
+def _decode_column(codec: str, data: bytes) -> list:
+    raw = zlib.decompress(data)
+    if codec == "t":
+        deltas = array('q')
+        deltas.frombytes(raw)
+        values = []
+        current = 0
+        for delta in deltas:
+            current += delta
+            values.append(EPOCH + timedelta(microseconds=current))
+        return values
+    if codec == "d":
+        numbers = array('d')
+        numbers.frombytes(raw)
+        return [None if math.isnan(v) else v for v in numbers]
+    return json.loads(raw.decode("utf-8"))
+
+
+class ColumnarArchive:
+    """按 表/天 组织的归档文件读写"""
+
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+
+    def path(self, table: str, day: datetime) -> str:
+        return os.path.join(self.root, table, f"{day:%Y-%m-%d}.jca")
+
+    def write_day(self, table: str, day: datetime, columns: Sequence[Tuple[str, str]], rows: List[tuple]) -> str:
+        """写入一天的数据；文件已存在时合并去重（用于崩溃后重跑）"""
+        path = self.path(table, day)
+        if os.path.exists(path):
+            _, existing = self.read_file(path)
+            rows = sorted(set(existing) | set(rows), key=lambda row: row[0])
+
+        blobs = []
+        header_columns = []
+        for index, (name, codec) in enumerate(columns):
+            blob = _encode_column(codec, [row[index] for row in rows])
+            blobs.append(blob)
+            header_columns.append({"name": name, "codec": codec, "size": len(blob)})
+        header = json.dumps({
+            "table": table,
+            "day": f"{day:%Y-%m-%d}",
+            "rows": len(rows),
+            "columns": header_columns,
+        }).encode("utf-8")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC + bytes([VERSION]) + struct.pack("<I", len(header)) + header)
+            for blob in blobs:
+                f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return path
+
+    def archived_through(self, table: str) -> Optional[datetime]:
+        """
+        归档覆盖到的时间：最后一个归档日的次日零点，没有归档时为None；
+        归档可能由另一个进程（独立采集器）写入，每次扫描目录（每表每天一个文件）
+        """
+        try:
+            names = os.listdir(os.path.join(self.root, table))
+        except FileNotFoundError:
+            return None
+        days = [name[:-4] for name in names if name.endswith(".jca")]
+        if not days:
+            return None
+        return datetime.strptime(max(days), "%Y-%m-%d") + timedelta(days=1)
+
+    def split_point(self, table: str, start: datetime, end: datetime) -> datetime:
+        """把 [start, end) 分为 [start, 分界) 读归档、[分界, end) 读数据库"""
+        through = self.archived_through(table)
+        if through is None:
+            return start
+        return min(max(start, through), end)
+
+    @staticmethod
+    def _read_header(f, path: str) -> dict:
+        if f.read(4) != MAGIC or f.read(1)[0] != VERSION:
+            raise ValueError(f"无效的归档文件: {path}")
+        header_length = struct.unpack("<I", f.read(4))[0]
+        return json.loads(f.read(header_length).decode("utf-8"))
+
+    def archived_rows(self, table: str, day: datetime) -> int:
+        """归档文件中某天的行数（只读头部），没有文件或文件损坏时为0"""
+        path = self.path(table, day)
+        try:
+            with open(path, "rb") as f:
+                return self._read_header(f, path)["rows"]
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.error(f"读取归档文件头失败 {path}: {e}")
+            return 0
+
+    def read_file(self, path: str, names: Optional[Sequence[str]] = None) -> Tuple[List[str], List[tuple]]:
+        """读取归档文件，只解压需要的列"""
+        with open(path, "rb") as f:
+            header = self._read_header(f, path)
+            wanted = set(names) if names else None
+            decoded = {}
+            for column in header["columns"]:
+                data = f.read(column["size"])
+                if wanted is None or column["name"] in wanted:
+                    decoded[column["name"]] = _decode_column(column["codec"], data)
+
+        order = list(names) if names else [c["name"] for c in header["columns"]]
+        missing = [name for name in order if name not in decoded]
+        for name in missing:
+            decoded[name] = [None] * header["rows"]
+        return order, list(zip(*(decoded[name] for name in order)))
+
+    def iter_chunks(self, table: str, names: Sequence[str], start: datetime, end: datetime,
+                    filters: Optional[Dict[str, str]] = None) -> Iterator[List[tuple]]:
+        """按天读取 [start, end) 内的归档行，每个文件作为一块"""
+        filters = filters or {}
+        read_names = ["timestamp"] + [name for name in list(names) + list(filters) if name != "timestamp"]
+        read_names = list(dict.fromkeys(read_names))
+        projection = [read_names.index(name) for name in names]
+        conditions = [(read_names.index(name), value) for name, value in filters.items()]
+        day = datetime(start.year, start.month, start.day)
+        while day < end:
+            path = self.path(table, day)
+            if os.path.exists(path):
+                try:
+                    _, rows = self.read_file(path, read_names)
+                except Exception as e:
+                    logger.error(f"读取归档文件失败 {path}: {e}")
+                    rows = []
+                chunk = [
+                    tuple(row[i] for i in projection)
+                    for row in rows
+                    if start <= row[0] < end and all(row[i] == value for i, value in conditions)
+                ]
+                if chunk:
+                    yield chunk
+            day += timedelta(days=1)
+
+    def archive_table(self, db, model, cutoff: datetime, delete: bool = True) -> int:
+        """
+        将早于 cutoff（须为零点）的完整天数据写入归档并从数据库删除
+        每天一个事务：先落盘再删除；delete=False 时只写归档（由调用方删除过期分区或分批删除）。
+        归档文件的行数不少于数据库中当天的行数时跳过该天：已归档的天在删除完成前每次清理都会遇到，
+        只做一次按索引的计数，不重新读取和重写（分批删除可能已删掉当天的一部分行）
+        """
+        table = model.__tablename__
+        columns = archive_columns(model)
+        oldest = db.query(model.timestamp).filter(model.timestamp < cutoff).order_by(model.timestamp).first()
+        if oldest is None:
+            return 0
+
+        archived = 0
+        day = datetime(oldest[0].year, oldest[0].month, oldest[0].day)
+        while day < cutoff:
+            next_day = day + timedelta(days=1)
+            count = db.query(func.count(model.id)).filter(
+                model.timestamp >= day,
+                model.timestamp < next_day
+            ).scalar()
+            if count == 0 or count <= self.archived_rows(table, day):
+                day = next_day
+                continue
+            rows = db.query(*[getattr(model, name) for name, _ in columns]).filter(
+                model.timestamp >= day,
+                model.timestamp < next_day
+            ).order_by(model.timestamp).all()
+            if rows:
+                self.write_day(table, day, columns, [tuple(row) for row in rows])
+                if delete:
+                    db.query(model).filter(
+                        model.timestamp >= day,
+                        model.timestamp < next_day
+                    ).delete(synchronize_session=False)
+                    db.commit()
+                archived += len(rows)
+                logger.info(f"已归档 {table} {day:%Y-%m-%d}: {len(rows)}行")
+            day = next_day
+        return archived
+
+
+# 全局归档实例
+archive = ColumnarArchive()
@@ -0,0 +1,129 @@
+"""
+历史查询的时间桶缓存
+时间桶按宽度对齐到epoch（桶序号 = 时间戳 // 宽度），已经关闭的桶的聚合结果不会再变化，
+以 (指标, 路由器, 宽度, 桶序号) 为键缓存；每次请求只重新计算尚未关闭的边缘桶。
+队列积压或缓冲文件回放的行可能在桶关闭后才写入：空桶不缓存，缓存项超过
+HISTORY_CACHE_TTL 后重新计算，回放缓冲文件后清空缓存。
+LRU淘汰，按估算的内存占用设置上限
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 缓存内存上限（MB）
+HISTORY_CACHE_MB = float(os.getenv("HISTORY_CACHE_MB", "8"))
+# 缓存项的有效期（秒）
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "600"))
+
+# 单个缓存项的估算内存：键和容器开销 + 每个数值列
+ENTRY_BYTES = 200
+VALUE_BYTES = 100
+
+Row = Optional[Dict[str, float]]
+
+
+class BucketCache:
+    """已关闭的非空时间桶的LRU缓存，缓存项有有效期"""
+
+    def __init__(self, max_bytes: int = int(HISTORY_CACHE_MB * 1024 * 1024), ttl: float = HISTORY_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # 键 -> (聚合值, 过期时间)
+        self.entries: "OrderedDict[tuple, Tuple[Dict[str, float], float]]" = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(row: Dict[str, float]) -> int:
+        return ENTRY_BYTES + VALUE_BYTES * len(row)
+
+    def _put(self, key: tuple, row: Dict[str, float], now: float):
+        if key in self.entries:
+            return
+        self.entries[key] = (row, now + self.ttl)
+        self.nbytes += self._size(row)
+        while self.nbytes > self.max_bytes and self.entries:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.nbytes -= self._size(evicted)
+            self.evictions += 1
+
+    def _get(self, key: tuple, now: float) -> Row:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        row, expires = entry
+        if expires <= now:
+            del self.entries[key]
+            self.nbytes -= self._size(row)
+            return None
+        self.entries.move_to_end(key)
+        return row
+
+    def assemble(
+        self,
+        series: tuple,
+        width: float,
+        first: int,
+        count: int,
+        closed_before: float,
+        compute: Callable[[float, int], List[Tuple[float, Dict[str, float]]]],
+    ) -> List[Tuple[float, Dict[str, float]]]:
+        """
+        返回桶序号 [first, first + count) 中非空桶的 (桶起始时间, 聚合值)
+        缓存未命中的连续桶段调用 compute(段起始时间, 桶数) 计算（返回值格式同 bucket_series），
+        结束时间不晚于 closed_before 的非空桶写入缓存
+        """
+        now = time.monotonic()
+        rows: List[Row] = [None] * count
+        missing = []
+        for offset in range(count):
+            row = self._get(series + (width, first + offset), now)
+            if row is not None:
+                rows[offset] = row
+                self.hits += 1
+            else:
+                missing.append(offset)
+        self.misses += len(missing)
+
+        for run_start, run_end in _runs(missing):
+            start = (first + run_start) * width
+            for ts, row in compute(start, run_end - run_start):
+                offset = run_start + int(round((ts - start) / width))
+                if run_start <= offset < run_end:
+                    rows[offset] = row
+            for offset in range(run_start, run_end):
+                index = first + offset
+                if rows[offset] is not None and (index + 1) * width <= closed_before:
+                    self._put(series + (width, index), rows[offset], now)
+
+        return [((first + offset) * width, row) for offset, row in enumerate(rows) if row is not None]
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def _runs(offsets: List[int]) -> List[Tuple[int, int]]:
+    """有序序号 -> 连续段 [(起, 止)]"""
+    runs = []
+    for offset in offsets:
+        if runs and runs[-1][1] == offset:
+            runs[-1][1] = offset + 1
+        else:
+            runs.append([offset, offset + 1])
+    return [(start, end) for start, end in runs]
+
+
+bucket_cache = BucketCache()
@@ -0,0 +1,161 @@
+"""
+采样压缩（旋转门算法）
+位于采集和存储之间：样本落在死区内或落在相邻存储点的插值斜线上时不写入数据库，
+查询端在分桶后对短缺口做线性插值还原曲线
+
+配置:
+    COMPRESSION_ENABLED        是否启用（默认true）
+    COMPRESSION_MAX_INTERVAL   两个存储点的最大间隔秒数（默认300），超过时强制写入
+    COMPRESSION_DEVIATIONS     覆盖默认死区，如 "router_status.cpu_usage=1,connection_quality.stability=2"
+"""
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MAX_INTERVAL = float(os.getenv("COMPRESSION_MAX_INTERVAL", "300"))
+
+# 默认死区（表 -> 列 -> 允许偏差），未列出的列必须完全相等才可省略
+DEFAULT_DEVIATIONS = {
+    "router_status": {
+        "cpu_usage": 2.0,
+        "memory_usage": 0.5,
+        "temperature": 0.5,
+        "uptime": 1.0,
+    },
+    "connection_quality": {
+        "signal_strength": 1.0,
+        "stability": 1.0,
+        "error_rate": 0.05,
+        "retransmit_rate": 0.05,
+    },
+}
+
+
+def load_deviations() -> Dict[str, Dict[str, float]]:
+    """默认死区 + 环境变量覆盖"""
+    deviations = {table: dict(columns) for table, columns in DEFAULT_DEVIATIONS.items()}
+    for item in os.getenv("COMPRESSION_DEVIATIONS", "").split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        table, _, column = key.strip().partition(".")
+        if table and column:
+            deviations.setdefault(table, {})[column] = float(value)
+    return deviations
+
+
+class SwingingDoor:
+    """单列的旋转门：记录从上一个存储点出发仍能容纳所有样本的斜率区间"""
+
+    def __init__(self, deviation: float):
+        self.deviation = deviation
+        self.t0 = 0.0
+        self.v0 = 0.0
+        self.upper = math.inf
+        self.lower = -math.inf
+
+    def reset(self, t: float, v: float):
+        self.t0, self.v0 = t, v
+        self.upper, self.lower = math.inf, -math.inf
+
+    def check(self, t: float, v: float) -> Optional[Tuple[float, float]]:
+        """返回加入该点后的新斜率区间；门被打开时返回None"""
+        dt = t - self.t0
+        if dt <= 0:
+            return (self.upper, self.lower) if abs(v - self.v0) <= self.deviation else None
+        upper = min(self.upper, (v + self.deviation - self.v0) / dt)
+        lower = max(self.lower, (v - self.deviation - self.v0) / dt)
+        if lower > upper:
+            return None
+        return upper, lower
+
+    def commit(self, slopes: Tuple[float, float]):
+        self.upper, self.lower = slopes
+
+
+class RowCompressor:
+    """
+    整行压缩：数值列各自一扇门，其余列要求完全相等
+    任一列不满足时，写入上一个被暂存的样本并以它为新的起点
+    """
+
+    def __init__(self, deviations: Dict[str, float], max_interval: float = COMPRESSION_MAX_INTERVAL):
+        self.doors = {column: SwingingDoor(deviation) for column, deviation in deviations.items()}
+        self.max_interval = max_interval
+        self.stored: Optional[Tuple[float, Dict]] = None
+        self.held: Optional[Tuple[float, Dict]] = None
+
+    def _restart(self, t: float, row: Dict):
+        self.stored = (t, row)
+        for column, door in self.doors.items():
+            door.reset(t, _number(row.get(column)))
+
+    def _exact_columns_equal(self, a: Dict, b: Dict) -> bool:
+        return all(a.get(key) == b.get(key) for key in b if key not in self.doors)
+
+    def offer(self, t: float, row: Dict) -> List[Tuple[float, Dict]]:
+        """提交一个样本，返回现在需要写入数据库的样本"""
+        if self.stored is None:
+            self._restart(t, row)
+            return [(t, row)]
+
+        previous = self.held or self.stored
+        if not self._exact_columns_equal(previous[1], row):
+            # 状态类字段变化：写入旧状态的最后一个点和新状态的第一个点
+            out = [self.held] if self.held else []
+            self.held = None
+            self._restart(t, row)
+            return out + [(t, row)]
+
+        if t - self.stored[0] <= self.max_interval:
+            slopes = {column: door.check(t, _number(row.get(column))) for column, door in self.doors.items()}
+            if all(value is not None for value in slopes.values()):
+                for column, value in slopes.items():
+                    self.doors[column].commit(value)
+                self.held = (t, row)
+                return []
+
+        # 门被打开或超过最大间隔
+        if self.held is None:
+            self._restart(t, row)
+            return [(t, row)]
+        out = [self.held]
+        self._restart(*self.held)
+        self.held = None
+        return out + self.offer(t, row)
+
+    def flush(self) -> List[Tuple[float, Dict]]:
+        """写出暂存样本（停止服务时调用）"""
+        if self.held is None:
+            return []
+        out = [self.held]
+        self._restart(*self.held)
+        self.held = None
+        return out
+
+
+def _number(value) -> float:
+    return float(value) if value is not None else 0.0
+
+
+class SampleCompressor:
+    """按表管理 RowCompressor"""
+
+    def __init__(self, enabled: bool = COMPRESSION_ENABLED, deviations: Optional[Dict[str, Dict[str, float]]] = None,
+                 max_interval: float = COMPRESSION_MAX_INTERVAL):
+        self.enabled = enabled
+        self.max_interval = max_interval
+        self.deviations = deviations if deviations is not None else load_deviations()
+        self.rows: Dict[str, RowCompressor] = {}
+
+    def offer(self, table: str, t: float, row: Dict) -> List[Tuple[float, Dict]]:
+        if not self.enabled or table not in self.deviations:
+            return [(t, row)]
+        compressor = self.rows.get(table)
+        if compressor is None:
+            compressor = self.rows[table] = RowCompressor(self.deviations[table], self.max_interval)
+        return compressor.offer(t, row)
+
+    def flush(self) -> Dict[str, List[Tuple[float, Dict]]]:
+        return {table: compressor.flush() for table, compressor in self.rows.items()}
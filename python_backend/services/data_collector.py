@@ -3,17 +3,155 @@
 """
 import asyncio
 import logging
-from datetime import datetime, timedelta
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Optional, TypeVar
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from models.database import (
-    SessionLocal, NetworkTraffic, OnlineDevice, NetworkLatency,
-    RouterStatus, BandwidthUsage, ConnectionQuality
+    engine, SessionLocal, NetworkTraffic, OnlineDevice, NetworkLatency,
+    RouterStatus, BandwidthUsage, ConnectionQuality, DevicePresence,
+    AnomalyEvent, UsageCounter, WifiStationStats, HeatmapCell
 )
 from utils.istoreos_client import IStoreOSClient
+from services.latency_stats import LatencyStats
+from services.timeseries_store import TimeSeriesStore, to_epoch, from_epoch
+from services.archive import archive, ARCHIVE_ENABLED
+from services.presence import PresenceTracker
+from services.compression import SampleCompressor
+from services.anomaly import AnomalyDetector
+from services.alerts import AlertEngine
+from services.usage import UsageAccounting, write_usage
+from services.wifi import StationTracker
+from services.heatmap import HeatmapCube, HEATMAP_DEVICES, oldest_week, write_heatmap
+from services.talkers import (
+    CONNTRACK_ENABLED, CONNTRACK_INTERVAL, CONNTRACK_COMMAND,
+    FlowDeltas, TopTalkers, parse_conntrack_line
+)
+from services.highres import HighResTraffic, HIGHRES_TRAFFIC_ENABLED, HIGHRES_INTERVAL
+from services.ingest import IngestQueue, StorageWorker
+from services.spool import Spool
+from services.partitions import PartitionManager, PARTITIONING_ENABLED
+from services.retention import Retention
+from services.bucket_cache import bucket_cache
+from services.shared_state import shared_state, STATE_PUBLISH_SECONDS
+from utils.capture import current_job
+from utils.clock import clock
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# 数据保留天数
+DATA_RETENTION_DAYS = int(os.getenv("DATA_RETENTION_DAYS", "7"))
+
+# 异常检测的最小标准差（避免平稳序列上微小波动被判为异常）
+ANOMALY_MIN_STD = {
+    "network_traffic.upload_speed": 1024,
+    "network_traffic.download_speed": 1024,
+    "network_latency.latency": 2.0,
+    "network_latency.packet_loss": 5.0,
+    "router_status.cpu_usage": 2.0,
+    "router_status.temperature": 1.0,
+}
+
+# 定时任务：(方法名, 间隔秒数)
+COLLECTION_JOBS = (
+    ("collect_network_traffic", 5),
+    ("collect_online_devices", 10),
+    ("collect_router_status", 5),
+    ("collect_network_latency", 10),
+    ("collect_connection_quality", 30),
+    ("cleanup_old_data", 3600),
+    ("publish_state", STATE_PUBLISH_SECONDS),
+)
+if CONNTRACK_ENABLED:
+    COLLECTION_JOBS += (("collect_conntrack", CONNTRACK_INTERVAL),)
+if PARTITIONING_ENABLED:
+    COLLECTION_JOBS += (("maintain_partitions", 3600),)
+if HIGHRES_TRAFFIC_ENABLED:
+    COLLECTION_JOBS += (("collect_highres_traffic", HIGHRES_INTERVAL),)
+
+# 共享状态快照中每个窗口/维度保留的流量大户数量
+TALKERS_SNAPSHOT_LIMIT = 50
+
+# 需要按保留期清理的时序表
+TIMESERIES_MODELS = [NetworkTraffic, NetworkLatency, RouterStatus, ConnectionQuality, WifiStationStats]
+
+def _write_presence(db: Session, diff, present: List[str], now: datetime) -> List[dict]:
+    """写入设备上线/下线/变化和批量 last_seen（在线程中执行），返回第一次出现的设备"""
+    new_devices = []
+    for device_data in diff.joined:
+        # 上线：更新或创建设备，并开启新的在线区间
+        device = db.query(OnlineDevice).filter(
+            OnlineDevice.mac_address == device_data["mac_address"]
+        ).first()
+        if device is None:
+            device = OnlineDevice(mac_address=device_data["mac_address"])
+            db.add(device)
+            new_devices.append(device_data)
+        device.ip_address = device_data["ip_address"]
+        device.hostname = device_data["hostname"]
+        device.hostname_lower = device_data["hostname"].lower() if device_data["hostname"] else None
+        device.device_type = device_data["device_type"]
+        device.vendor = device_data.get("vendor")
+        device.is_online = True
+        device.last_seen = now
+        device.upload_speed = device_data["upload_speed"]
+        device.download_speed = device_data["download_speed"]
+        db.add(DevicePresence(mac_address=device_data["mac_address"], online_from=now))
+    
+    for device_data in diff.changed:
+        db.query(OnlineDevice).filter(
+            OnlineDevice.mac_address == device_data["mac_address"]
+        ).update({
+            "ip_address": device_data["ip_address"],
+            "hostname": device_data["hostname"],
+            "hostname_lower": device_data["hostname"].lower() if device_data["hostname"] else None,
+            "device_type": device_data["device_type"],
+            "vendor": device_data.get("vendor"),
+        }, synchronize_session=False)
+    
+    for mac, last_seen in diff.left:
+        # 下线：关闭在线区间
+        db.query(OnlineDevice).filter(OnlineDevice.mac_address == mac).update({
+            "is_online": False,
+            "last_seen": last_seen,
+            "upload_speed": 0,
+            "download_speed": 0,
+        }, synchronize_session=False)
+        db.query(DevicePresence).filter(
+            DevicePresence.mac_address == mac,
+            DevicePresence.online_until.is_(None)
+        ).update({"online_until": last_seen}, synchronize_session=False)
+    
+    if present:
+        db.query(OnlineDevice).filter(
+            OnlineDevice.mac_address.in_(present)
+        ).update({"last_seen": now}, synchronize_session=False)
+    return new_devices
+
+def _load_presence(db: Session, now: datetime) -> List[dict]:
+    """
+    读取标记为在线的设备（在线程中执行）；没有未关闭在线区间的设备（在线区间表出现之前就已在线）
+    补开一个从 last_seen 开始的区间，之后下线时才能关闭
+    """
+    online = [
+        row._asdict() for row in db.query(
+            OnlineDevice.mac_address, OnlineDevice.ip_address, OnlineDevice.hostname,
+            OnlineDevice.device_type, OnlineDevice.vendor, OnlineDevice.last_seen
+        ).filter(OnlineDevice.is_online == True).all()
+    ]
+    open_macs = {
+        mac for (mac,) in db.query(DevicePresence.mac_address).filter(DevicePresence.online_until.is_(None))
+    }
+    for device in online:
+        if device["mac_address"] not in open_macs:
+            db.add(DevicePresence(mac_address=device["mac_address"], online_from=device["last_seen"] or now))
+    return online
+
 class DataCollector:
     """数据收集服务"""
     
@@ -21,162 +159,347 @@ class DataCollector:
         self.scheduler = AsyncIOScheduler()
         self.istoreos_client = IStoreOSClient()
         self.is_running = False
+        # 登录和预热完成、定时任务开始运行
+        self.ready = False
+        # 失去采集器锁后暂停了定时任务，重新获得锁时恢复
+        self.stepped_down = False
+        self.warmup_ms: Optional[float] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        self.latency_stats = LatencyStats(sample_interval=10)
+        self.presence = PresenceTracker()
+        self.compressor = SampleCompressor()
+        # 各表最新样本（压缩后数据库中的最新行可能滞后）
+        self.latest = {}
+        self.anomaly_detector = AnomalyDetector(min_std=ANOMALY_MIN_STD)
+        self.alert_engine = AlertEngine()
+        self.usage = UsageAccounting()
+        self.heatmap = HeatmapCube()
+        # 用量和热力图第一次使用时从数据库加载，避免并发的采集任务重复加载
+        self.state_load_lock = asyncio.Lock()
+        self.flow_deltas = FlowDeltas()
+        self.talkers = TopTalkers()
+        self.wifi = StationTracker()
+        self.highres = HighResTraffic()
+        self.partitions = PartitionManager(engine, [model.__tablename__ for model in TIMESERIES_MODELS])
+        self.retention = Retention(engine, TIMESERIES_MODELS)
+        # 采集任务只入队，存储协程批量写库
+        self.ingest = IngestQueue()
+        self.storage = StorageWorker(self.ingest, self._write_rows, Spool(), on_replay=bucket_cache.clear)
+        
+        # 最近N小时的内存时序数据，供历史查询直接使用
+        self.memory_store = TimeSeriesStore()
+        self.memory_store.register(
+            "network_traffic",
+            ("upload_speed", "download_speed", "total_upload", "total_download"),
+            interval=5
+        )
+        self.memory_store.register(
+            "router_status",
+            ("cpu_usage", "memory_usage", "temperature", "uptime"),
+            interval=5
+        )
     
     async def start(self):
-        """启动数据收集服务"""
+        """启动数据收集服务（登录和预热在后台进行，不阻塞调用方）"""
         if self.is_running:
             logger.warning("数据收集服务已在运行")
             return
+        if self.stepped_down:
+            self._resume()
+            return
         
         logger.info("启动数据收集服务...")
         
-        # 登录路由器
-        await self.istoreos_client.login()
-        
         # 添加定时任务
-        self.scheduler.add_job(
-            self.collect_network_traffic,
-            'interval',
-            seconds=5,
-            id='collect_network_traffic'
-        )
-        
-        self.scheduler.add_job(
-            self.collect_online_devices,
-            'interval',
-            seconds=10,
-            id='collect_online_devices'
-        )
-        
-        self.scheduler.add_job(
-            self.collect_router_status,
-            'interval',
-            seconds=5,
-            id='collect_router_status'
-        )
+        for name, seconds in COLLECTION_JOBS:
+            self.scheduler.add_job(
+                self.run_job,
+                'interval',
+                seconds=seconds,
+                args=[name],
+                id=name,
+                name=name,
+                replace_existing=True
+            )
         
-        self.scheduler.add_job(
-            self.collect_network_latency,
-            'interval',
-            seconds=10,
-            id='collect_network_latency'
-        )
-        
-        self.scheduler.add_job(
-            self.collect_connection_quality,
-            'interval',
-            seconds=30,
-            id='collect_connection_quality'
-        )
-        
-        self.scheduler.add_job(
-            self.cleanup_old_data,
-            'interval',
-            hours=1,
-            id='cleanup_old_data'
-        )
-        
-        self.scheduler.start()
         self.is_running = True
-        logger.info("数据收集服务已启动")
+        self.storage.start()
+        self._warmup_task = asyncio.create_task(self._warm_up())
+    
+    async def step_down(self):
+        """
+        失去采集器锁：暂停所有定时任务，不再采集和发布快照，队列中已有的行照常写完；
+        丢弃依赖数据库状态的内存累计（在线设备、用量、热力图），其他采集器可能已经更新了它们
+        """
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        if self.scheduler.running:
+            self.scheduler.pause()
+        self.presence.reset()
+        self.usage = UsageAccounting()
+        self.heatmap = HeatmapCube()
+        self.is_running = False
+        self.ready = False
+        self.stepped_down = True
+        logger.warning("数据收集服务已暂停，等待重新获得采集器锁")
+    
+    def _resume(self):
+        self.stepped_down = False
+        self.is_running = True
+        if self.scheduler.running:
+            self.scheduler.resume()
+            self.ready = True
+        else:
+            self._warmup_task = asyncio.create_task(self._warm_up())
+        logger.info("重新获得采集器锁，数据收集服务已恢复")
+    
+    async def _warm_up(self):
+        """登录路由器并读取一次流量计数作为基线，首个采集周期即可得到真实速率"""
+        started = time.perf_counter()
+        await self.run_job("prime_router")
+        if PARTITIONING_ENABLED:
+            # 首次运行时转换为分区表，之后的写入都落在已有分区中
+            await self.run_job("maintain_partitions")
+        self.scheduler.start()
+        self.alert_engine.start()
+        self.ready = True
+        self.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"数据收集服务已启动，预热耗时 {self.warmup_ms}ms")
+    
+    async def prime_router(self):
+        """登录路由器并读取流量计数作为速率基线"""
+        try:
+            await self.istoreos_client.login()
+            await self.istoreos_client.get_network_traffic()
+        except Exception as e:
+            logger.error(f"采集器预热失败: {e}")
+    
+    async def run_job(self, name: str):
+        """执行一个采集任务，并标记任务名供RPC录制使用"""
+        token = current_job.set((name, clock.time()))
+        try:
+            await getattr(self, name)()
+        finally:
+            current_job.reset(token)
     
     async def stop(self):
         """停止数据收集服务"""
-        if not self.is_running:
+        if not self.is_running and not self.stepped_down:
             return
         
         logger.info("停止数据收集服务...")
-        self.scheduler.shutdown()
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+        # 任务留在调度器中时再次 start 会因为任务id重复而失败
+        self.scheduler.remove_all_jobs()
+        await self._flush_compressed()
+        await self.storage.stop()
+        await self._flush_usage(clock.utcnow())
+        await self._flush_heatmap(clock.utcnow())
+        await self.alert_engine.stop()
         await self.istoreos_client.close()
         self.is_running = False
+        self.ready = False
+        self.stepped_down = False
         logger.info("数据收集服务已停止")
     
     async def collect_network_traffic(self):
         """收集网络流量数据"""
         try:
             data = await self.istoreos_client.get_network_traffic()
+            now = clock.utcnow()
+            self.memory_store.append("network_traffic", to_epoch(now), data)
+            await self._analyze_sample(now, "network_traffic", data, ("upload_speed", "download_speed"))
             
+            await self.ingest.put(NetworkTraffic, {
+                "timestamp": now,
+                "upload_speed": data["upload_speed"],
+                "download_speed": data["download_speed"],
+                "total_upload": data["total_upload"],
+                "total_download": data["total_download"],
+            }, ts=to_epoch(now))
+            logger.debug(f"网络流量: 上传={data['upload_speed']:.2f} KB/s, 下载={data['download_speed']:.2f} KB/s")
+            
+            if data.get("interfaces"):
+                await self._account_usage("interface", data["interfaces"], now)
+        except Exception as e:
+            logger.error(f"收集网络流量数据失败: {e}")
+    
+    async def _in_session(self, work: Callable[[Session], T]) -> T:
+        """在线程中打开会话执行 work(db) 并提交，数据库慢或被锁时不阻塞事件循环"""
+        def run():
             db = SessionLocal()
             try:
-                traffic = NetworkTraffic(
-                    timestamp=datetime.utcnow(),
-                    upload_speed=data["upload_speed"],
-                    download_speed=data["download_speed"],
-                    total_upload=data["total_upload"],
-                    total_download=data["total_download"]
-                )
-                db.add(traffic)
+                result = work(db)
                 db.commit()
-                logger.debug(f"网络流量数据已保存: 上传={data['upload_speed']:.2f} KB/s, 下载={data['download_speed']:.2f} KB/s")
+                return result
             finally:
                 db.close()
-        except Exception as e:
-            logger.error(f"收集网络流量数据失败: {e}")
+        return await asyncio.to_thread(run)
     
     async def collect_online_devices(self):
-        """收集在线设备数据"""
+        """收集在线设备数据（只写入上线/下线/变化事件，last_seen 定期批量更新）"""
         try:
             devices = await self.istoreos_client.get_online_devices()
+            now = clock.utcnow()
             
-            db = SessionLocal()
-            try:
-                for device_data in devices:
-                    # 查找或创建设备
-                    device = db.query(OnlineDevice).filter(
-                        OnlineDevice.mac_address == device_data["mac_address"]
-                    ).first()
-                    
-                    if device:
-                        # 更新现有设备
-                        device.ip_address = device_data["ip_address"]
-                        device.hostname = device_data["hostname"]
-                        device.device_type = device_data["device_type"]
-                        device.is_online = device_data["is_online"]
-                        device.last_seen = datetime.utcnow()
-                        device.upload_speed = device_data["upload_speed"]
-                        device.download_speed = device_data["download_speed"]
-                        device.updated_at = datetime.utcnow()
-                    else:
-                        # 创建新设备
-                        device = OnlineDevice(
-                            mac_address=device_data["mac_address"],
-                            ip_address=device_data["ip_address"],
-                            hostname=device_data["hostname"],
-                            device_type=device_data["device_type"],
-                            is_online=device_data["is_online"],
-                            last_seen=datetime.utcnow(),
-                            upload_speed=device_data["upload_speed"],
-                            download_speed=device_data["download_speed"]
-                        )
-                        db.add(device)
-                
-                db.commit()
-                logger.debug(f"在线设备数据已更新: {len(devices)}台设备")
-            finally:
-                db.close()
+            if not self.presence.loaded:
+                online = await self._in_session(lambda db: _load_presence(db, now))
+                self.presence.load(online, now)
+            
+            diff = self.presence.diff(devices, now)
+            flush_last_seen = self.presence.flush_due(now)
+            if not diff and not flush_last_seen:
+                return
+            
+            present = self.presence.seen() if flush_last_seen else []
+            new_devices = await self._in_session(lambda db: _write_presence(db, diff, present, now))
+            if flush_last_seen:
+                self.presence.mark_flushed(now)
+            for device_data in new_devices:
+                self.alert_engine.observe_event(
+                    "online_devices.new", device_data["mac_address"], to_epoch(now),
+                    {"hostname": device_data["hostname"], "ipAddress": device_data["ip_address"]}
+                )
+            logger.debug(
+                f"在线设备变化已保存: 上线={len(diff.joined)}, 下线={len(diff.left)}, "
+                f"变化={len(diff.changed)}, 在线={len(devices)}台"
+            )
         except Exception as e:
+            self.presence.reset()
             logger.error(f"收集在线设备数据失败: {e}")
     
+    async def _account_usage(self, kind: str, counters: dict, now: datetime):
+        """累计字节计数器增量（name -> (rx, tx)），到期时写入日/月用量表"""
+        if not self.usage.loaded:
+            async with self.state_load_lock:
+                if not self.usage.loaded:
+                    rows = await self._in_session(lambda db: [
+                        row._asdict() for row in db.query(
+                            UsageCounter.kind, UsageCounter.name, UsageCounter.last_rx, UsageCounter.last_tx,
+                            UsageCounter.total_rx, UsageCounter.total_tx
+                        ).all()
+                    ])
+                    self.usage.load(rows, now)
+        
+        for name, (rx, tx) in counters.items():
+            self.usage.add(kind, name, rx, tx, now)
+        if self.usage.flush_due(now):
+            await self._flush_usage(now)
+    
+    async def _flush_usage(self, now: datetime):
+        """写入累计的用量和计数器状态"""
+        usage = self.usage
+        if not usage.loaded:
+            return
+        batch = usage.take(now)
+        try:
+            await self._in_session(lambda db: write_usage(db, batch, now))
+        except Exception as e:
+            usage.restore(batch)
+            logger.error(f"写入用量数据失败: {e}")
+    
+    async def _observe_heatmap(self, now: datetime, table: str, data: dict, target: str = ""):
+        """累计到周×小时热力图，到期时写入数据库"""
+        if not self.heatmap.loaded:
+            # 数据库不可用时不影响样本入队，下次再恢复
+            try:
+                async with self.state_load_lock:
+                    if not self.heatmap.loaded:
+                        since = oldest_week(now, self.heatmap.weeks)
+                        rows = await self._in_session(lambda db: [
+                            row._asdict() for row in db.query(
+                                HeatmapCell.metric, HeatmapCell.target, HeatmapCell.week, HeatmapCell.cell,
+                                HeatmapCell.total, HeatmapCell.count, HeatmapCell.peak
+                            ).filter(HeatmapCell.week >= since).all()
+                        ])
+                        self.heatmap.load(rows, now)
+            except Exception as e:
+                logger.error(f"读取热力图数据失败: {e}")
+                return
+        
+        self.heatmap.observe(table, data, now, target)
+        if self.heatmap.flush_due(now):
+            await self._flush_heatmap(now)
+    
+    async def _flush_heatmap(self, now: datetime):
+        """写入热力图中有变化的格子"""
+        heatmap = self.heatmap
+        if not heatmap.loaded:
+            return
+        batch = heatmap.take(now)
+        try:
+            await self._in_session(lambda db: write_heatmap(db, batch, now))
+        except Exception as e:
+            heatmap.restore(batch)
+            logger.error(f"写入热力图数据失败: {e}")
+    
+    async def _analyze_sample(self, now: datetime, table: str, data: dict, fields: tuple, target: str = ""):
+        """
+        在内存中分析样本：所有数值字段交给告警规则求值，fields 中的字段做异常检测，
+        异常事件写入数据库（只写不读）；同时累计到周×小时热力图
+        """
+        ts = to_epoch(now)
+        self.alert_engine.observe_sample(table, data, ts, target)
+        await self._observe_heatmap(now, table, data, target)
+        events = []
+        for field in fields:
+            value = data.get(field)
+            if value is None:
+                continue
+            event = self.anomaly_detector.observe(f"{table}.{field}", target, float(value), ts)
+            if event:
+                events.append(event)
+        if table == "router_status" and "wan_status" in data:
+            event = self.anomaly_detector.observe_state("router_status.wan_status", "wan", data["wan_status"], "connected")
+            if event:
+                events.append(event)
+        for event in events:
+            await self.ingest.put(AnomalyEvent, dict(event, timestamp=now), key=f"{event['metric']}:{event['target']}", ts=ts)
+            logger.warning(f"检测到异常: {event['metric']}[{event['target']}] {event['kind']} 值={event['value']} 期望={event['expected']}")
+    
+    def _write_rows(self, rows: dict):
+        """存储协程调用（在线程中执行）：{模型: [行]} 在一个事务中按表批量插入"""
+        db = SessionLocal()
+        try:
+            for model, values in rows.items():
+                db.execute(insert(model), values)
+            db.commit()
+        finally:
+            db.close()
+    
+    async def _store_compressed(self, model, now: datetime, data: dict, fields: tuple) -> int:
+        """经过旋转门压缩后写入，返回写入的行数"""
+        self.latest[model.__tablename__] = (now, data)
+        rows = self.compressor.offer(
+            model.__tablename__, to_epoch(now), {field: data[field] for field in fields}
+        )
+        for ts, row in rows:
+            await self.ingest.put(model, dict(row, timestamp=from_epoch(ts)), ts=ts)
+        return len(rows)
+    
+    async def _flush_compressed(self):
+        """写出压缩器中暂存的样本"""
+        models = {model.__tablename__: model for model in (RouterStatus, ConnectionQuality)}
+        for table, rows in self.compressor.flush().items():
+            for ts, row in rows:
+                await self.ingest.put(models[table], dict(row, timestamp=from_epoch(ts)), ts=ts)
+    
     async def collect_router_status(self):
         """收集路由器状态数据"""
         try:
             data = await self.istoreos_client.get_router_status()
+            now = clock.utcnow()
+            self.memory_store.append("router_status", to_epoch(now), data)
+            await self._analyze_sample(now, "router_status", data, ("cpu_usage", "temperature"))
             
-            db = SessionLocal()
-            try:
-                status = RouterStatus(
-                    timestamp=datetime.utcnow(),
-                    cpu_usage=data["cpu_usage"],
-                    memory_usage=data["memory_usage"],
-                    temperature=data["temperature"],
-                    uptime=data["uptime"],
-                    wan_status=data["wan_status"]
-                )
-                db.add(status)
-                db.commit()
-                logger.debug(f"路由器状态已保存: CPU={data['cpu_usage']:.1f}%, 内存={data['memory_usage']:.1f}%")
-            finally:
-                db.close()
+            saved = await self._store_compressed(
+                RouterStatus, now, data,
+                ("cpu_usage", "memory_usage", "temperature", "uptime", "wan_status")
+            )
+            logger.debug(f"路由器状态: CPU={data['cpu_usage']:.1f}%, 内存={data['memory_usage']:.1f}%, 写入{saved}行")
         except Exception as e:
             logger.error(f"收集路由器状态数据失败: {e}")
     
@@ -185,23 +508,28 @@ class DataCollector:
         try:
             targets = ["8.8.8.8", "114.114.114.114", "1.1.1.1"]
             
-            db = SessionLocal()
-            try:
-                for target in targets:
-                    data = await self.istoreos_client.get_network_latency(target)
-                    
-                    latency = NetworkLatency(
-                        timestamp=datetime.utcnow(),
-                        target=data["target"],
-                        latency=data["latency"],
-                        packet_loss=data["packet_loss"]
-                    )
-                    db.add(latency)
+            for target in targets:
+                data = await self.istoreos_client.get_network_latency(target)
+                self.latency_stats.add(
+                    data["target"],
+                    clock.time(),
+                    data["latency"],
+                    data["packet_loss"],
+                    data.get("jitter", 0)
+                )
+                now = clock.utcnow()
+                await self._analyze_sample(
+                    now, "network_latency", data, ("latency", "packet_loss"), target=data["target"]
+                )
                 
-                db.commit()
-                logger.debug(f"网络延迟数据已保存: {len(targets)}个目标")
-            finally:
-                db.close()
+                await self.ingest.put(NetworkLatency, {
+                    "timestamp": now,
+                    "target": data["target"],
+                    "latency": data["latency"],
+                    "packet_loss": data["packet_loss"],
+                }, key=data["target"], ts=to_epoch(now))
+            
+            logger.debug(f"网络延迟: {len(targets)}个目标")
         except Exception as e:
             logger.error(f"收集网络延迟数据失败: {e}")
     
@@ -209,57 +537,135 @@ class DataCollector:
         """收集连接质量数据"""
         try:
             data = await self.istoreos_client.get_connection_quality()
+            now = clock.utcnow()
+            stations = await self.istoreos_client.get_wifi_stations()
+            if stations:
+                # 有无线终端时，信号强度和重传率使用真实的射频统计
+                data.update(await self._collect_wifi(stations, now))
+            await self._analyze_sample(now, "connection_quality", data, ())
             
-            db = SessionLocal()
-            try:
-                quality = ConnectionQuality(
-                    timestamp=datetime.utcnow(),
-                    signal_strength=data["signal_strength"],
-                    stability=data["stability"],
-                    error_rate=data["error_rate"],
-                    retransmit_rate=data["retransmit_rate"]
-                )
-                db.add(quality)
-                db.commit()
-                logger.debug(f"连接质量数据已保存: 信号强度={data['signal_strength']:.1f}%")
-            finally:
-                db.close()
+            saved = await self._store_compressed(
+                ConnectionQuality, now, data,
+                ("signal_strength", "stability", "error_rate", "retransmit_rate")
+            )
+            logger.debug(f"连接质量: 信号强度={data['signal_strength']:.1f}%, 写入{saved}行")
         except Exception as e:
             logger.error(f"收集连接质量数据失败: {e}")
     
+    async def _collect_wifi(self, stations: list, now: datetime) -> dict:
+        """更新终端统计（按MAC关联在线设备），写入有变化的终端行，累计设备用量；返回汇总的质量字段"""
+        rows, quality = self.wifi.update(stations, to_epoch(now), self.presence.present)
+        for row in rows:
+            await self.ingest.put(WifiStationStats, dict(row, timestamp=now), key=row["device_mac"], ts=to_epoch(now))
+        await self._account_usage("device", {
+            station["mac_address"]: (station["rx_bytes"], station["tx_bytes"])
+            for station in stations if "rx_bytes" in station and "tx_bytes" in station
+        }, now)
+        if HEATMAP_DEVICES:
+            for station in self.wifi.stations:
+                if station["rxRate"] is not None and station["txRate"] is not None:
+                    await self._observe_heatmap(
+                        now, "device", {"traffic": station["rxRate"] + station["txRate"]}, station["macAddress"]
+                    )
+        logger.debug(f"无线终端: {len(stations)}台, 写入{len(rows)}行")
+        return quality
+    
+    async def collect_highres_traffic(self):
+        """高精度流量采样：只更新内存中的1秒数据和汇总，不写数据库"""
+        try:
+            counters = await self.istoreos_client.get_traffic_counters()
+            if counters is None:
+                return
+            uptime, interfaces = counters
+            self.highres.add(uptime, interfaces, clock.time())
+        except Exception as e:
+            logger.error(f"高精度流量采样失败: {e}")
+    
+    async def collect_conntrack(self):
+        """流式读取连接跟踪表，按连接字节增量更新流量大户统计"""
+        lines = 0
+        try:
+            async for line in self.istoreos_client.stream_command_lines(CONNTRACK_COMMAND):
+                lines += 1
+                flow = parse_conntrack_line(line)
+                if flow:
+                    self.flow_deltas.observe(flow)
+            if not lines:
+                self.flow_deltas.abort()
+                return
+            self.talkers.add(clock.time(), self.flow_deltas.commit())
+            logger.debug(f"连接跟踪表: {lines}行")
+        except Exception as e:
+            self.flow_deltas.abort()
+            logger.error(f"收集连接跟踪数据失败: {e}")
+    
     async def cleanup_old_data(self):
-        """清理7天前的旧数据"""
+        """
+        清理超过保留期的旧数据：启用归档时先按天写入归档文件；
+        按天分区时删除过期分区，否则分批删除过期行（SQLite随后回收空闲页）
+        """
         try:
-            threshold = datetime.utcnow() - timedelta(days=7)
+            threshold = clock.utcnow() - timedelta(days=DATA_RETENTION_DAYS)
             
-            db = SessionLocal()
-            try:
-                # 删除旧的网络流量数据
-                deleted_traffic = db.query(NetworkTraffic).filter(
-                    NetworkTraffic.timestamp < threshold
-                ).delete()
-                
-                # 删除旧的网络延迟数据
-                deleted_latency = db.query(NetworkLatency).filter(
-                    NetworkLatency.timestamp < threshold
-                ).delete()
-                
-                # 删除旧的路由器状态数据
-                deleted_router = db.query(RouterStatus).filter(
-                    RouterStatus.timestamp < threshold
-                ).delete()
-                
-                # 删除旧的连接质量数据
-                deleted_quality = db.query(ConnectionQuality).filter(
-                    ConnectionQuality.timestamp < threshold
-                ).delete()
-                
-                db.commit()
-                logger.info(f"已清理旧数据: 流量={deleted_traffic}, 延迟={deleted_latency}, 路由器={deleted_router}, 质量={deleted_quality}")
-            finally:
-                db.close()
+            if ARCHIVE_ENABLED:
+                # 只归档完整的天，当天剩余部分留到下次；删除在归档之后进行
+                threshold = datetime(threshold.year, threshold.month, threshold.day)
+                archived = await self._in_session(lambda db: {
+                    model.__tablename__: archive.archive_table(db, model, threshold, delete=False)
+                    for model in TIMESERIES_MODELS
+                })
+                logger.info(f"已归档旧数据: {archived}")
+            
+            if PARTITIONING_ENABLED:
+                # 只删除整天都已过期的分区，当天剩余部分留到下次
+                await self._drop_partitions(threshold.date())
+                return
+            
+            report = await self.retention.run(threshold)
+            logger.info(
+                f"已清理旧数据: {report['deleted']}, 回收{report['reclaimedBytes']}字节, "
+                f"持锁{report['lockMs']['total']}ms（最长{report['lockMs']['max']}ms）"
+                + ("" if report["complete"] else "，超出时间预算，剩余部分下次清理")
+            )
         except Exception as e:
             logger.error(f"清理旧数据失败: {e}")
+    
+    async def _drop_partitions(self, cutoff: date):
+        dropped = await asyncio.to_thread(self.partitions.drop_expired, cutoff)
+        logger.info(f"已删除过期分区: {dropped}")
+    
+    async def maintain_partitions(self):
+        """转换未分区的时序表，提前创建未来的天分区"""
+        try:
+            created = await asyncio.to_thread(self.partitions.maintain, clock.utcnow().date())
+            if any(created.values()):
+                logger.info(f"已创建分区: {created}")
+        except Exception as e:
+            logger.error(f"维护分区失败: {e}")
+    
+    def snapshot(self) -> dict:
+        """供API进程使用的内存派生状态"""
+        engine = self.alert_engine
+        return {
+            "latest": self.latest,
+            "latencyStats": self.latency_stats.summary(clock.time()),
+            "talkers": self.talkers.summary(clock.time(), TALKERS_SNAPSHOT_LIMIT),
+            "wifiStations": self.wifi.stations,
+            "storage": self.storage.stats(),
+            "retention": self.retention.last_report,
+            "alerts": {
+                "active": list(engine.active.values()),
+                "recent": list(engine.recent),
+                "dropped": engine.dropped,
+            },
+        }
+    
+    async def publish_state(self):
+        """发布共享状态快照（多进程部署时API进程从快照读取）"""
+        try:
+            shared_state.publish(self.snapshot())
+        except Exception as e:
+            logger.error(f"发布共享状态失败: {e}")
 
 # 全局数据收集器实例
 data_collector = DataCollector()
@@ -0,0 +1,131 @@
+"""
+时序数据批量导出
+使用服务端游标（yield_per）分块读取，逐块编码为 CSV / NDJSON，可选 gzip，
+内存占用与导出范围大小无关
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import orjson
+
+from models.database import (
+    SessionLocal, NetworkTraffic, NetworkLatency, RouterStatus,
+    BandwidthUsage, ConnectionQuality, WifiStationStats
+)
+from services.archive import archive
+
+# 可导出的指标（表名 -> 模型）
+EXPORT_MODELS = {
+    "network_traffic": NetworkTraffic,
+    "network_latency": NetworkLatency,
+    "router_status": RouterStatus,
+    "connection_quality": ConnectionQuality,
+    "bandwidth_usage": BandwidthUsage,
+    "wifi_station_stats": WifiStationStats,
+}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# 每次从游标取出的行数
+CHUNK_SIZE = 1000
+
+
+def default_columns(model) -> List[str]:
+    """默认导出除 id / created_at 之外的所有列"""
+    return [c.name for c in model.__table__.columns if c.name not in ("id", "created_at")]
+
+
+def resolve_columns(model, requested: Optional[str]) -> List[str]:
+    """解析 columns 参数（逗号分隔），未知列抛出 ValueError"""
+    if not requested:
+        return default_columns(model)
+    available = set(model.__table__.columns.keys())
+    names = [name.strip() for name in requested.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"未知的列: {', '.join(unknown)}")
+    if "timestamp" not in names:
+        names.insert(0, "timestamp")
+    return names
+
+
+def iter_db_chunks(model, names: Sequence[str], start: datetime, end: datetime,
+                   filters: Optional[Dict[str, str]] = None) -> Iterator[List[tuple]]:
+    """在独立会话中以服务端游标分块读取行"""
+    db = SessionLocal()
+    try:
+        query = db.query(*[getattr(model, name) for name in names]).filter(
+            model.timestamp >= start,
+            model.timestamp < end
+        )
+        for name, value in (filters or {}).items():
+            query = query.filter(getattr(model, name) == value)
+        query = query.order_by(model.timestamp).yield_per(CHUNK_SIZE)
+
+        chunk = []
+        for row in query:
+            chunk.append(tuple(row))
+            if len(chunk) >= CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        db.close()
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(chunks: Iterable[List[tuple]], names: Sequence[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for chunk in chunks:
+        writer.writerows([_format_value(v) for v in row] for row in chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def encode_ndjson(chunks: Iterable[List[tuple]], names: Sequence[str]) -> Iterator[bytes]:
+    for chunk in chunks:
+        yield b"".join(orjson.dumps(dict(zip(names, row))) + b"\n" for row in chunk)
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """逐块压缩为gzip流"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(metric: str, names: Sequence[str], start: datetime, end: datetime,
+                  fmt: str = "csv", gzip: bool = False,
+                  filters: Optional[Dict[str, str]] = None) -> Iterator[bytes]:
+    """组装导出流：归档文件 + 数据库分块读取 -> 编码 -> 可选压缩"""
+    model = EXPORT_MODELS[metric]
+    # 数据库中可能还留有已归档的行，以归档覆盖到的时间为界分别读取，避免重复
+    split = archive.split_point(metric, start, end)
+    chunks = chain(
+        archive.iter_chunks(metric, names, start, split, filters),
+        iter_db_chunks(model, names, split, end, filters),
+    )
+    encoder = encode_csv if fmt == "csv" else encode_ndjson
+    stream = encoder(chunks, names)
+    return gzip_stream(stream) if gzip else stream
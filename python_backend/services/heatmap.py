@@ -0,0 +1,220 @@
+"""
+周×小时热力图
+按本地时间把指标样本累计到 星期几×小时 的168个格子中（和、样本数、峰值）。
+每个序列（指标+目标）保留最近 HEATMAP_WEEKS 周，每周一个槽位，新的一周覆盖最旧的槽位，
+查询只合并 168×周数 个格子，与保留期内的原始数据量无关。
+有变化的格子定期写入 heatmap_cells，采集器重启后从数据库恢复
+"""
+import os
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.database import HeatmapCell
+from services.usage import USAGE_UTC_OFFSET_HOURS
+
+# 保留的周数
+HEATMAP_WEEKS = int(os.getenv("HEATMAP_WEEKS", "4"))
+# 写入数据库的间隔（秒）
+HEATMAP_FLUSH_SECONDS = int(os.getenv("HEATMAP_FLUSH_SECONDS", "300"))
+# 是否按设备累计无线终端流量
+HEATMAP_DEVICES = os.getenv("HEATMAP_DEVICES", "true").lower() == "true"
+
+CELLS = 7 * 24
+
+# 一次写入：(待写入的格子键, 格子当前值, 需要删除的周的上界)
+HeatmapBatch = Tuple[Set[Tuple[str, str, int]], List[Dict], Optional[date]]
+
+# 表 -> 累计的字段，指标名为 表.字段；device.traffic 为无线终端上下行速率之和（字节/秒）
+HEATMAP_METRICS = {
+    "network_traffic": ("download_speed", "upload_speed"),
+    "router_status": ("cpu_usage", "memory_usage", "temperature"),
+    "network_latency": ("latency", "packet_loss"),
+    "device": ("traffic",),
+}
+
+
+def local_cell(now: datetime, offset_hours: float = USAGE_UTC_OFFSET_HOURS) -> Tuple[date, int]:
+    """UTC时间 -> (本地周一, 格子序号)"""
+    local = now + timedelta(hours=offset_hours)
+    day = local.date()
+    return day - timedelta(days=day.weekday()), day.weekday() * 24 + local.hour
+
+
+def oldest_week(now: datetime, weeks: int = HEATMAP_WEEKS) -> date:
+    """最近 weeks 周中最早一周的周一"""
+    return local_cell(now)[0] - timedelta(weeks=weeks - 1)
+
+
+class Series:
+    """一个序列的 周数×168 个格子；槽位按周序号取模循环使用"""
+    __slots__ = ("weeks", "totals", "counts", "peaks")
+
+    def __init__(self, slots: int):
+        self.weeks: List[Optional[date]] = [None] * slots
+        self.totals = array("d", bytes(8 * slots * CELLS))
+        self.counts = array("d", bytes(8 * slots * CELLS))
+        self.peaks = array("d", bytes(8 * slots * CELLS))
+
+    def slot(self, week: date) -> Tuple[Optional[int], bool]:
+        """
+        返回 (week 所在的槽位, 是否覆盖了更早的一周)；
+        槽位上是更早的一周时清空后复用，是更新的一周（week已过期）时槽位为None
+        """
+        slot = (week.toordinal() - 1) // 7 % len(self.weeks)
+        current = self.weeks[slot]
+        if current == week:
+            return slot, False
+        if current is not None and current > week:
+            return None, False
+        start = slot * CELLS
+        for index in range(start, start + CELLS):
+            self.totals[index] = self.counts[index] = self.peaks[index] = 0.0
+        self.weeks[slot] = week
+        return slot, current is not None
+
+    def cells(self, since: date) -> Iterable[Tuple[int, float, float, float]]:
+        """since 之后各周有样本的格子: (格子序号, 和, 样本数, 峰值)"""
+        for slot, week in enumerate(self.weeks):
+            if week is None or week < since:
+                continue
+            start = slot * CELLS
+            for cell in range(CELLS):
+                index = start + cell
+                if self.counts[index]:
+                    yield cell, self.totals[index], self.counts[index], self.peaks[index]
+
+
+def summarize(cells: Iterable[Tuple[int, float, float, Optional[float]]]) -> Dict[str, List[List[Optional[float]]]]:
+    """合并各周的格子，返回 7×24 的均值、峰值和样本数（周一为第一行，没有样本的格子为null）"""
+    totals = [0.0] * CELLS
+    counts = [0] * CELLS
+    peaks: List[Optional[float]] = [None] * CELLS
+    for cell, total, count, peak in cells:
+        totals[cell] += total
+        counts[cell] += int(count)
+        if peak is not None and (peaks[cell] is None or peak > peaks[cell]):
+            peaks[cell] = peak
+    means = [totals[cell] / counts[cell] if counts[cell] else None for cell in range(CELLS)]
+    return {
+        "mean": [means[day * 24:day * 24 + 24] for day in range(7)],
+        "peak": [peaks[day * 24:day * 24 + 24] for day in range(7)],
+        "samples": [counts[day * 24:day * 24 + 24] for day in range(7)],
+    }
+
+
+class HeatmapCube:
+    """所有序列的热力图，样本 O(1) 累计到当前格子，定期取出有变化的格子写入数据库"""
+
+    def __init__(self, weeks: int = HEATMAP_WEEKS, flush_seconds: float = HEATMAP_FLUSH_SECONDS):
+        self.weeks = weeks
+        self.flush_seconds = flush_seconds
+        self.series: Dict[Tuple[str, str], Series] = {}
+        # (指标, 目标, 槽位*168+格子)
+        self.dirty: Set[Tuple[str, str, int]] = set()
+        # 有槽位被新的一周覆盖，下次写入时删除过期的周
+        self.expired = False
+        self.loaded = False
+        self.last_flush: Optional[datetime] = None
+
+    def _series(self, metric: str, target: str) -> Series:
+        series = self.series.get((metric, target))
+        if series is None:
+            series = self.series[(metric, target)] = Series(self.weeks)
+        return series
+
+    def load(self, rows: Iterable[Dict], now: datetime):
+        """从 heatmap_cells 恢复最近的周"""
+        for row in rows:
+            series = self._series(row["metric"], row["target"])
+            slot, _ = series.slot(row["week"])
+            if slot is None:
+                continue
+            index = slot * CELLS + row["cell"]
+            series.totals[index] = row["total"] or 0.0
+            series.counts[index] = row["count"] or 0
+            series.peaks[index] = row["peak"] or 0.0
+        self.loaded = True
+        self.last_flush = now
+
+    def add(self, metric: str, target: str, value: float, now: datetime):
+        week, cell = local_cell(now)
+        series = self._series(metric, target)
+        slot, recycled = series.slot(week)
+        if slot is None:
+            return
+        self.expired = self.expired or recycled
+        index = slot * CELLS + cell
+        if series.counts[index]:
+            series.peaks[index] = max(series.peaks[index], value)
+        else:
+            series.peaks[index] = value
+        series.totals[index] += value
+        series.counts[index] += 1
+        self.dirty.add((metric, target, index))
+
+    def observe(self, table: str, data: Dict, now: datetime, target: str = ""):
+        """累计一个样本中 HEATMAP_METRICS 列出的字段"""
+        for field in HEATMAP_METRICS.get(table, ()):
+            value = data.get(field)
+            if value is not None:
+                self.add(f"{table}.{field}", target, float(value), now)
+
+    def grid(self, metric: str, target: str, now: datetime, weeks: Optional[int] = None):
+        """最近 weeks 周合并后的热力图；序列不存在时返回None"""
+        series = self.series.get((metric, target))
+        if series is None:
+            return None
+        return summarize(series.cells(oldest_week(now, min(weeks or self.weeks, self.weeks))))
+
+    def flush_due(self, now: datetime) -> bool:
+        return self.last_flush is None or (now - self.last_flush).total_seconds() >= self.flush_seconds
+
+    def take(self, now: datetime) -> HeatmapBatch:
+        """取出有变化的格子的当前值，之后的样本记入下一批；写入失败时调用 restore"""
+        rows = []
+        for metric, target, index in self.dirty:
+            series = self.series[(metric, target)]
+            if not series.counts[index]:
+                # 槽位已被新的一周覆盖
+                continue
+            slot, cell = divmod(index, CELLS)
+            rows.append({
+                "metric": metric,
+                "target": target,
+                "week": series.weeks[slot],
+                "cell": cell,
+                "total": series.totals[index],
+                "count": int(series.counts[index]),
+                "peak": series.peaks[index],
+            })
+        batch = (self.dirty, rows, oldest_week(now, self.weeks) if self.expired else None)
+        self.dirty = set()
+        self.expired = False
+        self.last_flush = now
+        return batch
+
+    def restore(self, batch: HeatmapBatch):
+        """写入失败：格子重新标记为待写入（下次写入时取最新值）"""
+        keys, _, expire_before = batch
+        self.dirty |= keys
+        self.expired = self.expired or expire_before is not None
+
+
+def write_heatmap(db: Session, batch: HeatmapBatch, now: datetime):
+    """把一批格子写入会话（由调用方提交）；只访问 batch，可以在线程中执行"""
+    _, rows, expire_before = batch
+    for row in rows:
+        values = {"total": row["total"], "count": row["count"], "peak": row["peak"], "updated_at": now}
+        updated = db.query(HeatmapCell).filter(
+            HeatmapCell.metric == row["metric"], HeatmapCell.target == row["target"],
+            HeatmapCell.week == row["week"], HeatmapCell.cell == row["cell"]
+        ).update(values, synchronize_session=False)
+        if not updated:
+            db.add(HeatmapCell(
+                metric=row["metric"], target=row["target"], week=row["week"], cell=row["cell"], **values
+            ))
+    if expire_before is not None:
+        db.query(HeatmapCell).filter(HeatmapCell.week < expire_before).delete(synchronize_session=False)
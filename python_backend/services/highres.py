@@ -0,0 +1,123 @@
+"""
+高精度（1秒）流量采样
+每次用一个 sys.exec 同时读取 /proc/uptime 和 /proc/net/dev，速率 = 字节增量 / 路由器uptime增量，
+RPC往返时间的抖动不会变成速率噪声。原始1秒数据只保存在内存环形缓冲区中，
+同时滚动汇总为10秒和1分钟的均值/峰值，都不写数据库
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+from services.timeseries_store import TimeSeriesRing
+from services.usage import stitch
+
+# 是否启用高精度流量采样（排查突发流量时开启）
+HIGHRES_TRAFFIC_ENABLED = os.getenv("HIGHRES_TRAFFIC_ENABLED", "false").lower() == "true"
+# 采样间隔（秒）
+HIGHRES_INTERVAL = float(os.getenv("HIGHRES_INTERVAL", "1"))
+# 原始数据保留时长（分钟）
+HIGHRES_RAW_MINUTES = float(os.getenv("HIGHRES_RAW_MINUTES", "15"))
+
+# 汇总粒度: (桶宽度秒数, 保留秒数)
+ROLLUPS = {
+    "10s": (10, 3600),
+    "1m": (60, 6 * 3600),
+}
+
+RAW_COLUMNS = ("rx_rate", "tx_rate")
+ROLLUP_COLUMNS = ("rx_mean", "rx_max", "tx_mean", "tx_max")
+
+
+class Rollup:
+    """把一个接口的速率样本折叠为固定宽度的桶，桶结束时写入环形缓冲区"""
+
+    def __init__(self, width: float, retention: float):
+        self.width = width
+        self.ring = TimeSeriesRing(ROLLUP_COLUMNS, int(retention / width) + 1)
+        self.start: Optional[float] = None
+        self.count = 0
+        self.sums = [0.0, 0.0]
+        self.maxes = [0.0, 0.0]
+
+    def add(self, ts: float, rx: float, tx: float):
+        start = ts - ts % self.width
+        if start != self.start:
+            self.close()
+            self.start = start
+        self.count += 1
+        self.sums[0] += rx
+        self.sums[1] += tx
+        self.maxes[0] = max(self.maxes[0], rx)
+        self.maxes[1] = max(self.maxes[1], tx)
+
+    def close(self):
+        if self.count:
+            self.ring.append(self.start, {
+                "rx_mean": self.sums[0] / self.count,
+                "rx_max": self.maxes[0],
+                "tx_mean": self.sums[1] / self.count,
+                "tx_max": self.maxes[1],
+            })
+        self.count = 0
+        self.sums = [0.0, 0.0]
+        self.maxes = [0.0, 0.0]
+
+
+class HighResTraffic:
+    """
+    所有接口的1秒速率；样本时间 = 基线时的本地时间 - 路由器uptime + 当前uptime，
+    间隔严格按路由器时钟，路由器重启（uptime变小）时重新建立基线
+    """
+
+    def __init__(self, raw_seconds: float = HIGHRES_RAW_MINUTES * 60, interval: float = HIGHRES_INTERVAL):
+        self.capacity = int(raw_seconds / interval) + 1
+        self.anchor: Optional[float] = None
+        self.last_uptime: Optional[float] = None
+        self.last_counters: Dict[str, Tuple[float, float]] = {}
+        self.raw: Dict[str, TimeSeriesRing] = {}
+        self.rollups: Dict[str, Dict[str, Rollup]] = {}
+        self.current: Dict[str, Tuple[float, float]] = {}
+        self.samples = 0
+        self.resets = 0
+
+    def add(self, uptime: float, counters: Dict[str, Tuple[float, float]], local_ts: float) -> Optional[float]:
+        """提交一次读数，返回样本时间；第一次读数、重复读数和重启后的第一次读数返回None"""
+        if self.last_uptime is not None and uptime == self.last_uptime:
+            return None
+        if self.last_uptime is None or uptime < self.last_uptime:
+            if self.last_uptime is not None:
+                self.resets += 1
+            self.anchor = local_ts - uptime
+            self.last_uptime = uptime
+            self.last_counters = dict(counters)
+            self.current = {}
+            return None
+
+        elapsed = uptime - self.last_uptime
+        ts = self.anchor + uptime
+        current = {}
+        for name, (rx, tx) in counters.items():
+            last = self.last_counters.get(name)
+            if last is None:
+                continue
+            rx_rate = stitch(last[0], rx) / elapsed
+            tx_rate = stitch(last[1], tx) / elapsed
+            current[name] = (rx_rate, tx_rate)
+            ring = self.raw.get(name)
+            if ring is None:
+                ring = self.raw[name] = TimeSeriesRing(RAW_COLUMNS, self.capacity)
+                self.rollups[name] = {key: Rollup(width, retention) for key, (width, retention) in ROLLUPS.items()}
+            ring.append(ts, {"rx_rate": rx_rate, "tx_rate": tx_rate})
+            for rollup in self.rollups[name].values():
+                rollup.add(ts, rx_rate, tx_rate)
+        self.last_uptime = uptime
+        self.last_counters = dict(counters)
+        self.current = current
+        self.samples += 1
+        return ts
+
+    def series(self, interface: str, resolution: str, start: float, end: float):
+        """返回 (时间戳, {列名: 值}) 列式数据；接口不存在时返回None"""
+        if interface not in self.raw:
+            return None
+        ring = self.raw[interface] if resolution == "1s" else self.rollups[interface][resolution].ring
+        return ring.range(start, end)
@@ -0,0 +1,261 @@
+"""
+采集与存储之间的有界队列
+采集任务只把要写入的行放入队列，由独立的存储协程批量写入数据库（在线程中执行，不阻塞事件循环），
+数据库变慢或被锁时采集节奏不受影响。队列满时的处理策略：
+    block        采集任务等待队列有空位（不丢数据，采集会被拖慢）
+    drop_oldest  丢弃最早的样本
+    coalesce     同一序列（表+目标）已有待写入的样本时用新样本替换它，否则丢弃最早的样本
+写入失败的批次转存到本地缓冲文件（services/spool.py），数据库恢复后回放
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from services.spool import Spool, Rows, SPOOL_RETRY_SECONDS
+from utils.clock import clock
+
+logger = logging.getLogger(__name__)
+
+INGEST_POLICIES = ("block", "drop_oldest", "coalesce")
+
+# 队列容量（行）
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+# 队列满时的策略
+INGEST_OVERFLOW = os.getenv("INGEST_OVERFLOW", "drop_oldest")
+# 每次写入数据库的最大行数
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+
+# 端到端延迟的指数平滑系数
+LATENCY_ALPHA = 0.1
+
+
+class Sample:
+    """一行待写入的数据；ts 为采集时间（epoch秒），用于计算端到端延迟"""
+    __slots__ = ("model", "row", "series", "ts")
+
+    def __init__(self, model, row: Dict, series: Tuple[str, str], ts: float):
+        self.model = model
+        self.row = row
+        self.series = series
+        self.ts = ts
+
+
+class IngestQueue:
+    def __init__(self, capacity: int = INGEST_QUEUE_SIZE, policy: str = INGEST_OVERFLOW):
+        if policy not in INGEST_POLICIES:
+            raise ValueError(f"未知的队列溢出策略: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.items: Deque[Sample] = deque()
+        # 序列 -> 队列中该序列最新的样本（coalesce 使用）
+        self.pending: Dict[Tuple[str, str], Sample] = {}
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+        self.closed = False
+        self.enqueued = 0
+        self.stored = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked = 0
+        self.failed = 0
+        self.high_watermark = 0
+        self.latency_ms: Optional[float] = None
+        self.latency_avg_ms: Optional[float] = None
+        self.latency_max_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    async def put(self, model, row: Dict, key: str = "", ts: Optional[float] = None):
+        """
+        放入一行；block 策略下队列满时等待。
+        存储协程取走一批后会同时唤醒所有等待的采集任务，每个任务醒来后重新检查容量，
+        仍然满时继续等待；检查与放入之间没有 await，不会有两个任务抢到同一个空位
+        """
+        sample = Sample(model, row, (model.__tablename__, key), clock.time() if ts is None else ts)
+        if self.policy == "block":
+            waited = False
+            while len(self.items) >= self.capacity and not self.closed:
+                if not waited:
+                    self.blocked += 1
+                    waited = True
+                self.not_full.clear()
+                await self.not_full.wait()
+        self.offer(sample)
+
+    def offer(self, sample: Sample):
+        """
+        不等待地放入：队列满时 drop_oldest 丢弃最早的样本，coalesce 合并同一序列的样本；
+        block 策略从不丢弃（等待由 put 完成，关闭后停止时写出的行可以超出容量）
+        """
+        if len(self.items) >= self.capacity and self.policy != "block":
+            if self.policy == "coalesce":
+                queued = self.pending.get(sample.series)
+                if queued is not None:
+                    queued.row = sample.row
+                    queued.ts = sample.ts
+                    self.coalesced += 1
+                    return
+            self._forget(self.items.popleft())
+            self.dropped += 1
+        self.items.append(sample)
+        self.pending[sample.series] = sample
+        self.enqueued += 1
+        self.high_watermark = max(self.high_watermark, len(self.items))
+        self.not_empty.set()
+
+    async def get_batch(self, limit: int = INGEST_BATCH_SIZE) -> List[Sample]:
+        """等待至少一行，取出最多 limit 行；队列已关闭且为空时返回空列表"""
+        while not self.items:
+            if self.closed:
+                return []
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        batch = [self.items.popleft() for _ in range(min(limit, len(self.items)))]
+        for sample in batch:
+            self._forget(sample)
+        self.not_full.set()
+        return batch
+
+    def _forget(self, sample: Sample):
+        if self.pending.get(sample.series) is sample:
+            del self.pending[sample.series]
+
+    def close(self):
+        """不再等待新数据：存储协程写完剩余的行后退出"""
+        self.closed = True
+        self.not_empty.set()
+        self.not_full.set()
+
+    def mark_stored(self, batch: List[Sample], now: float):
+        self.stored += len(batch)
+        latency = (now - min(sample.ts for sample in batch)) * 1000
+        self.latency_ms = latency
+        self.latency_max_ms = max(self.latency_max_ms, latency)
+        self.latency_avg_ms = latency if self.latency_avg_ms is None else (
+            self.latency_avg_ms + LATENCY_ALPHA * (latency - self.latency_avg_ms)
+        )
+
+    def mark_failed(self, batch: List[Sample]):
+        self.failed += len(batch)
+
+    def stats(self) -> Dict:
+        return {
+            "policy": self.policy,
+            "capacity": self.capacity,
+            "depth": len(self.items),
+            "highWatermark": self.high_watermark,
+            "enqueued": self.enqueued,
+            "stored": self.stored,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "blocked": self.blocked,
+            "failed": self.failed,
+            "latencyMs": {
+                "last": _round(self.latency_ms),
+                "avg": _round(self.latency_avg_ms),
+                "max": _round(self.latency_max_ms),
+            },
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 1)
+
+
+def group_rows(batch: List[Sample]) -> Rows:
+    """按模型分组，保持每个模型内的顺序"""
+    rows: Rows = {}
+    for sample in batch:
+        rows.setdefault(sample.model, []).append(sample.row)
+    return rows
+
+
+class StorageWorker:
+    """
+    持续从队列取出批次，在线程中调用 write({模型: [行]}) 写入数据库；
+    写入失败的批次转存到 spool，之后 SPOOL_RETRY_SECONDS 内直接写 spool，
+    数据库写入再次成功时回放 spool
+    """
+
+    def __init__(
+        self,
+        queue: IngestQueue,
+        write: Callable[[Rows], None],
+        spool: Optional[Spool] = None,
+        batch_size: int = INGEST_BATCH_SIZE,
+        retry_seconds: float = SPOOL_RETRY_SECONDS,
+        on_replay: Optional[Callable[[], None]] = None,
+    ):
+        self.queue = queue
+        self.write = write
+        self.spool = spool
+        # 回放后调用（回放的行时间较早，依赖这些时间段的缓存需要失效）
+        self.on_replay = on_replay
+        self.batch_size = batch_size
+        self.retry_seconds = retry_seconds
+        self.retry_at = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        if self.spool is not None:
+            try:
+                await asyncio.to_thread(self.spool.open)
+            except Exception as e:
+                logger.error(f"读取缓冲文件失败: {e}")
+        while True:
+            batch = await self.queue.get_batch(self.batch_size)
+            if not batch:
+                return
+            rows = group_rows(batch)
+            if time.monotonic() >= self.retry_at:
+                try:
+                    await asyncio.to_thread(self.write, rows)
+                    self.queue.mark_stored(batch, clock.time())
+                    if self.spool is not None and self.spool.pending:
+                        await self._replay()
+                    continue
+                except Exception as e:
+                    self.retry_at = time.monotonic() + self.retry_seconds
+                    logger.error(f"写入数据库失败: {e}")
+            await self._spool(batch, rows)
+
+    async def _spool(self, batch: List[Sample], rows: Rows):
+        try:
+            if self.spool is not None and await asyncio.to_thread(self.spool.append, rows):
+                return
+            logger.error(f"无法写入缓冲文件，丢弃{len(batch)}行")
+        except Exception as e:
+            logger.error(f"写入缓冲文件失败，丢弃{len(batch)}行: {e}")
+        self.queue.mark_failed(batch)
+
+    async def _replay(self):
+        try:
+            replayed = await asyncio.to_thread(self.spool.replay, self.write)
+            logger.info(f"数据库已恢复，已回放缓冲文件中的{replayed}行")
+        except Exception as e:
+            self.retry_at = time.monotonic() + self.retry_seconds
+            logger.error(f"回放缓冲文件失败: {e}")
+        finally:
+            # 回放失败时也可能已写入了一部分
+            if self.on_replay is not None:
+                self.on_replay()
+
+    def stats(self) -> Dict:
+        stats = self.queue.stats()
+        stats["spool"] = self.spool.stats() if self.spool is not None else None
+        return stats
+
+    async def stop(self):
+        """关闭队列并等待剩余的行写完"""
+        self.queue.close()
+        if self.task is not None:
+            await self.task
+            self.task = None
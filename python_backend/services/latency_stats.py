@@ -0,0 +1,172 @@
+"""
+网络延迟流式统计
+按目标维护环形缓冲区和对数分桶直方图，O(1) 更新，内存中直接计算
+1分钟、15分钟、1小时窗口的延迟分位数、抖动和丢包率
+"""
+import math
+from collections import deque
+from typing import Dict, List, Optional
+
+# 滑动窗口定义（名称 -> 秒）
+WINDOWS = {
+    "1m": 60,
+    "15m": 15 * 60,
+    "1h": 60 * 60,
+}
+
+
+class LogHistogram:
+    """
+    对数分桶直方图（HDR风格的紧凑分位数草图）
+    桶宽按几何级数增长，分位数相对误差不超过 precision
+    """
+
+    def __init__(self, min_value: float = 0.1, max_value: float = 60000.0, precision: float = 0.01):
+        self.min_value = min_value
+        self.growth = (1 + precision) / (1 - precision)
+        self.log_growth = math.log(self.growth)
+        self.size = int(math.ceil(math.log(max_value / min_value) / self.log_growth)) + 1
+        self.counts = [0] * self.size
+        self.total = 0
+
+    def _index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        index = int(math.log(value / self.min_value) / self.log_growth)
+        return min(index, self.size - 1)
+
+    def add(self, value: float):
+        self.counts[self._index(value)] += 1
+        self.total += 1
+
+    def remove(self, value: float):
+        index = self._index(value)
+        if self.counts[index] > 0:
+            self.counts[index] -= 1
+            self.total -= 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """返回分位数的近似值（桶的几何中点）"""
+        if self.total == 0:
+            return None
+        rank = max(1, int(math.ceil(q * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                lower = self.min_value * self.growth ** index
+                return lower * math.sqrt(self.growth)
+        return None
+
+
+class SlidingWindow:
+    """单个时间窗口：环形缓冲区 + 直方图 + 累加和"""
+
+    def __init__(self, seconds: int, max_samples: int):
+        self.seconds = seconds
+        self.max_samples = max_samples
+        self.samples = deque()  # (timestamp, latency, packet_loss, jitter)
+        self.histogram = LogHistogram()
+        self.loss_sum = 0.0
+        self.jitter_sum = 0.0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    def add(self, timestamp: float, latency: float, packet_loss: float, jitter: float):
+        if len(self.samples) >= self.max_samples:
+            self._evict()
+        self.samples.append((timestamp, latency, packet_loss, jitter))
+        self.loss_sum += packet_loss
+        self.jitter_sum += jitter
+        if latency > 0:
+            self.histogram.add(latency)
+            self.latency_sum += latency
+            self.latency_count += 1
+        self.expire(timestamp)
+
+    def expire(self, now: float):
+        threshold = now - self.seconds
+        while self.samples and self.samples[0][0] < threshold:
+            self._evict()
+
+    def _evict(self):
+        _, latency, packet_loss, jitter = self.samples.popleft()
+        self.loss_sum -= packet_loss
+        self.jitter_sum -= jitter
+        if latency > 0:
+            self.histogram.remove(latency)
+            self.latency_sum -= latency
+            self.latency_count -= 1
+
+    def summary(self) -> Dict:
+        count = len(self.samples)
+        if count == 0:
+            return {"count": 0}
+        return {
+            "count": count,
+            "avg": self.latency_sum / self.latency_count if self.latency_count else None,
+            "p50": self.histogram.quantile(0.50),
+            "p95": self.histogram.quantile(0.95),
+            "p99": self.histogram.quantile(0.99),
+            "jitter": self.jitter_sum / count,
+            "packetLoss": self.loss_sum / count,
+        }
+
+
+class TargetStats:
+    """单个目标的全部窗口统计"""
+
+    def __init__(self, sample_interval: float):
+        self.windows = {
+            name: SlidingWindow(seconds, int(seconds / sample_interval) * 2 + 1)
+            for name, seconds in WINDOWS.items()
+        }
+        self.last = None
+        # RFC 3550 风格的相邻样本抖动估计
+        self.ipdv_jitter = 0.0
+
+    def add(self, timestamp: float, latency: float, packet_loss: float, jitter: float):
+        if self.last and self.last["latency"] > 0 and latency > 0:
+            delta = abs(latency - self.last["latency"])
+            self.ipdv_jitter += (delta - self.ipdv_jitter) / 16
+        for window in self.windows.values():
+            window.add(timestamp, latency, packet_loss, jitter)
+        self.last = {
+            "timestamp": timestamp,
+            "latency": latency,
+            "packetLoss": packet_loss,
+            "jitter": jitter,
+        }
+
+    def summary(self, now: float) -> Dict:
+        windows = {}
+        for name, window in self.windows.items():
+            window.expire(now)
+            windows[name] = window.summary()
+        return {
+            "current": self.last,
+            "ipdvJitter": self.ipdv_jitter,
+            "windows": windows,
+        }
+
+
+class LatencyStats:
+    """所有延迟目标的流式统计"""
+
+    def __init__(self, sample_interval: float = 10):
+        self.sample_interval = sample_interval
+        self.targets: Dict[str, TargetStats] = {}
+
+    def add(self, target: str, timestamp: float, latency: float, packet_loss: float, jitter: float = 0):
+        stats = self.targets.get(target)
+        if stats is None:
+            stats = self.targets[target] = TargetStats(self.sample_interval)
+        stats.add(timestamp, latency, packet_loss, jitter)
+
+    def summary(self, now: float, targets: Optional[List[str]] = None) -> Dict[str, Dict]:
+        names = targets if targets else list(self.targets.keys())
+        return {
+            name: self.targets[name].summary(now)
+            for name in names
+            if name in self.targets
+        }
@@ -0,0 +1,133 @@
+"""
+采集器主节点选举
+保证多个进程（多个uvicorn worker或独立采集进程）中只有一个运行采集器：
+MySQL 使用 GET_LOCK 咨询锁，其他数据库使用文件锁。
+MySQL 的锁绑定在连接上，连接被 wait_timeout 或网络中断断开时服务器会释放锁，
+因此持锁期间定期在该连接上确认锁仍属于本连接（同时起到保活作用），失去锁时主动退为备用
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+
+from models.database import engine, DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+COLLECTOR_LOCK_FILE = os.getenv("COLLECTOR_LOCK_FILE", "./data/collector.lock")
+COLLECTOR_LOCK_NAME = "jarvis_collector"
+# 备用进程重试获取锁的间隔（秒）
+LEADER_RETRY_SECONDS = int(os.getenv("LEADER_RETRY_SECONDS", "30"))
+# 持锁期间确认锁仍然有效的间隔（秒）
+LEADER_CHECK_SECONDS = int(os.getenv("LEADER_CHECK_SECONDS", "30"))
+
+
+class LeaderLock:
+    """非阻塞的主节点锁，进程退出时自动释放"""
+
+    def __init__(self, name: str = COLLECTOR_LOCK_NAME, path: str = COLLECTOR_LOCK_FILE):
+        self.name = name
+        self.path = path
+        self.use_mysql = DATABASE_URL.startswith("mysql")
+        self._file = None
+        self._conn = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None or self._conn is not None
+
+    def acquire(self) -> bool:
+        if self.held:
+            return True
+        try:
+            return self._acquire_mysql() if self.use_mysql else self._acquire_file()
+        except Exception as e:
+            logger.error(f"获取采集器锁失败: {e}")
+            return False
+
+    def _acquire_file(self) -> bool:
+        import fcntl
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        f = open(self.path, "a+")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    def _acquire_mysql(self) -> bool:
+        # 锁绑定在连接上，持有期间保持该连接
+        conn = engine.connect()
+        if conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": self.name}).scalar() == 1:
+            self._conn = conn
+            return True
+        conn.close()
+        return False
+
+    def check(self) -> bool:
+        """确认仍持有锁；MySQL连接已断开或锁已不属于该连接时丢弃连接并返回False"""
+        if self._conn is None:
+            return self._file is not None
+        try:
+            owned = self._conn.execute(
+                text("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"), {"name": self.name}
+            ).scalar() == 1
+        except Exception as e:
+            logger.error(f"检查采集器锁失败: {e}")
+            owned = False
+        if not owned:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+        return owned
+
+    def release(self):
+        if self._file is not None:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": self.name})
+            finally:
+                self._conn.close()
+                self._conn = None
+
+
+async def wait_for_leadership(lock: LeaderLock, retry_seconds: float = LEADER_RETRY_SECONDS):
+    """等待直到获得锁：主进程退出后由备用进程接管采集"""
+    if lock.acquire():
+        return
+    logger.info("采集器锁被其他进程持有，本进程作为备用等待接管")
+    while not lock.acquire():
+        await asyncio.sleep(retry_seconds)
+
+
+async def run_as_leader(
+    lock: LeaderLock,
+    on_acquired: Callable[[], Awaitable[None]],
+    on_lost: Callable[[], Awaitable[None]],
+    retry_seconds: float = LEADER_RETRY_SECONDS,
+    check_seconds: float = LEADER_CHECK_SECONDS,
+):
+    """获得锁后调用 on_acquired，之后定期确认仍持有锁；失去锁时调用 on_lost 并重新作为备用等待"""
+    while True:
+        await wait_for_leadership(lock, retry_seconds)
+        await on_acquired()
+        while True:
+            await asyncio.sleep(check_seconds)
+            if not await asyncio.to_thread(lock.check):
+                break
+        logger.error("采集器锁已丢失（持锁的数据库连接已断开），停止采集")
+        await on_lost()
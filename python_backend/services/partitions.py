@@ -0,0 +1,128 @@
+"""
+MySQL按天分区
+时序表按 RANGE (TO_DAYS(timestamp)) 分区，每个UTC日一个分区（p20240115 存放当天数据），
+另有 pmax 兜底。定时任务提前创建未来的分区（从空的 pmax 拆分，只修改元数据），
+保留期清理直接 DROP PARTITION，不再逐行删除；按 timestamp 范围查询时MySQL只扫描涉及的分区。
+分区列必须出现在每个唯一键中，转换时主键改为 (id, timestamp)
+"""
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from models.database import engine
+
+logger = logging.getLogger(__name__)
+
+# 使用MySQL时是否按天分区
+PARTITIONING_ENABLED = (
+    os.getenv("MYSQL_PARTITIONING", "true").lower() == "true"
+    and engine.dialect.name == "mysql"
+)
+# 提前创建的分区天数
+PARTITION_AHEAD_DAYS = int(os.getenv("PARTITION_AHEAD_DAYS", "7"))
+
+MAX_PARTITION = "pmax"
+
+
+def partition_name(day: date) -> str:
+    return f"p{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> Optional[date]:
+    """分区名 -> 日期，pmax 等非天分区返回None"""
+    try:
+        return datetime.strptime(name[1:], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def day_range(first: date, last: date) -> List[date]:
+    """[first, last] 中的每一天"""
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+def days_to_add(existing: List[date], today: date, ahead_days: int) -> List[date]:
+    """已有最后一个天分区之后直到 today + ahead_days 需要新建的天"""
+    first = existing[-1] + timedelta(days=1) if existing else today
+    return day_range(first, today + timedelta(days=ahead_days))
+
+
+def _definitions(days: List[date]) -> str:
+    clauses = [
+        f"PARTITION {partition_name(day)} VALUES LESS THAN (TO_DAYS('{day + timedelta(days=1):%Y-%m-%d}'))"
+        for day in days
+    ]
+    clauses.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE")
+    return ", ".join(clauses)
+
+
+def convert_sql(table: str, days: List[date]) -> List[str]:
+    """把普通表转换为按天分区表（需要复制整张表，只在首次执行）"""
+    return [
+        f"ALTER TABLE `{table}` MODIFY `timestamp` DATETIME NOT NULL, "
+        f"DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `timestamp`)",
+        f"ALTER TABLE `{table}` PARTITION BY RANGE (TO_DAYS(`timestamp`)) ({_definitions(days)})",
+    ]
+
+
+def reorganize_sql(table: str, days: List[date]) -> str:
+    """从 pmax 拆分出新的天分区"""
+    return f"ALTER TABLE `{table}` REORGANIZE PARTITION {MAX_PARTITION} INTO ({_definitions(days)})"
+
+
+def drop_sql(table: str, days: List[date]) -> str:
+    return f"ALTER TABLE `{table}` DROP PARTITION {', '.join(partition_name(day) for day in days)}"
+
+
+class PartitionManager:
+    """维护一组时序表的天分区"""
+
+    def __init__(self, bind: Engine, tables: List[str], ahead_days: int = PARTITION_AHEAD_DAYS):
+        self.bind = bind
+        self.tables = tables
+        self.ahead_days = ahead_days
+
+    def day_partitions(self, conn, table: str) -> Optional[List[date]]:
+        """表的天分区（升序）；表未分区时返回None"""
+        names = conn.execute(text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"
+        ), {"table": table}).scalars().all()
+        if not names:
+            return None
+        return sorted(day for day in map(partition_day, names) if day is not None)
+
+    def maintain(self, today: date) -> Dict[str, int]:
+        """未分区的表转换为分区表，已分区的表补建到 today + ahead_days；返回各表新建的分区数"""
+        created = {}
+        with self.bind.connect() as conn:
+            for table in self.tables:
+                existing = self.day_partitions(conn, table)
+                if existing is None:
+                    oldest = conn.execute(text(f"SELECT MIN(`timestamp`) FROM `{table}`")).scalar()
+                    first = min(oldest.date(), today) if oldest else today
+                    days = day_range(first, today + timedelta(days=self.ahead_days))
+                    logger.info(f"转换 {table} 为按天分区表: {len(days)}个分区")
+                    for statement in convert_sql(table, days):
+                        conn.execute(text(statement))
+                else:
+                    days = days_to_add(existing, today, self.ahead_days)
+                    if days:
+                        conn.execute(text(reorganize_sql(table, days)))
+                created[table] = len(days)
+        return created
+
+    def drop_expired(self, cutoff: date) -> Dict[str, int]:
+        """删除整天都早于 cutoff 的分区，返回各表删除的分区数"""
+        dropped = {}
+        with self.bind.connect() as conn:
+            for table in self.tables:
+                days = [day for day in self.day_partitions(conn, table) or [] if day < cutoff]
+                if days:
+                    conn.execute(text(drop_sql(table, days)))
+                dropped[table] = len(days)
+        return dropped
@@ -0,0 +1,107 @@
+"""
+设备在线状态跟踪
+在内存中比较相邻两次 ARP/DHCP 快照，只产生上线 / 下线 / 信息变化事件，
+last_seen 按较粗的周期批量落库，写入量与设备变动成正比而不是与设备数 × 轮询频率成正比。
+设备连续 PRESENCE_MISSED_POLLS 次不在快照中才算下线（下线时间为最后一次出现的时间），
+ARP表抖动或一次轮询失败不会把在线区间切成两段
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# last_seen 批量落库周期（秒）
+LAST_SEEN_FLUSH_SECONDS = int(os.getenv("LAST_SEEN_FLUSH_SECONDS", "300"))
+# 连续多少次轮询不在快照中才算下线
+PRESENCE_MISSED_POLLS = int(os.getenv("PRESENCE_MISSED_POLLS", "3"))
+
+# 参与变化比较的字段（速度等实时值不触发写入）
+TRACKED_FIELDS = ("ip_address", "hostname", "device_type", "vendor")
+
+
+class PresenceDiff:
+    """一次快照比较的结果"""
+
+    def __init__(self):
+        self.joined: List[Dict] = []
+        self.left: List[Tuple[str, datetime]] = []  # (mac, 最后在线时间)
+        self.changed: List[Dict] = []
+
+    def __bool__(self):
+        return bool(self.joined or self.left or self.changed)
+
+
+class PresenceTracker:
+    """在线设备的内存快照"""
+
+    def __init__(self, flush_interval: int = LAST_SEEN_FLUSH_SECONDS, missed_polls: int = PRESENCE_MISSED_POLLS):
+        self.flush_interval = timedelta(seconds=flush_interval)
+        self.missed_polls = max(missed_polls, 1)
+        # 在线的设备（包括暂时不在快照中、还没有算作下线的设备）
+        self.present: Dict[str, Dict] = {}
+        self.last_seen: Dict[str, datetime] = {}
+        # 连续不在快照中的次数
+        self.missed: Dict[str, int] = {}
+        self.last_flush: Optional[datetime] = None
+        self.loaded = False
+
+    def load(self, devices: Iterable[Dict], now: datetime):
+        """用数据库中标记为在线的设备初始化，避免重启后产生虚假的上线事件"""
+        for device in devices:
+            mac = device["mac_address"]
+            self.present[mac] = {field: device.get(field) for field in TRACKED_FIELDS}
+            self.last_seen[mac] = device.get("last_seen") or now
+        self.missed = {}
+        self.last_flush = now
+        self.loaded = True
+
+    def diff(self, devices: Iterable[Dict], now: datetime) -> PresenceDiff:
+        """与上一次快照比较并更新内存状态"""
+        result = PresenceDiff()
+        current = {}
+        for device in devices:
+            mac = device["mac_address"]
+            current[mac] = device
+            self.last_seen[mac] = now
+            self.missed.pop(mac, None)
+            previous = self.present.get(mac)
+            if previous is None:
+                result.joined.append(device)
+            elif any(previous.get(field) != device.get(field) for field in TRACKED_FIELDS):
+                result.changed.append(device)
+
+        missing = {}
+        for mac, previous in self.present.items():
+            if mac in current:
+                continue
+            missed = self.missed.get(mac, 0) + 1
+            if missed < self.missed_polls:
+                self.missed[mac] = missed
+                missing[mac] = previous
+            else:
+                self.missed.pop(mac, None)
+                result.left.append((mac, self.last_seen.pop(mac, now)))
+
+        self.present = {
+            mac: {field: device.get(field) for field in TRACKED_FIELDS}
+            for mac, device in current.items()
+        }
+        self.present.update(missing)
+        return result
+
+    def seen(self) -> List[str]:
+        """最近一次快照中出现的设备（批量更新 last_seen 用）"""
+        return [mac for mac in self.present if mac not in self.missed]
+
+    def reset(self):
+        """写库失败时丢弃内存状态，下次轮询从数据库重新加载"""
+        self.present = {}
+        self.last_seen = {}
+        self.missed = {}
+        self.last_flush = None
+        self.loaded = False
+
+    def flush_due(self, now: datetime) -> bool:
+        return self.last_flush is None or now - self.last_flush >= self.flush_interval
+
+    def mark_flushed(self, now: datetime):
+        self.last_flush = now
@@ -0,0 +1,123 @@
+"""
+分批清理过期数据
+每批按 timestamp 索引取出最多 RETENTION_BATCH_ROWS 个过期行的id并按主键删除，每批一个短事务，
+批次之间让出事件循环，采集器的写入可以在批次之间提交；各表轮流删除，每次运行有时间预算，
+未删完的部分留到下次。SQLite（auto_vacuum=INCREMENTAL，见 models/database.py）删除后
+分批执行 incremental_vacuum 把空闲页还给文件系统，最后执行 PRAGMA optimize
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.engine import Engine
+
+# 每批删除的行数
+RETENTION_BATCH_ROWS = int(os.getenv("RETENTION_BATCH_ROWS", "2000"))
+# 每次清理的时间预算（秒）
+RETENTION_TIME_BUDGET = float(os.getenv("RETENTION_TIME_BUDGET", "30"))
+# 批次之间的暂停（毫秒）
+RETENTION_PAUSE_MS = float(os.getenv("RETENTION_PAUSE_MS", "50"))
+# 每次 incremental_vacuum 回收的页数
+SQLITE_VACUUM_PAGES = int(os.getenv("SQLITE_VACUUM_PAGES", "2000"))
+
+
+class Retention:
+    """按保留期分批删除一组时序表的过期行"""
+
+    def __init__(
+        self,
+        bind: Engine,
+        models: List,
+        batch_rows: int = RETENTION_BATCH_ROWS,
+        time_budget: float = RETENTION_TIME_BUDGET,
+        pause_ms: float = RETENTION_PAUSE_MS,
+        vacuum_pages: int = SQLITE_VACUUM_PAGES,
+    ):
+        self.bind = bind
+        self.models = models
+        self.batch_rows = batch_rows
+        self.time_budget = time_budget
+        self.pause = pause_ms / 1000
+        self.vacuum_pages = vacuum_pages
+        self.sqlite = bind.dialect.name == "sqlite"
+        self.last_report: Optional[Dict] = None
+
+    def delete_batch(self, model, threshold: datetime) -> Tuple[int, float]:
+        """删除一批早于 threshold 的行，返回 (行数, 写锁持有毫秒数)"""
+        table = model.__table__
+        with self.bind.connect() as conn:
+            ids = conn.execute(
+                select(table.c.id).where(table.c.timestamp < threshold)
+                .order_by(table.c.timestamp).limit(self.batch_rows)
+            ).scalars().all()
+            if not ids:
+                return 0, 0.0
+            started = time.perf_counter()
+            conn.execute(delete(table).where(table.c.id.in_(ids)))
+            conn.commit()
+            return len(ids), (time.perf_counter() - started) * 1000
+
+    def vacuum_step(self) -> Tuple[int, float]:
+        """SQLite：回收最多 vacuum_pages 个空闲页，返回 (回收的字节数, 写锁持有毫秒数)"""
+        with self.bind.connect() as conn:
+            page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+            if not conn.exec_driver_sql("PRAGMA freelist_count").scalar():
+                return 0, 0.0
+            before = conn.exec_driver_sql("PRAGMA page_count").scalar()
+            started = time.perf_counter()
+            # pysqlite 的 execute 只单步执行一次（只回收一页），executescript 会执行到结束
+            conn.connection.dbapi_connection.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages});")
+            lock_ms = (time.perf_counter() - started) * 1000
+            after = conn.exec_driver_sql("PRAGMA page_count").scalar()
+            return (before - after) * page_size, lock_ms
+
+    def optimize(self):
+        with self.bind.connect() as conn:
+            conn.exec_driver_sql("PRAGMA optimize")
+
+    async def run(self, threshold: datetime) -> Dict:
+        """删除早于 threshold 的行（各表每轮一批），返回删除行数、回收字节数和持锁时间"""
+        started = time.monotonic()
+        deadline = started + self.time_budget
+        deleted = {model.__tablename__: 0 for model in self.models}
+        lock_total = lock_max = 0.0
+        batches = 0
+        pending = list(self.models)
+        while pending and time.monotonic() < deadline:
+            for model in list(pending):
+                count, lock_ms = await asyncio.to_thread(self.delete_batch, model, threshold)
+                deleted[model.__tablename__] += count
+                if count:
+                    batches += 1
+                    lock_total += lock_ms
+                    lock_max = max(lock_max, lock_ms)
+                if count < self.batch_rows:
+                    pending.remove(model)
+                await asyncio.sleep(self.pause)
+                if time.monotonic() >= deadline:
+                    break
+
+        reclaimed = 0
+        if self.sqlite:
+            while time.monotonic() < deadline:
+                freed, lock_ms = await asyncio.to_thread(self.vacuum_step)
+                if not freed:
+                    break
+                reclaimed += freed
+                lock_total += lock_ms
+                lock_max = max(lock_max, lock_ms)
+                await asyncio.sleep(self.pause)
+            await asyncio.to_thread(self.optimize)
+
+        self.last_report = {
+            "deleted": deleted,
+            "batches": batches,
+            "complete": not pending,
+            "reclaimedBytes": reclaimed,
+            "lockMs": {"total": round(lock_total, 1), "max": round(lock_max, 1)},
+            "durationMs": round((time.monotonic() - started) * 1000, 1),
+        }
+        return self.last_report
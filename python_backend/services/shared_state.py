@@ -0,0 +1,62 @@
+"""
+采集进程与API进程之间的共享状态
+采集器定期把内存中的派生状态（最新样本、延迟统计、告警）原子替换写入快照文件，
+不运行采集器的API进程按文件修改时间缓存读取；内存时序窗口不共享，历史查询回退到数据库
+"""
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import orjson
+
+COLLECTOR_STATE_FILE = os.getenv("COLLECTOR_STATE_FILE", "./data/collector_state.json")
+# 快照发布间隔（秒）
+STATE_PUBLISH_SECONDS = int(os.getenv("STATE_PUBLISH_SECONDS", "5"))
+# 快照超过该时长未更新视为采集器已停止
+STATE_STALE_SECONDS = 60
+
+
+class SharedState:
+    """快照文件的写入（采集进程）与缓存读取（API进程）"""
+
+    def __init__(self, path: str = COLLECTOR_STATE_FILE, stale_seconds: float = STATE_STALE_SECONDS):
+        self.path = path
+        self.stale_seconds = stale_seconds
+        self._mtime: Optional[float] = None
+        self._snapshot: Optional[Dict] = None
+
+    def publish(self, snapshot: Dict):
+        snapshot = dict(snapshot, publishedAt=time.time(), pid=os.getpid())
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(snapshot, option=orjson.OPT_NON_STR_KEYS))
+        # 原子替换，读取方只会看到完整的旧快照或新快照
+        os.replace(tmp_path, self.path)
+
+    def read(self) -> Optional[Dict]:
+        """读取最新快照；文件不存在或已过期返回None"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            with open(self.path, "rb") as f:
+                self._snapshot = orjson.loads(f.read())
+            self._mtime = mtime
+        if time.time() - self._snapshot.get("publishedAt", 0) > self.stale_seconds:
+            return None
+        return self._snapshot
+
+    def latest(self, table: str):
+        """快照中某表的最新样本，格式与 DataCollector.latest 相同"""
+        snapshot = self.read()
+        cached = snapshot["latest"].get(table) if snapshot else None
+        if not cached:
+            return None
+        timestamp, data = cached
+        return datetime.fromisoformat(timestamp), data
+
+
+shared_state = SharedState()
@@ -0,0 +1,191 @@
+"""
+数据库不可用时的本地写入缓冲（spool）
+写入数据库失败的批次追加到本地文件，数据库恢复后按大批量回放；回放进度记录在 .offset 文件中，
+回放中途退出后从上次提交的位置继续，全部回放后删除文件。
+帧格式：uint32 负载长度 + uint32 负载CRC32 + 负载（orjson: {"table": 表名, "rows": [...]})，
+崩溃时写了一半的尾部帧通过长度/校验识别并截掉
+"""
+import logging
+import mmap
+import os
+import struct
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import DateTime
+
+from models.database import Base
+
+logger = logging.getLogger(__name__)
+
+# 缓冲文件路径
+SPOOL_FILE = os.getenv("SPOOL_FILE", "./data/ingest.spool")
+# 缓冲文件大小上限（MB），超过后新的行被丢弃
+SPOOL_MAX_MB = float(os.getenv("SPOOL_MAX_MB", "64"))
+# 写入失败后直接写缓冲、不再尝试数据库的时长（秒）
+SPOOL_RETRY_SECONDS = float(os.getenv("SPOOL_RETRY_SECONDS", "30"))
+# 回放时每个事务的行数
+SPOOL_REPLAY_ROWS = int(os.getenv("SPOOL_REPLAY_ROWS", "5000"))
+
+HEADER = struct.Struct("<II")
+
+# 表名 -> 模型
+MODELS = {mapper.class_.__tablename__: mapper.class_ for mapper in Base.registry.mappers}
+
+Rows = Dict[type, List[Dict]]
+
+
+def encode_frame(table: str, rows: List[Dict]) -> bytes:
+    payload = orjson.dumps({"table": table, "rows": rows})
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(data, offset: int = 0) -> Iterator[Tuple[int, Dict]]:
+    """逐帧读取，产出 (帧结束位置, 帧内容)；遇到不完整或校验失败的帧即停止"""
+    while offset + HEADER.size <= len(data):
+        length, crc = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + length
+        if end > len(data):
+            return
+        payload = data[offset + HEADER.size:end]
+        if zlib.crc32(payload) != crc:
+            return
+        yield end, orjson.loads(payload)
+        offset = end
+
+
+def _datetime_columns(model) -> List[str]:
+    return [column.key for column in model.__table__.columns if isinstance(column.type, DateTime)]
+
+
+DATETIME_COLUMNS = {table: _datetime_columns(model) for table, model in MODELS.items()}
+
+
+def restore(table: str, row: Dict) -> Dict:
+    """orjson 把时间写成ISO字符串，回放时还原为datetime"""
+    for key in DATETIME_COLUMNS[table]:
+        value = row.get(key)
+        if isinstance(value, str):
+            row[key] = datetime.fromisoformat(value)
+    return row
+
+
+class Spool:
+    def __init__(self, path: str = SPOOL_FILE, max_bytes: int = int(SPOOL_MAX_MB * 1024 * 1024)):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.max_bytes = max_bytes
+        # 文件大小、已回放到的位置、待回放行数
+        self.size = 0
+        self.offset = 0
+        self.rows = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.corrupt_bytes = 0
+
+    @property
+    def pending(self) -> bool:
+        return self.size > self.offset
+
+    def open(self):
+        """读取上次运行留下的缓冲：恢复回放位置，统计待回放行数，截掉不完整的尾部帧"""
+        if not os.path.exists(self.path):
+            return
+        self.size = os.path.getsize(self.path)
+        try:
+            with open(self.offset_path) as f:
+                self.offset = min(int(f.read().strip() or 0), self.size)
+        except (FileNotFoundError, ValueError):
+            self.offset = 0
+        end = self.offset
+        if self.size > self.offset:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for end, frame in read_frames(data, self.offset):
+                    self.rows += len(frame["rows"])
+        if end < self.size:
+            self.corrupt_bytes += self.size - end
+            logger.warning(f"缓冲文件尾部有{self.size - end}字节不完整，已截掉")
+            os.truncate(self.path, end)
+            self.size = end
+        if self.pending:
+            logger.info(f"缓冲文件中有{self.rows}行待回放")
+
+    def append(self, rows: Rows) -> bool:
+        """追加一个批次并落盘；超过大小上限时丢弃并返回False"""
+        frames = b"".join(encode_frame(model.__tablename__, values) for model, values in rows.items())
+        count = sum(len(values) for values in rows.values())
+        if self.size + len(frames) > self.max_bytes:
+            self.dropped += count
+            return False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(frames)
+            f.flush()
+            os.fsync(f.fileno())
+        self.size += len(frames)
+        self.rows += count
+        self.spooled += count
+        return True
+
+    def replay(self, write: Callable[[Rows], None], batch_rows: int = SPOOL_REPLAY_ROWS) -> int:
+        """
+        按每批约 batch_rows 行调用 write 写入数据库，每批成功后记录回放位置；
+        write 抛出异常时停止（已提交的批次不会重复回放），全部完成后删除缓冲文件
+        """
+        if not self.pending:
+            return 0
+        replayed = 0
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            groups: Rows = {}
+            count = 0
+            for end, frame in read_frames(data, self.offset):
+                table = frame["table"]
+                groups.setdefault(MODELS[table], []).extend(restore(table, row) for row in frame["rows"])
+                count += len(frame["rows"])
+                if count >= batch_rows:
+                    write(groups)
+                    self._advance(end, count)
+                    replayed += count
+                    groups = {}
+                    count = 0
+            if groups:
+                write(groups)
+                self._advance(end, count)
+                replayed += count
+        self._reset()
+        return replayed
+
+    def _advance(self, end: int, count: int):
+        self.offset = end
+        self.rows -= count
+        self.replayed += count
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(end))
+        os.replace(tmp_path, self.offset_path)
+
+    def _reset(self):
+        for path in (self.path, self.offset_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.size = 0
+        self.offset = 0
+        self.rows = 0
+
+    def stats(self) -> Dict:
+        return {
+            "bytes": self.size - self.offset,
+            "maxBytes": self.max_bytes,
+            "rows": self.rows,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "dropped": self.dropped,
+            "corruptBytes": self.corrupt_bytes,
+        }
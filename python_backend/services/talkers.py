@@ -0,0 +1,189 @@
+"""
+基于conntrack的流量大户统计
+逐行解析连接跟踪表，与上次读数比较得到每个连接的字节增量，按 (源, 目的, 协议)、源、目的
+三个维度汇总后送入每分钟一个的 Space-Saving 摘要（计数器数量固定），
+查询时合并窗口内的分钟槽得到 1分钟/15分钟/1小时 的Top N
+"""
+import heapq
+import os
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# 是否采集连接跟踪表
+CONNTRACK_ENABLED = os.getenv("CONNTRACK_ENABLED", "true").lower() == "true"
+# 采集间隔（秒）
+CONNTRACK_INTERVAL = int(os.getenv("CONNTRACK_INTERVAL", "30"))
+# 每个分钟槽每个维度保留的计数器数量
+TALKERS_CAPACITY = int(os.getenv("TALKERS_CAPACITY", "256"))
+
+CONNTRACK_COMMAND = "cat /proc/net/nf_conntrack 2>/dev/null || conntrack -L 2>/dev/null"
+
+TALKER_WINDOWS = {
+    "1m": 60,
+    "15m": 900,
+    "1h": 3600,
+}
+
+SLOT_SECONDS = 60
+
+GROUPS = ("pair", "src", "dst")
+
+
+def parse_conntrack_line(line: str) -> Optional[Tuple[tuple, str, str, str, float]]:
+    """
+    解析一行 /proc/net/nf_conntrack 或 conntrack -L 输出
+    返回 (连接标识, 源, 目的, 协议, 双向字节数)；没有字节计数（未开启nf_conntrack_acct）时返回None
+    """
+    tokens = line.split()
+    if len(tokens) < 4:
+        return None
+    proto = tokens[2] if tokens[0] in ("ipv4", "ipv6") else tokens[0]
+    src = dst = sport = dport = None
+    total = 0.0
+    has_bytes = False
+    for token in tokens:
+        key, sep, value = token.partition("=")
+        if not sep:
+            continue
+        if key == "src":
+            if src is None:
+                src = value
+        elif key == "dst":
+            if dst is None:
+                dst = value
+        elif key == "sport":
+            if sport is None:
+                sport = value
+        elif key == "dport":
+            if dport is None:
+                dport = value
+        elif key == "bytes":
+            total += float(value)
+            has_bytes = True
+    if src is None or dst is None or not has_bytes:
+        return None
+    return (proto, src, sport, dst, dport), src, dst, proto, total
+
+
+class SpaceSaving:
+    """
+    Space-Saving 重流量摘要：最多 capacity 个计数器，新键替换最小的计数器并继承其计数，
+    计数的高估量不超过记录的 error；最小计数器用惰性删除的最小堆查找
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[tuple, float] = {}
+        self.errors: Dict[tuple, float] = {}
+        self.flows: Dict[tuple, int] = {}
+        self.heap: List[Tuple[float, tuple]] = []
+
+    def add(self, key: tuple, weight: float, flows: int = 0):
+        if key in self.counts:
+            self.counts[key] += weight
+            self.flows[key] += flows
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0.0
+            self.flows[key] = flows
+        else:
+            while True:
+                count, victim = heapq.heappop(self.heap)
+                if self.counts.get(victim) == count:
+                    break
+            del self.counts[victim], self.errors[victim], self.flows[victim]
+            self.counts[key] = count + weight
+            self.errors[key] = count
+            self.flows[key] = flows
+        heapq.heappush(self.heap, (self.counts[key], key))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+
+class FlowDeltas:
+    """连接级字节计数 -> 两次读数之间的增量；第一次读取只建立基线"""
+
+    def __init__(self):
+        self.previous: Dict[tuple, float] = {}
+        self.current: Dict[tuple, float] = {}
+        self.primed = False
+        self.groups: Dict[str, Dict[tuple, List[float]]] = {group: {} for group in GROUPS}
+
+    def observe(self, flow: Tuple[tuple, str, str, str, float]):
+        conn, src, dst, proto, total = flow
+        self.current[conn] = total
+        last = self.previous.get(conn)
+        new_flow = last is None
+        delta = total if new_flow else total - last
+        if delta < 0:
+            delta = total  # 连接标识被复用
+        if not self.primed or (delta <= 0 and not new_flow):
+            return
+        for group, key in (("pair", (src, dst, proto)), ("src", (src,)), ("dst", (dst,))):
+            acc = self.groups[group].setdefault(key, [0.0, 0])
+            acc[0] += delta
+            acc[1] += new_flow
+
+    def commit(self) -> Dict[str, Dict[tuple, List[float]]]:
+        """结束一次读取，返回各维度的 {键: [字节增量, 新连接数]}"""
+        groups = self.groups if self.primed else {group: {} for group in GROUPS}
+        self.previous = self.current
+        self.current = {}
+        self.primed = True
+        self.groups = {group: {} for group in GROUPS}
+        return groups
+
+    def abort(self):
+        """读取中断：丢弃本次的部分结果"""
+        self.current = {}
+        self.groups = {group: {} for group in GROUPS}
+
+
+class TopTalkers:
+    """按分钟槽保存各维度的 Space-Saving 摘要，最多保留最长窗口所需的槽"""
+
+    def __init__(self, capacity: int = TALKERS_CAPACITY, slot_seconds: int = SLOT_SECONDS):
+        self.capacity = capacity
+        self.slot_seconds = slot_seconds
+        max_window = max(TALKER_WINDOWS.values())
+        self.slots: Deque[Tuple[float, Dict[str, SpaceSaving]]] = deque(maxlen=max_window // slot_seconds + 1)
+
+    def add(self, ts: float, groups: Dict[str, Dict[tuple, List[float]]]):
+        slot_start = ts - ts % self.slot_seconds
+        if not self.slots or self.slots[-1][0] != slot_start:
+            self.slots.append((slot_start, {group: SpaceSaving(self.capacity) for group in GROUPS}))
+        summaries = self.slots[-1][1]
+        for group, entries in groups.items():
+            summary = summaries[group]
+            # 大的先加入，减少被后来的小键替换的机会
+            for key, (weight, flows) in sorted(entries.items(), key=lambda item: item[1][0], reverse=True):
+                summary.add(key, weight, flows)
+
+    def top(self, now: float, window: str, group: str = "pair", limit: int = 20) -> List[Dict]:
+        """窗口内合并后的Top N（窗口精度为一个分钟槽）"""
+        seconds = TALKER_WINDOWS[window]
+        counts: Dict[tuple, float] = {}
+        errors: Dict[tuple, float] = {}
+        flows: Dict[tuple, int] = {}
+        for slot_start, summaries in self.slots:
+            if slot_start + self.slot_seconds <= now - seconds:
+                continue
+            summary = summaries[group]
+            for key, count in summary.counts.items():
+                counts[key] = counts.get(key, 0.0) + count
+                errors[key] = errors.get(key, 0.0) + summary.errors[key]
+                flows[key] = flows.get(key, 0) + summary.flows[key]
+        ranked = heapq.nlargest(limit, counts.items(), key=lambda item: item[1])
+        result = []
+        for key, count in ranked:
+            entry = dict(zip(("src", "dst", "proto") if group == "pair" else (group,), key))
+            entry.update(bytes=count, rate=count / seconds, flows=flows[key], error=errors[key])
+            result.append(entry)
+        return result
+
+    def summary(self, now: float, limit: int) -> Dict[str, Dict[str, List[Dict]]]:
+        return {
+            window: {group: self.top(now, window, group, limit) for group in GROUPS}
+            for window in TALKER_WINDOWS
+        }
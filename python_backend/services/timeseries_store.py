@@ -0,0 +1,190 @@
+"""
+内存列式时序存储
+每个指标使用固定容量的 array 列（时间戳 + 各数值列）组成环形缓冲区，
+内存占用 = 容量 × (列数 + 1) × 8 字节，与运行时长无关
+"""
+import os
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 内存中保留的时长（小时）
+MEMORY_WINDOW_HOURS = float(os.getenv("MEMORY_WINDOW_HOURS", "6"))
+
+
+def to_epoch(dt: datetime) -> float:
+    """UTC naive datetime -> epoch秒"""
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def from_epoch(ts: float) -> datetime:
+    """epoch秒 -> UTC naive datetime"""
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(tzinfo=None)
+
+
+class TimeSeriesRing:
+    """固定容量的列式环形缓冲区，时间戳单调递增"""
+
+    def __init__(self, columns: Sequence[str], capacity: int):
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = {name: array('d', bytes(8 * capacity)) for name in self.columns}
+        self.head = 0  # 最旧样本的物理位置
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.capacity * 8 * (len(self.columns) + 1)
+
+    def append(self, timestamp: float, row: Dict[str, float]):
+        if self.count and timestamp < self._ts(self.count - 1):
+            return  # 丢弃乱序样本，保证时间戳有序
+        if self.count < self.capacity:
+            pos = (self.head + self.count) % self.capacity
+            self.count += 1
+        else:
+            pos = self.head
+            self.head = (self.head + 1) % self.capacity
+        self.timestamps[pos] = timestamp
+        for name in self.columns:
+            value = row.get(name)
+            self.values[name][pos] = float(value) if value is not None else 0.0
+
+    def _ts(self, index: int) -> float:
+        return self.timestamps[(self.head + index) % self.capacity]
+
+    def oldest(self) -> Optional[float]:
+        return self._ts(0) if self.count else None
+
+    def _lower_bound(self, timestamp: float) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, start: float, end: float) -> Tuple[array, Dict[str, array]]:
+        """返回 [start, end) 范围内的列切片（连续内存拷贝）"""
+        first = self._lower_bound(start)
+        last = self._lower_bound(end)
+        return self._take(first, last)
+
+    def _take(self, first: int, last: int) -> Tuple[array, Dict[str, array]]:
+        if first >= last:
+            return array('d'), {name: array('d') for name in self.columns}
+        begin = (self.head + first) % self.capacity
+        end = begin + (last - first)
+        if end <= self.capacity:
+            cut = lambda col: col[begin:end]
+        else:
+            wrap = end - self.capacity
+            cut = lambda col: col[begin:] + col[:wrap]
+        return cut(self.timestamps), {name: cut(col) for name, col in self.values.items()}
+
+
+def bucket_series(
+    timestamps: Sequence[float],
+    columns: Dict[str, Sequence[float]],
+    start: float,
+    width: float,
+    buckets: int,
+    aggregations: Dict[str, str],
+) -> List[Tuple[float, Dict[str, float]]]:
+    """
+    将列式数据按固定宽度分桶聚合
+    aggregations: 列名 -> "mean" | "last" | "max"
+    返回非空桶的 (桶起始时间, {列名: 值}) 列表
+
+    不引入numpy，按整列批量计算：timestamps 按时间升序（内存环形缓冲区、按 timestamp 排序的
+    数据库查询和归档都满足），先对整个时间列二分出所有桶边界（每个桶一次 bisect），
+    再对每个桶的列切片调用内置的 sum / max 归约，不逐个样本执行Python代码
+    """
+    bounds = [bisect_left(timestamps, start + index * width) for index in range(buckets + 1)]
+
+    result = []
+    for index in range(buckets):
+        lo, hi = bounds[index], bounds[index + 1]
+        if lo == hi:
+            continue
+        row = {}
+        for name, agg in aggregations.items():
+            col = columns[name]
+            if agg == "mean":
+                row[name] = sum(col[lo:hi]) / (hi - lo)
+            elif agg == "last":
+                row[name] = col[hi - 1]
+            else:
+                row[name] = max(col[lo:hi])
+        result.append((start + index * width, row))
+    return result
+
+
+def interpolate_gaps(
+    buckets: List[Tuple[float, Dict[str, float]]],
+    width: float,
+    max_gap: float,
+) -> List[Tuple[float, Dict[str, float]]]:
+    """
+    对压缩存储造成的空桶做线性插值
+    相邻非空桶间隔不超过 max_gap 时补齐中间的桶，更长的缺口视为真实缺失
+    """
+    if len(buckets) < 2:
+        return buckets
+    result = [buckets[0]]
+    for (t0, row0), (t1, row1) in zip(buckets, buckets[1:]):
+        gap = t1 - t0
+        if width < gap <= max_gap + width:
+            steps = int(round(gap / width))
+            for step in range(1, steps):
+                ratio = step / steps
+                result.append((t0 + step * width, {
+                    name: row0[name] + (row1[name] - row0[name]) * ratio
+                    for name in row0
+                }))
+        result.append((t1, row1))
+    return result
+
+
+def rows_to_columns(rows: Iterable[Tuple], names: Sequence[str]) -> Tuple[List[float], Dict[str, List[float]]]:
+    """把数据库行 (timestamp, col1, col2, ...) 转换为列式数据"""
+    timestamps = []
+    columns = {name: [] for name in names}
+    for row in rows:
+        timestamps.append(to_epoch(row[0]))
+        for name, value in zip(names, row[1:]):
+            columns[name].append(value if value is not None else 0.0)
+    return timestamps, columns
+
+
+class TimeSeriesStore:
+    """按指标管理多个环形缓冲区"""
+
+    def __init__(self, window_hours: float = MEMORY_WINDOW_HOURS):
+        self.window_seconds = window_hours * 3600
+        self.rings: Dict[str, TimeSeriesRing] = {}
+
+    def register(self, metric: str, columns: Sequence[str], interval: float):
+        capacity = int(self.window_seconds / interval) + 1
+        self.rings[metric] = TimeSeriesRing(columns, capacity)
+
+    def append(self, metric: str, timestamp: float, row: Dict[str, float]):
+        ring = self.rings.get(metric)
+        if ring is not None:
+            ring.append(timestamp, row)
+
+    def covered_from(self, metric: str) -> Optional[float]:
+        """内存中最旧样本的时间，早于该时间的数据需从数据库读取"""
+        ring = self.rings.get(metric)
+        return ring.oldest() if ring is not None else None
+
+    def range(self, metric: str, start: float, end: float) -> Tuple[array, Dict[str, array]]:
+        return self.rings[metric].range(start, end)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(ring.nbytes for ring in self.rings.values())
@@ -0,0 +1,144 @@
+"""
+流量用量累计
+路由器的字节计数器在重启时归零：每次采样与上次读数比较，读数变小视为计数器重置，
+重置后的读数本身就是重启以来的增量。增量累加到按本地日/月划分的用量表，
+计数器最后读数与用量在同一事务中定期写入（在线程中执行，写入期间的增量记入下一批），
+采集器重启后从最后读数继续，不丢失中间的流量
+"""
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.database import UsageDaily, UsageMonthly, UsageCounter
+
+# 账期按本地日历划分（默认东八区）
+USAGE_UTC_OFFSET_HOURS = float(os.getenv("USAGE_UTC_OFFSET_HOURS", "8"))
+# 用量写入数据库的间隔（秒）
+USAGE_FLUSH_SECONDS = int(os.getenv("USAGE_FLUSH_SECONDS", "60"))
+
+# 一次写入：((日, 月, 类型, 名称) -> [rx, tx], (类型, 名称) -> 计数器状态)
+UsageBatch = Tuple[Dict[Tuple[date, date, str, str], List[float]], Dict[Tuple[str, str], Dict]]
+
+
+def local_periods(now: datetime, offset_hours: float = USAGE_UTC_OFFSET_HOURS) -> Tuple[date, date]:
+    """UTC时间 -> (本地日期, 本地月份第一天)"""
+    day = (now + timedelta(hours=offset_hours)).date()
+    return day, day.replace(day=1)
+
+
+def stitch(last: float, raw: float) -> float:
+    """两次计数器读数之间的增量，读数变小视为计数器已重置"""
+    return raw - last if raw >= last else raw
+
+
+class Counter:
+    __slots__ = ("last_rx", "last_tx", "total_rx", "total_tx", "dirty")
+
+    def __init__(self, last_rx: float, last_tx: float, total_rx: float = 0.0, total_tx: float = 0.0):
+        self.last_rx = last_rx
+        self.last_tx = last_tx
+        self.total_rx = total_rx
+        self.total_tx = total_tx
+        self.dirty = True
+
+
+class UsageAccounting:
+    """内存中累计增量，flush 时以自增更新写入日/月用量表"""
+
+    def __init__(self, flush_seconds: float = USAGE_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self.counters: Dict[Tuple[str, str], Counter] = {}
+        # (日, 月, 类型, 名称) -> [rx, tx]
+        self.pending: Dict[Tuple[date, date, str, str], List[float]] = {}
+        self.loaded = False
+        self.last_flush: Optional[datetime] = None
+
+    def load(self, rows: Iterable[Dict], now: datetime):
+        """从 usage_counters 恢复上次的读数"""
+        for row in rows:
+            counter = Counter(row["last_rx"], row["last_tx"], row["total_rx"], row["total_tx"])
+            counter.dirty = False
+            self.counters[(row["kind"], row["name"])] = counter
+        self.loaded = True
+        self.last_flush = now
+
+    def add(self, kind: str, name: str, rx: float, tx: float, now: datetime) -> Tuple[float, float]:
+        """提交一次计数器读数，返回本次计入的 (rx, tx) 增量；首次出现的计数器只作为基线"""
+        key = (kind, name)
+        counter = self.counters.get(key)
+        if counter is None:
+            self.counters[key] = Counter(rx, tx)
+            return 0.0, 0.0
+        delta_rx = stitch(counter.last_rx, rx)
+        delta_tx = stitch(counter.last_tx, tx)
+        counter.last_rx = rx
+        counter.last_tx = tx
+        counter.total_rx += delta_rx
+        counter.total_tx += delta_tx
+        counter.dirty = True
+        if delta_rx or delta_tx:
+            day, month = local_periods(now)
+            acc = self.pending.setdefault((day, month, kind, name), [0.0, 0.0])
+            acc[0] += delta_rx
+            acc[1] += delta_tx
+        return delta_rx, delta_tx
+
+    def flush_due(self, now: datetime) -> bool:
+        return self.last_flush is None or (now - self.last_flush).total_seconds() >= self.flush_seconds
+
+    def take(self, now: datetime) -> UsageBatch:
+        """取出待写入的增量和有变化的计数器状态，之后的增量记入下一批；写入失败时调用 restore"""
+        pending, self.pending = self.pending, {}
+        counters = {}
+        for key, counter in self.counters.items():
+            if not counter.dirty:
+                continue
+            counters[key] = {
+                "last_rx": counter.last_rx,
+                "last_tx": counter.last_tx,
+                "total_rx": counter.total_rx,
+                "total_tx": counter.total_tx,
+            }
+            counter.dirty = False
+        self.last_flush = now
+        return pending, counters
+
+    def restore(self, batch: UsageBatch):
+        """写入失败：增量放回，计数器重新标记为待写入"""
+        pending, counters = batch
+        for key, (rx, tx) in pending.items():
+            acc = self.pending.setdefault(key, [0.0, 0.0])
+            acc[0] += rx
+            acc[1] += tx
+        for key in counters:
+            if key in self.counters:
+                self.counters[key].dirty = True
+
+
+def write_usage(db: Session, batch: UsageBatch, now: datetime):
+    """把一批增量和计数器状态写入会话（由调用方提交）；只访问 batch，可以在线程中执行"""
+    pending, counters = batch
+    for (day, month, kind, name), (rx, tx) in pending.items():
+        _increment(db, UsageDaily, day, kind, name, rx, tx, now)
+        _increment(db, UsageMonthly, month, kind, name, rx, tx, now)
+    for (kind, name), state in counters.items():
+        values = dict(state, updated_at=now)
+        updated = db.query(UsageCounter).filter(
+            UsageCounter.kind == kind, UsageCounter.name == name
+        ).update(values, synchronize_session=False)
+        if not updated:
+            db.add(UsageCounter(kind=kind, name=name, **values))
+
+
+def _increment(db: Session, model, period: date, kind: str, name: str, rx: float, tx: float, now: datetime):
+    updated = db.query(model).filter(
+        model.period == period, model.kind == kind, model.name == name
+    ).update({
+        model.rx_bytes: model.rx_bytes + rx,
+        model.tx_bytes: model.tx_bytes + tx,
+        model.updated_at: now,
+    }, synchronize_session=False)
+    if not updated:
+        db.add(model(period=period, kind=kind, name=name, rx_bytes=rx, tx_bytes=tx, updated_at=now))
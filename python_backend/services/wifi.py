@@ -0,0 +1,113 @@
+"""
+无线终端统计
+每个采集周期一次 station dump 得到所有射频上所有终端的累计计数，在内存中与上次读数
+比较得到增量（终端重新关联导致计数归零时按重置处理），并按MAC与在线设备关联；
+只有终端有流量、信号明显变化或超过心跳间隔时才写入一行，空闲终端不产生重复行
+"""
+from typing import Dict, List, Optional, Tuple
+
+from services.usage import stitch
+
+# 累计计数字段
+STATION_COUNTERS = ("rx_bytes", "tx_bytes", "tx_packets", "tx_retries", "tx_failed", "rx_duration", "tx_duration")
+
+# 信号变化超过该值（dB）时写入
+SIGNAL_CHANGE_DB = 3
+# 空闲终端的写入间隔（秒）
+STATION_HEARTBEAT_SECONDS = 300
+
+
+def signal_percent(dbm: float) -> float:
+    """RSSI(dBm) -> 0~100，-50dBm及以上为100，-100dBm为0"""
+    return max(0.0, min(100.0, 2 * (dbm + 100)))
+
+
+class StationTracker:
+    def __init__(self):
+        self.counters: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self.stored: Dict[Tuple[str, str], Tuple[float, Optional[float]]] = {}
+        self.last_ts: Optional[float] = None
+        # 最近一次的终端列表（已关联设备信息和速率），供API使用
+        self.stations: List[Dict] = []
+
+    def update(self, stations: List[Dict], ts: float, devices: Dict[str, Dict]) -> Tuple[List[Dict], Dict[str, float]]:
+        """
+        提交一次 station dump 结果
+        返回 (需要写入的行, 汇总的连接质量字段)；devices 为 MAC -> 在线设备信息
+        """
+        elapsed = ts - self.last_ts if self.last_ts else None
+        rows = []
+        view = []
+        counters = {}
+        retries = packets = 0.0
+        signals = []
+        for station in stations:
+            key = (station["mac_address"], station.get("interface", ""))
+            previous = self.counters.get(key)
+            current = {name: station[name] for name in STATION_COUNTERS if name in station}
+            counters[key] = current
+            deltas = {
+                name: stitch(previous[name], value) if previous and name in previous else 0.0
+                for name, value in current.items()
+            }
+            retries += deltas.get("tx_retries", 0.0)
+            packets += deltas.get("tx_packets", 0.0)
+            signal = station.get("signal_avg", station.get("signal"))
+            if signal is not None:
+                signals.append(signal)
+
+            device = devices.get(station["mac_address"], {})
+            view.append({
+                "macAddress": station["mac_address"],
+                "interface": key[1],
+                "hostname": device.get("hostname"),
+                "ipAddress": device.get("ip_address"),
+                "signal": signal,
+                "txBitrate": station.get("tx_bitrate"),
+                "rxBitrate": station.get("rx_bitrate"),
+                # 路由器视角：rx 为终端上传
+                "rxRate": deltas.get("rx_bytes", 0.0) / elapsed if elapsed else None,
+                "txRate": deltas.get("tx_bytes", 0.0) / elapsed if elapsed else None,
+                "retryRate": _ratio(deltas.get("tx_retries", 0.0), deltas.get("tx_packets", 0.0)),
+                "connectedTime": station.get("connected_time"),
+            })
+
+            active = deltas.get("rx_bytes", 0.0) > 0 or deltas.get("tx_bytes", 0.0) > 0
+            last_stored = self.stored.get(key)
+            if (
+                active or last_stored is None
+                or ts - last_stored[0] >= STATION_HEARTBEAT_SECONDS
+                or (signal is not None and last_stored[1] is not None and abs(signal - last_stored[1]) >= SIGNAL_CHANGE_DB)
+            ):
+                self.stored[key] = (ts, signal)
+                rows.append({
+                    "device_mac": station["mac_address"],
+                    "interface": key[1],
+                    "signal": signal,
+                    "tx_bitrate": station.get("tx_bitrate"),
+                    "rx_bitrate": station.get("rx_bitrate"),
+                    "rx_bytes": deltas.get("rx_bytes", 0.0),
+                    "tx_bytes": deltas.get("tx_bytes", 0.0),
+                    "tx_packets": deltas.get("tx_packets", 0.0),
+                    "tx_retries": deltas.get("tx_retries", 0.0),
+                    "airtime": (deltas.get("rx_duration", 0.0) + deltas.get("tx_duration", 0.0)) / 1000,
+                })
+
+        # 已离开的终端不再保留状态
+        self.counters = counters
+        self.stored = {key: value for key, value in self.stored.items() if key in counters}
+        self.last_ts = ts
+        self.stations = view
+
+        quality = {}
+        if signals:
+            quality["signal_strength"] = sum(signal_percent(signal) for signal in signals) / len(signals)
+        if packets > 0:
+            quality["retransmit_rate"] = _ratio(retries, packets)
+        return rows, quality
+
+
+def _ratio(retries: float, packets: float) -> Optional[float]:
+    """重传占发送尝试的百分比"""
+    attempts = retries + packets
+    return retries / attempts * 100 if attempts > 0 else None
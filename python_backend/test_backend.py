@@ -52,7 +52,9 @@ def test_database_models():
         
         expected_tables = {
             'network_traffic', 'online_devices', 'network_latency',
-            'router_status', 'bandwidth_usage', 'connection_quality'
+            'router_status', 'bandwidth_usage', 'connection_quality',
+            'device_presence', 'anomaly_events', 'usage_daily', 'usage_monthly',
+            'usage_counters', 'wifi_station_stats'
         }
         
         if expected_tables.issubset(tables):
@@ -66,6 +68,1387 @@ def test_database_models():
         print(f"❌ 数据库模型测试失败: {e}")
         return False
 
+def test_latency_stats():
+    """测试延迟流式统计"""
+    print("\n🔍 测试延迟流式统计...")
+    
+    try:
+        from services.latency_stats import LatencyStats
+        stats = LatencyStats(sample_interval=10)
+        for i in range(400):
+            stats.add("8.8.8.8", i * 10.0, float(i % 90 + 1), 0 if i % 10 else 100, 2.0)
+        
+        summary = stats.summary(4000.0)["8.8.8.8"]
+        hour = summary["windows"]["1h"]
+        minute = summary["windows"]["1m"]
+        
+        assert hour["count"] == 360, hour
+        assert abs(hour["p50"] - 45) <= 1, hour
+        assert abs(hour["p99"] - 90) <= 1.5, hour
+        assert abs(hour["packetLoss"] - 10) < 0.01, hour
+        assert minute["count"] == 6, minute
+        print(f"✅ 延迟分位数: p50={hour['p50']:.1f}, p95={hour['p95']:.1f}, p99={hour['p99']:.1f}")
+        return True
+    except Exception as e:
+        print(f"❌ 延迟流式统计测试失败: {e}")
+        return False
+
+def test_timeseries_store():
+    """测试内存列式时序存储"""
+    print("\n🔍 测试内存时序存储...")
+    
+    try:
+        from services.timeseries_store import TimeSeriesRing, bucket_series
+        ring = TimeSeriesRing(("value",), capacity=100)
+        for i in range(250):
+            ring.append(float(i), {"value": float(i)})
+        
+        assert ring.count == 100 and ring.oldest() == 150.0
+        timestamps, columns = ring.range(190.0, 210.0)
+        assert list(timestamps) == [float(i) for i in range(190, 210)]
+        
+        buckets = bucket_series(timestamps, columns, 190.0, 10.0, 2, {"value": "mean"})
+        assert buckets == [(190.0, {"value": 194.5}), (200.0, {"value": 204.5})], buckets
+        # 空桶不输出；样本落在桶的左边界上；last / max
+        buckets = bucket_series([5.0, 10.0, 12.0, 31.0], {"a": [1.0, 4.0, 2.0, 8.0], "b": [3.0, 1.0, 5.0, 0.0]},
+                                0.0, 10.0, 4, {"a": "last", "b": "max"})
+        assert buckets == [(0.0, {"a": 1.0, "b": 3.0}), (10.0, {"a": 2.0, "b": 5.0}), (30.0, {"a": 8.0, "b": 0.0})], buckets
+        print(f"✅ 环形缓冲区: 容量={ring.capacity}, 内存={ring.nbytes}字节")
+        return True
+    except Exception as e:
+        print(f"❌ 内存时序存储测试失败: {e}")
+        return False
+
+def test_columnar_archive():
+    """测试列式归档文件读写"""
+    print("\n🔍 测试列式归档...")
+    
+    try:
+        import tempfile
+        from datetime import datetime, timedelta
+        from services.archive import ColumnarArchive
+        archive = ColumnarArchive(tempfile.mkdtemp())
+        day = datetime(2024, 1, 1)
+        columns = [("timestamp", "t"), ("latency", "d"), ("target", "s")]
+        rows = [(day + timedelta(seconds=10 * i), float(i) if i % 7 else None, "8.8.8.8") for i in range(8640)]
+        
+        path = archive.write_day("network_latency", day, columns, rows)
+        archive.write_day("network_latency", day, columns, rows[:100])  # 重复写入应去重
+        chunks = list(archive.iter_chunks(
+            "network_latency", ["latency", "timestamp"], day, day + timedelta(days=1), {"target": "8.8.8.8"}
+        ))
+        
+        assert sum(len(c) for c in chunks) == len(rows)
+        assert chunks[0][1] == (1.0, day + timedelta(seconds=10))
+        
+        # 归档覆盖到最后一个归档日的次日零点，之后的范围读数据库
+        assert archive.archived_through("network_traffic") is None
+        assert archive.split_point("network_traffic", day, day + timedelta(days=3)) == day
+        assert archive.archived_through("network_latency") == day + timedelta(days=1)
+        assert archive.split_point("network_latency", day - timedelta(days=1), day + timedelta(days=3)) == day + timedelta(days=1)
+        assert archive.split_point("network_latency", day, day + timedelta(hours=6)) == day + timedelta(hours=6)
+        archive.write_day("network_latency", day + timedelta(days=1), columns, [])
+        assert archive.archived_through("network_latency") == day + timedelta(days=2)
+        
+        # 已归档且行数一致的天不再重写，当天有新行时重新归档
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from models.database import Base, NetworkTraffic
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        db.add_all([NetworkTraffic(timestamp=day + timedelta(hours=i), upload_speed=1.0, download_speed=2.0)
+                    for i in range(48)])
+        db.commit()
+        cutoff = day + timedelta(days=2)
+        assert archive.archive_table(db, NetworkTraffic, cutoff, delete=False) == 48
+        assert archive.archived_rows("network_traffic", day) == 24
+        assert archive.archive_table(db, NetworkTraffic, cutoff, delete=False) == 0
+        db.add(NetworkTraffic(timestamp=day + timedelta(minutes=30), upload_speed=1.0, download_speed=2.0))
+        db.commit()
+        assert archive.archive_table(db, NetworkTraffic, cutoff, delete=False) == 25
+        assert archive.archived_rows("network_traffic", day) == 25
+        db.close()
+        print(f"✅ 归档 {len(rows)} 行, 文件大小 {os.path.getsize(path)} 字节")
+        return True
+    except Exception as e:
+        print(f"❌ 列式归档测试失败: {e}")
+        return False
+
+def test_swinging_door():
+    """测试旋转门压缩"""
+    print("\n🔍 测试旋转门压缩...")
+    
+    try:
+        from services.compression import RowCompressor
+        compressor = RowCompressor({"cpu": 1.0, "uptime": 1.0}, max_interval=300)
+        stored = []
+        for i in range(720):
+            # 平稳的CPU + 线性增长的uptime，中途WAN状态变化一次
+            row = {"cpu": 20.0 + (0.3 if i % 2 else 0), "uptime": i * 5, "wan": "up" if i < 400 else "down"}
+            stored += compressor.offer(i * 5.0, row)
+        stored += compressor.flush()
+        
+        times = [t for t, _ in stored]
+        assert times[0] == 0.0 and times[-1] == 719 * 5.0
+        assert 1995.0 in times and 2000.0 in times  # 状态变化前后的点都被保留
+        assert all(b - a <= 300 for a, b in zip(times, times[1:]))
+        assert len(stored) < 720 / 10, len(stored)
+        print(f"✅ 720个样本压缩为{len(stored)}行")
+        return True
+    except Exception as e:
+        print(f"❌ 旋转门压缩测试失败: {e}")
+        return False
+
+def test_presence_tracker():
+    """测试在线设备快照比较：上线、变化、抖动去除、下线和 last_seen 批量更新"""
+    print("\n🔍 测试在线状态跟踪...")
+    
+    try:
+        from datetime import datetime, timedelta
+        from services.presence import PresenceTracker
+        
+        def device(mac, ip="192.168.1.2", hostname="phone"):
+            return {"mac_address": mac, "ip_address": ip, "hostname": hostname, "device_type": "mobile",
+                    "vendor": None, "upload_speed": 0, "download_speed": 0}
+        
+        start = datetime(2024, 1, 1)
+        polls = iter(start + timedelta(seconds=10 * i) for i in range(100))
+        tracker = PresenceTracker(flush_interval=300, missed_polls=3)
+        # 从数据库恢复在线设备，不产生虚假的上线事件
+        tracker.load([dict(device("AA"), last_seen=start - timedelta(minutes=1))], start)
+        assert not tracker.diff([device("AA")], next(polls))
+        
+        # 上线和信息变化；速度变化不算变化
+        diff = tracker.diff([device("AA", ip="192.168.1.3"), dict(device("BB"), upload_speed=5)], next(polls))
+        assert [d["mac_address"] for d in diff.joined] == ["BB"] and [d["mac_address"] for d in diff.changed] == ["AA"]
+        assert not tracker.diff([device("AA", ip="192.168.1.3"), dict(device("BB"), upload_speed=9)], next(polls))
+        
+        # 抖动：少于3次不在快照中不算下线，重新出现也不算上线
+        last_bb = next(polls)
+        tracker.diff([device("AA", ip="192.168.1.3"), device("BB")], last_bb)
+        for _ in range(2):
+            assert not tracker.diff([device("AA", ip="192.168.1.3")], next(polls))
+        assert "BB" in tracker.present and tracker.seen() == ["AA"]
+        assert not tracker.diff([device("AA", ip="192.168.1.3"), device("BB")], next(polls))
+        assert tracker.seen() == ["AA", "BB"] and not tracker.missed
+        
+        # 连续3次不在快照中才下线，下线时间为最后一次出现的时间
+        last_bb = next(polls)
+        tracker.diff([device("AA", ip="192.168.1.3"), device("BB")], last_bb)
+        diffs = [tracker.diff([device("AA", ip="192.168.1.3")], next(polls)) for _ in range(3)]
+        assert [bool(d) for d in diffs] == [False, False, True]
+        assert diffs[2].left == [("BB", last_bb)] and "BB" not in tracker.present
+        
+        # 轮询失败返回空快照一次，不会让所有设备下线
+        assert not tracker.diff([], next(polls))
+        
+        # last_seen 批量更新的周期
+        now = next(polls)
+        assert not tracker.flush_due(now)
+        assert tracker.flush_due(start + timedelta(seconds=300))
+        tracker.mark_flushed(start + timedelta(seconds=300))
+        assert not tracker.flush_due(start + timedelta(seconds=599))
+        
+        # 写库失败后丢弃状态，重新加载
+        tracker.reset()
+        assert not tracker.loaded and not tracker.present and not tracker.missed and tracker.flush_due(now)
+        
+        # 首次启动时已在线、没有在线区间的设备补开区间，下线时能关闭
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from models.database import Base, OnlineDevice, DevicePresence
+        from services.data_collector import _load_presence, _write_presence
+        from services.presence import PresenceDiff
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        seen = start - timedelta(hours=1)
+        db.add_all([
+            OnlineDevice(mac_address="AA", is_online=True, last_seen=seen),
+            OnlineDevice(mac_address="BB", is_online=True, last_seen=seen),
+            OnlineDevice(mac_address="CC", is_online=False, last_seen=seen),
+            DevicePresence(mac_address="BB", online_from=seen - timedelta(hours=1)),
+        ])
+        db.commit()
+        online = _load_presence(db, start)
+        db.commit()
+        assert sorted(d["mac_address"] for d in online) == ["AA", "BB"]
+        assert [(p.mac_address, p.online_from) for p in db.query(DevicePresence).order_by(DevicePresence.mac_address)] == [
+            ("AA", seen), ("BB", seen - timedelta(hours=1))]
+        assert len(_load_presence(db, start)) == 2 and db.query(DevicePresence).count() == 2
+        diff = PresenceDiff()
+        diff.left.append(("AA", start))
+        _write_presence(db, diff, [], start)
+        db.commit()
+        assert db.query(DevicePresence).filter(DevicePresence.mac_address == "AA").one().online_until == start
+        db.close()
+        print("✅ 上线/变化/下线事件正确，短暂缺席不切分在线区间")
+        return True
+    except Exception as e:
+        print(f"❌ 在线状态跟踪测试失败: {e}")
+        return False
+
+def test_anomaly_detector():
+    """测试流式异常检测"""
+    print("\n🔍 测试流式异常检测...")
+    
+    try:
+        import random
+        from services.anomaly import AnomalyDetector
+        random.seed(1)
+        detector = AnomalyDetector(min_std={"latency": 1.0}, cooldown=0)
+        events = []
+        for i in range(500):
+            value = 300.0 if i == 400 else random.gauss(30, 2)
+            event = detector.observe("latency", "8.8.8.8", value, 1700000000 + i * 10.0)
+            if event:
+                events.append((i, event))
+        
+        assert [i for i, _ in events] == [400], events
+        assert events[0][1]["kind"] == "spike"
+        print(f"✅ 检测到异常: 分数={events[0][1]['score']:.1f}")
+        
+        # 季节基线：每天9点（本地时间）升高，每个格子每小时更新一次，两周后不再报警
+        from datetime import datetime, timedelta
+        from services.anomaly import hour_of_week
+        from services.heatmap import local_cell
+        from services.timeseries_store import from_epoch, to_epoch
+        from services.usage import USAGE_UTC_OFFSET_HOURS
+        monday = to_epoch(datetime(2024, 1, 1) - timedelta(hours=USAGE_UTC_OFFSET_HOURS))
+        assert hour_of_week(monday + 9 * 3600) == 9
+        assert all(hour_of_week(monday + h * 3571) == local_cell(from_epoch(monday + h * 3571))[1] for h in range(400))
+        
+        detector = AnomalyDetector(min_std={"latency": 1.0}, cooldown=0)
+        weekly = [0] * 4
+        for i in range(4 * 168 * 12):
+            ts = monday + i * 300.0
+            value = random.gauss(100 if hour_of_week(ts) % 24 == 9 else 30, 2)
+            if detector.observe("latency", "8.8.8.8", value, ts):
+                weekly[i // (168 * 12)] += 1
+        slot = detector.series[("latency", "8.8.8.8")].seasonal[9]
+        assert slot.count == 4 and slot.mean > 80, (slot.count, slot.mean)
+        assert weekly[0] > 0 and weekly[2] == weekly[3] == 0, weekly
+        assert detector.observe("latency", "8.8.8.8", 100.0, monday + (4 * 168 + 3) * 3600.0)["kind"] == "spike"
+        print(f"✅ 季节基线按小时更新: 各周事件数={weekly}")
+        return True
+    except Exception as e:
+        print(f"❌ 流式异常检测测试失败: {e}")
+        return False
+
+def test_alert_rules():
+    """测试告警规则引擎"""
+    print("\n🔍 测试告警规则引擎...")
+    
+    try:
+        from services.alerts import AlertEngine
+        engine = AlertEngine(rules=[
+            {"name": "hot", "metric": "router_status.temperature", "op": ">", "threshold": 75, "clear": 70, "for": 120},
+        ], sinks=[])
+        statuses = []
+        temperatures = [60, 80, 80, 80, 80, 74, 72, 80, 69, 60]
+        for i, temperature in enumerate(temperatures):
+            engine.observe_sample("router_status", {"temperature": temperature}, i * 60.0)
+        statuses = [alert["status"] for alert in engine.recent]
+        
+        # 持续120秒后触发，74/72/80在迟滞区间内不恢复也不重复触发，69时恢复
+        assert statuses == ["firing", "resolved"], statuses
+        assert engine.queue.qsize() == 2 and not engine.active
+        
+        # 停止时关闭webhook的HTTP客户端
+        import asyncio
+        import httpx
+        from services.alerts import WebhookSink
+        webhook = WebhookSink("http://127.0.0.1:9/alerts")
+        webhook.client = client = httpx.AsyncClient()
+        asyncio.run(AlertEngine(rules=[], sinks=[webhook]).stop())
+        assert client.is_closed and webhook.client is None
+        print("✅ 告警触发/恢复符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ 告警规则引擎测试失败: {e}")
+        return False
+
+def test_collector_leader():
+    """测试采集器锁和共享状态快照"""
+    print("\n🔍 测试采集器主节点选举...")
+    
+    try:
+        import tempfile
+        from datetime import datetime
+        from services.leader import LeaderLock
+        from services.shared_state import SharedState
+        with tempfile.TemporaryDirectory() as tmp:
+            first = LeaderLock(path=os.path.join(tmp, "collector.lock"))
+            second = LeaderLock(path=os.path.join(tmp, "collector.lock"))
+            first.use_mysql = second.use_mysql = False
+            assert first.acquire() and not second.acquire()
+            first.release()
+            assert second.acquire()
+            second.release()
+            
+            state = SharedState(os.path.join(tmp, "state.json"))
+            now = datetime(2024, 1, 1, 12, 0, 0)
+            state.publish({"latest": {"router_status": (now, {"cpu_usage": 12.5})}, "alerts": {}})
+            assert state.latest("router_status") == (now, {"cpu_usage": 12.5})
+            assert state.latest("network_traffic") is None
+        
+        # 锁丢失（如MySQL连接被断开）时退为备用，重新获得锁后恢复
+        import asyncio
+        from services.leader import run_as_leader
+        
+        class FlakyLock:
+            def __init__(self):
+                self.checks = 0
+                self.acquires = 0
+            
+            def acquire(self):
+                self.acquires += 1
+                return True
+            
+            def check(self):
+                self.checks += 1
+                return self.checks != 2
+        
+        events = []
+        
+        async def lead():
+            lock = FlakyLock()
+            
+            async def acquired():
+                events.append("start")
+            
+            async def lost():
+                events.append("stop")
+            
+            task = asyncio.create_task(run_as_leader(lock, acquired, lost, retry_seconds=0.01, check_seconds=0.01))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            return lock
+        
+        lock = asyncio.run(lead())
+        assert events[:3] == ["start", "stop", "start"] and lock.acquires == 2, events
+        
+        from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
+        from services.data_collector import DataCollector
+        
+        async def step_down_and_resume():
+            collector = DataCollector()
+            collector.scheduler.start()
+            collector.is_running = collector.ready = True
+            await collector.step_down()
+            paused = (collector.scheduler.state, collector.is_running, collector.stepped_down)
+            await collector.start()
+            resumed = (collector.scheduler.state, collector.is_running, collector.ready)
+            collector.scheduler.shutdown(wait=False)
+            await collector.istoreos_client.close()
+            return paused, resumed
+        
+        paused, resumed = asyncio.run(step_down_and_resume())
+        assert paused == (STATE_PAUSED, False, True) and resumed == (STATE_RUNNING, True, True), (paused, resumed)
+        
+        # 预热完成前停止再启动：任务id不重复
+        from services.data_collector import COLLECTION_JOBS
+        
+        async def stop_and_restart():
+            collector = DataCollector()
+            
+            async def warm_up():
+                collector.scheduler.start()
+                collector.ready = True
+            
+            collector._warm_up = warm_up
+            await collector.start()
+            await collector.stop()
+            stopped_jobs = len(collector.scheduler.get_jobs())
+            await collector.start()
+            await asyncio.sleep(0)
+            jobs = [job.id for job in collector.scheduler.get_jobs()]
+            collector.scheduler.shutdown(wait=False)
+            return stopped_jobs, jobs
+        
+        stopped_jobs, jobs = asyncio.run(stop_and_restart())
+        assert stopped_jobs == 0 and sorted(jobs) == sorted(name for name, _ in COLLECTION_JOBS), jobs
+        print("✅ 同一时间只有一个进程持有采集器锁，失去锁时暂停采集，快照读写一致")
+        return True
+    except Exception as e:
+        print(f"❌ 采集器主节点选举测试失败: {e}")
+        return False
+
+def test_capture_replay():
+    """测试RPC录制与回放"""
+    print("\n🔍 测试RPC录制与回放...")
+    
+    try:
+        import asyncio
+        import json
+        import tempfile
+        import httpx
+        from utils.capture import RecordingTransport, ReplayTransport, read_capture, group_invocations, current_job
+        from utils.clock import clock
+        from utils.istoreos_client import IStoreOSClient
+        
+        counters = iter([1000, 6000])
+        net_dev = "Inter-|\n face |\n  eth0: {rx} 0 0 0 0 0 0 0 {tx} 0 0 0 0 0 0 0\n"
+        
+        def router(request):
+            if request.url.path.endswith("/auth"):
+                return httpx.Response(200, json={"result": "token"})
+            value = next(counters)
+            return httpx.Response(200, json={"result": net_dev.format(rx=value * 2, tx=value)})
+        
+        async def run(path):
+            recorder = RecordingTransport(path, inner=httpx.MockTransport(router))
+            client = IStoreOSClient(transport=recorder)
+            for started in (100.0, 105.0):
+                token = current_job.set(("collect_network_traffic", started))
+                await client.get_network_traffic()
+                current_job.reset(token)
+            await client.close()
+            
+            replayer = ReplayTransport(clock)
+            client = IStoreOSClient(transport=replayer)
+            try:
+                results = []
+                for started, job, records in group_invocations(read_capture(path)):
+                    replayer.load(records)
+                    results.append(await client.get_network_traffic())
+            finally:
+                clock.set(None)
+                await client.close()
+            return results, list(read_capture(path))
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "router.jrc")
+            results, records = asyncio.run(run(path))
+        
+        # 登录请求不录制密码，回放时按录制的时间间隔计算速率
+        assert records[0]["method"] == "login" and len(records[0]["params"]) == 1
+        assert results[1]["total_upload"] == 6000 and results[1]["upload_speed"] > 0
+        interval = records[-1]["t"] + records[-1]["ms"] / 1000 - (records[-2]["t"] + records[-2]["ms"] / 1000)
+        assert abs(results[1]["upload_speed"] - 5000 / interval) < 1e-6 * results[1]["upload_speed"]
+        print("✅ 录制文件可回放，速率与录制时一致")
+        return True
+    except Exception as e:
+        print(f"❌ RPC录制与回放测试失败: {e}")
+        return False
+
+def test_bucket_cache():
+    """测试历史查询时间桶缓存"""
+    print("\n🔍 测试时间桶缓存...")
+    
+    try:
+        from services.bucket_cache import BucketCache
+        from services.timeseries_store import bucket_series
+        timestamps = [float(ts) for ts in range(0, 3600, 5)]
+        columns = {"value": [ts / 5 for ts in timestamps]}
+        computed = []
+        
+        def compute(start, count):
+            computed.append(count)
+            return bucket_series(timestamps, columns, start, 60, count, {"value": "mean"})
+        
+        cache = BucketCache()
+        # 第一次：60个桶全部计算，now=3599 时前59个桶已关闭
+        first = cache.assemble(("m",), 60, 0, 60, 3599, compute)
+        # 第二次：只计算未缓存的最后一个桶
+        second = cache.assemble(("m",), 60, 0, 60, 3599, compute)
+        assert computed == [60, 1], computed
+        assert first == second and len(first) == 60
+        assert first[1] == (60, {"value": sum(range(12, 24)) / 12})
+        
+        # 空桶不缓存：迟到的行写入后下次请求可以看到
+        computed.clear()
+        late = cache.assemble(("m",), 60, 60, 10, 4199, compute)
+        assert late == [] and computed == [10]
+        timestamps.append(3605.0)
+        columns["value"].append(1.0)
+        late = cache.assemble(("m",), 60, 60, 10, 4199, compute)
+        assert computed == [10, 10] and late == [(3600, {"value": 1.0})], late
+        
+        # 缓存项过期后重新计算
+        computed.clear()
+        expiring = BucketCache(ttl=0)
+        expiring.assemble(("m",), 60, 0, 60, 3599, compute)
+        expiring.assemble(("m",), 60, 0, 60, 3599, compute)
+        assert computed == [60, 60] and len(expiring.entries) == 59, computed
+        print(f"✅ 缓存命中 {cache.hits} 次，只重新计算边缘桶")
+        return True
+    except Exception as e:
+        print(f"❌ 时间桶缓存测试失败: {e}")
+        return False
+
+def test_usage_accounting():
+    """测试用量累计和计数器重置拼接"""
+    print("\n🔍 测试用量累计...")
+    
+    try:
+        from datetime import datetime, timedelta, date
+        from services.usage import UsageAccounting
+        usage = UsageAccounting()
+        start = datetime(2024, 1, 31, 15, 0, 0)  # 东八区 23:00
+        readings = [1000, 3000, 6000, 500, 1500, 4000]  # 第4次读数前路由器重启
+        for i, value in enumerate(readings):
+            usage.add("interface", "eth0", value, value // 2, start + timedelta(minutes=30 * i))
+        
+        counter = usage.counters[("interface", "eth0")]
+        # 首次读数只作为基线：2000 + 3000 + 500 + 1000 + 2500
+        assert counter.total_rx == 9000, counter.total_rx
+        days = {day: values[0] for (day, month, kind, name), values in usage.pending.items()}
+        assert days == {date(2024, 1, 31): 2000, date(2024, 2, 1): 7000}, days
+        
+        # 写入期间的增量记入下一批，写入失败时取出的一批合并回来
+        now = start + timedelta(hours=3)
+        batch = usage.take(now)
+        assert not usage.pending and batch[1][("interface", "eth0")]["total_rx"] == 9000
+        usage.add("interface", "eth0", 5000, 2500, now)
+        usage.restore(batch)
+        days = {day: values[0] for (day, month, kind, name), values in usage.pending.items()}
+        assert days == {date(2024, 1, 31): 2000, date(2024, 2, 1): 8000}, days
+        assert usage.counters[("interface", "eth0")].dirty
+        print("✅ 计数器重置后继续累计，按本地日期划分账期")
+        return True
+    except Exception as e:
+        print(f"❌ 用量累计测试失败: {e}")
+        return False
+
+def test_top_talkers():
+    """测试连接跟踪流式解析和流量大户统计"""
+    print("\n🔍 测试流量大户统计...")
+    
+    try:
+        import asyncio
+        import httpx
+        from services.talkers import FlowDeltas, TopTalkers, SpaceSaving, parse_conntrack_line
+        from utils.istoreos_client import IStoreOSClient
+        
+        line = ("ipv4     2 tcp      6 431999 ESTABLISHED src=192.168.1.{host} dst=142.250.1.1 sport={port} dport=443 "
+                "packets=10 bytes={up} src=142.250.1.1 dst=100.64.1.2 sport=443 dport={port} packets=20 bytes={down} [ASSURED] mark=0 use=2")
+        polls = [
+            [line.format(host=host, port=40000 + i, up=1000, down=10000) for i, host in enumerate([10] * 5 + [20] * 2000)],
+            [line.format(host=host, port=40000 + i, up=1000 + (9000 if host == 10 else 0), down=10000 + (90000 if host == 10 else 10))
+             for i, host in enumerate([10] * 5 + [20] * 2000)],
+        ]
+        
+        def router(request):
+            if request.url.path.endswith("/auth"):
+                return httpx.Response(200, json={"result": "token"})
+            return httpx.Response(200, json={"id": 1, "result": "\n".join(polls.pop(0)) + "\n", "error": None})
+        
+        async def collect():
+            client = IStoreOSClient(transport=httpx.MockTransport(router))
+            deltas, talkers = FlowDeltas(), TopTalkers(capacity=16)
+            for ts in (1000.0, 1030.0):
+                count = 0
+                async for text in client.stream_command_lines("cat /proc/net/nf_conntrack"):
+                    count += 1
+                    deltas.observe(parse_conntrack_line(text))
+                assert count == 2005, count
+                talkers.add(ts, deltas.commit())
+            await client.close()
+            return talkers
+        
+        talkers = asyncio.run(collect())
+        top = talkers.top(1030.0, "15m", "src", 2)
+        # 第一次读取只作为基线；第二次：主机10的5个连接各增加99000字节，主机20的2000个连接各增加10字节
+        assert top[0]["src"] == "192.168.1.10" and top[0]["bytes"] == 5 * 99000, top
+        assert top[1]["bytes"] == 20000 and top[1]["flows"] == 0, top
+        
+        summary = SpaceSaving(4)
+        for i in range(100):
+            summary.add(("small", i), 1)
+        summary.add(("big",), 1000)
+        assert len(summary.counts) == 4 and summary.counts[("big",)] - summary.errors[("big",)] == 1000
+        print("✅ 流式解析与Top N统计符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ 流量大户统计测试失败: {e}")
+        return False
+
+def test_wifi_stations():
+    """测试无线终端解析和增量统计"""
+    print("\n🔍 测试无线终端统计...")
+    
+    try:
+        from services.wifi import StationTracker
+        from utils.istoreos_client import IStoreOSClient
+        
+        dump = """Station aa:bb:cc:00:00:01 (on wlan0)
+\tinactive time:\t120 ms
+\trx bytes:\t{rx}
+\ttx bytes:\t{tx}
+\ttx packets:\t{packets}
+\ttx retries:\t{retries}
+\tsignal:  \t-55 [-57, -58] dBm
+\tsignal avg:\t-60 [-62, -63] dBm
+\ttx bitrate:\t866.7 MBit/s VHT-MCS 9 80MHz short GI VHT-NSS 2
+\trx bitrate:\t650.0 MBit/s VHT-MCS 7 80MHz short GI VHT-NSS 2
+"""
+        client = IStoreOSClient()
+        first = client._parse_station_dump(dump.format(rx=1000, tx=5000, packets=100, retries=10))
+        assert first[0]["mac_address"] == "AA:BB:CC:00:00:01" and first[0]["interface"] == "wlan0", first
+        assert first[0]["signal_avg"] == -60 and first[0]["tx_bitrate"] == 866.7, first
+        
+        tracker = StationTracker()
+        devices = {"AA:BB:CC:00:00:01": {"hostname": "phone", "ip_address": "192.168.1.20"}}
+        rows, quality = tracker.update(first, 1000.0, devices)
+        assert len(rows) == 1 and rows[0]["rx_bytes"] == 0 and quality == {"signal_strength": 80.0}, (rows, quality)
+        
+        # 终端重新关联后计数器归零：读数本身即为增量
+        second = client._parse_station_dump(dump.format(rx=400, tx=9000, packets=190, retries=20))
+        rows, quality = tracker.update(second, 1030.0, devices)
+        assert rows[0]["rx_bytes"] == 400 and rows[0]["tx_bytes"] == 4000, rows
+        assert quality["retransmit_rate"] == 10 / 100 * 100, quality
+        assert tracker.stations[0]["hostname"] == "phone" and tracker.stations[0]["txRate"] == 4000 / 30
+        
+        # 空闲终端不重复写入
+        rows, _ = tracker.update(second, 1060.0, devices)
+        assert rows == [], rows
+        print("✅ 终端解析、计数器增量和写入抑制符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ 无线终端统计测试失败: {e}")
+        return False
+
+def test_mysql_partitions():
+    """测试按天分区的DDL生成"""
+    print("\n🔍 测试MySQL按天分区...")
+    
+    try:
+        from datetime import date
+        from services.partitions import (
+            convert_sql, reorganize_sql, drop_sql, days_to_add, partition_day, partition_name
+        )
+        
+        today = date(2024, 1, 30)
+        existing = [date(2024, 1, 29), date(2024, 1, 30), date(2024, 2, 1)]
+        days = days_to_add(existing, today, 3)
+        assert days == [date(2024, 2, 2)], days
+        assert days_to_add([], today, 1) == [today, date(2024, 1, 31)]
+        
+        statement = reorganize_sql("network_traffic", days)
+        assert "REORGANIZE PARTITION pmax INTO (PARTITION p20240202 VALUES LESS THAN (TO_DAYS('2024-02-03'))" in statement, statement
+        assert statement.endswith("PARTITION pmax VALUES LESS THAN MAXVALUE)"), statement
+        assert "ADD PRIMARY KEY (`id`, `timestamp`)" in convert_sql("network_traffic", days)[0]
+        assert drop_sql("network_traffic", existing[:2]) == "ALTER TABLE `network_traffic` DROP PARTITION p20240129, p20240130"
+        assert partition_day(partition_name(today)) == today and partition_day("pmax") is None
+        print("✅ 分区补建、拆分和删除语句符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ MySQL按天分区测试失败: {e}")
+        return False
+
+def test_ingest_queue():
+    """测试写入队列的溢出策略"""
+    print("\n🔍 测试写入队列...")
+    
+    try:
+        import asyncio
+        from models.database import NetworkLatency, NetworkTraffic
+        from services.ingest import IngestQueue, StorageWorker
+        
+        async def fill(policy):
+            queue = IngestQueue(capacity=3, policy=policy)
+            for i in range(5):
+                await queue.put(NetworkLatency, {"latency": i}, key="8.8.8.8" if i % 2 else "1.1.1.1", ts=i)
+            return queue
+        
+        queue = asyncio.run(fill("drop_oldest"))
+        assert [s.row["latency"] for s in queue.items] == [2, 3, 4] and queue.dropped == 2
+        
+        # 同一目标已有待写入的样本时替换它
+        queue = asyncio.run(fill("coalesce"))
+        assert [s.row["latency"] for s in queue.items] == [0, 3, 4] and queue.coalesced == 2, [s.row for s in queue.items]
+        
+        async def block():
+            written = []
+            queue = IngestQueue(capacity=2, policy="block")
+            worker = StorageWorker(queue, lambda rows: written.extend(row["upload_speed"] for row in rows[NetworkTraffic]), batch_size=2)
+            for i in range(6):
+                await queue.put(NetworkTraffic, {"upload_speed": i}, ts=0)
+                if i == 1:
+                    worker.start()
+            await worker.stop()
+            return queue, written
+        
+        queue, written = asyncio.run(block())
+        assert written == list(range(6)) and queue.dropped == 0 and queue.blocked >= 1, (written, queue.stats())
+        assert queue.stats()["stored"] == 6 and queue.stats()["depth"] == 0
+        
+        # 多个采集任务同时等待：取走一行只放行一个任务，其余重新等待，不丢弃也不超出容量
+        async def producers():
+            queue = IngestQueue(capacity=2, policy="block")
+            for i in range(2):
+                await queue.put(NetworkTraffic, {"upload_speed": i}, ts=0)
+            tasks = [asyncio.create_task(queue.put(NetworkTraffic, {"upload_speed": i}, ts=0)) for i in range(2, 6)]
+            await asyncio.sleep(0)
+            depths = []
+            while len(queue) or not all(task.done() for task in tasks):
+                taken = await queue.get_batch(1)
+                await asyncio.sleep(0)
+                depths.append(len(queue))
+                assert len(taken) == 1
+            return queue, depths
+        
+        queue, depths = asyncio.run(producers())
+        assert max(depths) <= 2 and queue.dropped == 0 and queue.enqueued == 6, (depths, queue.stats())
+        assert queue.blocked == 4, queue.stats()
+        print("✅ 丢弃最早、按序列合并和阻塞等待符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ 写入队列测试失败: {e}")
+        return False
+
+def test_spool():
+    """测试写入缓冲文件的落盘、截断恢复和回放"""
+    print("\n🔍 测试写入缓冲文件...")
+    
+    try:
+        import os
+        import tempfile
+        from datetime import datetime
+        from models.database import NetworkLatency, NetworkTraffic
+        from services.spool import Spool
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ingest.spool")
+            spool = Spool(path, max_bytes=4096)
+            for i in range(6):
+                assert spool.append({
+                    NetworkTraffic: [{"timestamp": datetime(2024, 1, 1, 0, 0, i), "upload_speed": i}],
+                    NetworkLatency: [{"timestamp": datetime(2024, 1, 1, 0, 0, i), "target": "1.1.1.1", "latency": i}],
+                })
+            # 超过大小上限时丢弃
+            assert not spool.append({NetworkTraffic: [{"upload_speed": 0, "pad": "x" * 4096}]}) and spool.dropped == 1
+            # 模拟崩溃时写了一半的帧
+            with open(path, "ab") as f:
+                f.write(b"\x40\x00\x00\x00\x01")
+            
+            spool = Spool(path, max_bytes=4096)
+            spool.open()
+            assert spool.rows == 12 and spool.corrupt_bytes == 5, spool.stats()
+            
+            written = []
+            def fail_second(rows):
+                if written:
+                    raise RuntimeError("database is locked")
+                written.extend(rows[NetworkTraffic])
+            try:
+                spool.replay(fail_second, batch_rows=4)
+            except RuntimeError:
+                pass
+            assert spool.rows == 8 and [row["upload_speed"] for row in written] == [0, 1], spool.stats()
+            
+            # 重新打开后从记录的位置继续，已提交的批次不重复
+            spool = Spool(path, max_bytes=4096)
+            spool.open()
+            rest = []
+            assert spool.replay(lambda rows: rest.extend(rows[NetworkTraffic]), batch_rows=100) == 8
+            assert [row["upload_speed"] for row in rest] == [2, 3, 4, 5] and rest[0]["timestamp"] == datetime(2024, 1, 1, 0, 0, 2)
+            assert not os.path.exists(path) and not spool.pending
+        print("✅ 落盘、尾部截断、断点续放符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ 写入缓冲文件测试失败: {e}")
+        return False
+
+def test_highres_traffic():
+    """测试按路由器时钟计算的高精度流量速率"""
+    print("\n🔍 测试高精度流量采样...")
+    
+    try:
+        import asyncio
+        import httpx
+        from services.highres import HighResTraffic
+        from utils.istoreos_client import IStoreOSClient
+        
+        net_dev = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:     100       1    0    0    0     0          0         0      100       1    0    0    0     0       0          0
+pppoe-wan: {rx}   10    0    0    0     0          0         0 {tx}   20    0    0    0     0       0          0
+"""
+        def router(request):
+            if request.url.path.endswith("/auth"):
+                return httpx.Response(200, json={"result": "token"})
+            return httpx.Response(200, json={"id": 1, "result": "3600.50 7000.00\n" + net_dev.format(rx=5000, tx=800), "error": None})
+        
+        async def read():
+            client = IStoreOSClient(transport=httpx.MockTransport(router))
+            counters = await client.get_traffic_counters()
+            await client.close()
+            return counters
+        
+        uptime, counters = asyncio.run(read())
+        assert uptime == 3600.5 and counters == {"pppoe-wan": (5000, 800)}, (uptime, counters)
+        
+        # 本地收到响应的时间有抖动，速率只取决于路由器uptime
+        highres = HighResTraffic(raw_seconds=60, interval=1)
+        jitter = [0.0, 0.4, -0.3, 0.6, 0.1]
+        for i in range(25):
+            highres.add(100.0 + i, {"eth0": (i * 1000, i * 10)}, 1000.0 + i + jitter[i % 5])
+        timestamps, columns = highres.series("eth0", "1s", 0, 2000)
+        assert len(timestamps) == 24 and set(columns["rx_rate"]) == {1000.0} and set(columns["tx_rate"]) == {10.0}
+        assert timestamps[1] - timestamps[0] == 1.0
+        
+        timestamps, columns = highres.series("eth0", "10s", 0, 2000)
+        assert len(timestamps) == 2 and columns["rx_max"][0] == 1000.0, (list(timestamps), columns)
+        
+        # 路由器重启：uptime变小，重新建立基线，不产生负速率
+        assert highres.add(5.0, {"eth0": (100, 1)}, 1030.0) is None and highres.resets == 1
+        assert highres.add(6.0, {"eth0": (2100, 1)}, 1031.0) is not None and highres.current["eth0"] == (2000.0, 0.0)
+        print("✅ 路由器时钟速率、汇总和重启处理符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ 高精度流量采样测试失败: {e}")
+        return False
+
+def test_oui_lookup():
+    """测试MAC厂商查询和设备类型推断"""
+    print("\n🔍 测试MAC厂商查询...")
+    
+    try:
+        import os
+        import tempfile
+        from utils.oui import OUITable, build, download, parse_mac, classify_mac
+        from utils.istoreos_client import IStoreOSClient
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, "oui.csv")
+            with open(csv_path, "w", encoding="utf-8") as f:
+                f.write("Registry,Assignment,Organization Name,Organization Address\n")
+                f.write('MA-L,70B3D5,IEEE Registration Authority,"445 Hoes Lane Piscataway NJ US 08854"\n')
+                f.write("MA-S,70B3D5123,Example Sensors Ltd,Somewhere\n")
+                f.write("MA-M,70B3D51,Example Cameras Inc,Somewhere\n")
+                f.write('MA-L,B827EB,Raspberry Pi Foundation,"Mitchell Wood House Caldecote GB CB23 7NU"\n')
+            out = os.path.join(tmp, "oui.tsv.gz")
+            assert build([csv_path], out) == 4
+            
+            table = OUITable(out)
+            # 最长前缀优先
+            assert table.lookup(parse_mac("70:B3:D5:12:34:56")) == "Example Sensors Ltd"
+            assert table.lookup(parse_mac("70-b3-d5-1f-00-00")) == "Example Cameras Inc"
+            assert table.lookup(parse_mac("70:B3:D5:F0:00:00")) == "IEEE Registration Authority"
+            assert table.lookup(parse_mac("00:00:00:00:00:01")) is None
+            assert len(table.vendors) == 4 and table.nbytes == 4 * 12
+            
+            # 下载三个注册表后生成；下载失败时保留原有的表
+            import httpx
+            registries = {
+                "oui.csv": "Registry,Assignment,Organization Name,Organization Address\nMA-L,B827EB,Raspberry Pi Foundation,GB\n",
+                "mam.csv": "Registry,Assignment,Organization Name,Organization Address\nMA-M,70B3D51,Example Cameras Inc,US\n",
+                "oui36.csv": "Registry,Assignment,Organization Name,Organization Address\nMA-S,70B3D5123,Example Sensors Ltd,US\n",
+            }
+            transport = httpx.MockTransport(
+                lambda request: httpx.Response(200, text=registries[request.url.path.rsplit("/", 1)[-1]])
+            )
+            assert download(out, transport=transport) == 3
+            assert OUITable(out).lookup(parse_mac("70:B3:D5:12:34:56")) == "Example Sensors Ltd"
+            try:
+                download(out, transport=httpx.MockTransport(lambda request: httpx.Response(503)))
+                assert False, "下载失败应抛出异常"
+            except httpx.HTTPStatusError:
+                pass
+            assert OUITable(out).lookup(parse_mac("B8:27:EB:00:00:01")) == "Raspberry Pi Foundation"
+            assert sorted(os.listdir(tmp)) == ["oui.csv", "oui.tsv.gz"]
+        
+        # IEEE文本格式和 Wireshark manuf：后面的文件覆盖前面的同一前缀
+        with tempfile.TemporaryDirectory() as tmp:
+            manuf = os.path.join(tmp, "manuf")
+            with open(manuf, "w", encoding="utf-8") as f:
+                f.write("# comment\n00:00:0C\tCisco\tCisco Systems, Inc\n")
+                f.write("00:55:DA:10:00:00/28\tKoolPOS\tKoolPOS Inc.\n")
+                f.write("00:1B:C5:00:10:00/36\tOpenRBco\tOpenRB.com, Direct SIA\n")
+                f.write("01:00:0C:CC:CC:CC\tCDP/VTP\n")
+            text = os.path.join(tmp, "iab.txt")
+            with open(text, "w", encoding="utf-8") as f:
+                f.write("OUI/MA-L\t\tOrganization\r\n\r\n")
+                f.write("00-00-0C   (hex)\t\tCisco Systems\r\n00000C     (base 16)\t\tCisco Systems\r\n\t\t\t\tSan Jose\r\n\r\n")
+                f.write("00-50-C2   (hex)\t\tRF Code\r\nF71000-F71FFF     (base 16)\t\tRF Code\r\n\r\n")
+                f.write("70-B3-D5   (hex)\t\tExample Cameras Inc\r\n100000-1FFFFF     (base 16)\t\tExample Cameras Inc\r\n")
+            out = os.path.join(tmp, "oui.tsv.gz")
+            assert build([manuf, text], out) == 5
+            table = OUITable(out)
+            assert table.lookup(parse_mac("00:00:0C:12:34:56")) == "Cisco Systems"
+            assert table.lookup(parse_mac("00:55:DA:1F:00:00")) == "KoolPOS Inc."
+            assert table.lookup(parse_mac("00:1B:C5:00:10:55")) == "OpenRB.com, Direct SIA"
+            assert table.lookup(parse_mac("00:50:C2:F7:1A:BC")) == "RF Code"
+            assert table.lookup(parse_mac("70:B3:D5:1A:BC:DE")) == "Example Cameras Inc"
+        
+        # 内置的完整快照包含三种长度的前缀
+        bundled = OUITable()
+        bundled.load()
+        assert [(bits, len(keys) > 1000) for bits, keys, _ in bundled.prefixes] == [(36, True), (28, True), (24, True)]
+        
+        # 内置表：主机名未知时按厂商分类，随机地址视为手机
+        client = IStoreOSClient()
+        assert client._guess_device_type("*", "B8:27:EB:00:00:01") == "server"
+        assert client._guess_device_type("Unknown", "DA:A1:19:00:00:01") == "mobile"
+        assert client._guess_device_type("my-macbook", "B8:27:EB:00:00:01") == "computer"
+        assert classify_mac("DA:A1:19:00:00:01") == (None, None, True)
+        print("✅ 前缀查询、厂商分类和随机地址识别符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ MAC厂商查询测试失败: {e}")
+        return False
+
+def test_heatmap_cube():
+    """测试周×小时热力图累计和按周淘汰"""
+    print("\n🔍 测试热力图...")
+    
+    try:
+        from datetime import datetime, timedelta, date
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from models.database import Base, HeatmapCell
+        from services.heatmap import HeatmapCube, local_cell, write_heatmap
+        
+        # 东八区 2024-01-01（周一）09:30
+        monday = datetime(2024, 1, 1, 1, 30)
+        assert local_cell(monday) == (date(2024, 1, 1), 9)
+        assert local_cell(datetime(2024, 1, 7, 16, 0)) == (date(2024, 1, 8), 0)
+        
+        cube = HeatmapCube(weeks=2)
+        cube.loaded = True
+        for week in range(2):
+            for value in (10.0, 30.0):
+                cube.observe("network_latency", {"latency": value + week, "packet_loss": 0}, monday + timedelta(weeks=week), "8.8.8.8")
+        grid = cube.grid("network_latency.latency", "8.8.8.8", monday + timedelta(weeks=1))
+        assert grid["mean"][0][9] == 20.5 and grid["peak"][0][9] == 31.0 and grid["samples"][0][9] == 4, grid["mean"][0]
+        assert cube.grid("network_latency.latency", "8.8.8.8", monday + timedelta(weeks=1), weeks=1)["samples"][0][9] == 2
+        assert not cube.expired
+        
+        # 第三周覆盖第一周的槽位，迟到的第一周样本被忽略
+        cube.observe("network_latency", {"latency": 100.0}, monday + timedelta(weeks=2, days=1), "8.8.8.8")
+        cube.observe("network_latency", {"latency": 999.0}, monday, "8.8.8.8")
+        grid = cube.grid("network_latency.latency", "8.8.8.8", monday + timedelta(weeks=2, days=1))
+        assert grid["samples"][0][9] == 2 and grid["mean"][1][9] == 100.0 and cube.expired
+        
+        # 写入数据库后恢复
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+        now = monday + timedelta(weeks=2, days=1)
+        write_heatmap(db, cube.take(now), now)
+        db.commit()
+        rows = [
+            {column: getattr(row, column) for column in ("metric", "target", "week", "cell", "total", "count", "peak")}
+            for row in db.query(HeatmapCell).all()
+        ]
+        restored = HeatmapCube(weeks=2)
+        restored.load(rows, now)
+        assert restored.grid("network_latency.latency", "8.8.8.8", now) == grid
+        db.close()
+        print("✅ 按格子累计均值/峰值，旧的周被新周覆盖，可从数据库恢复")
+        return True
+    except Exception as e:
+        print(f"❌ 热力图测试失败: {e}")
+        return False
+
+def test_chunked_retention():
+    """测试分批清理和SQLite空闲页回收"""
+    print("\n🔍 测试分批清理...")
+    
+    try:
+        import asyncio
+        import os
+        import tempfile
+        from datetime import datetime, timedelta
+        from sqlalchemy import create_engine, insert, func, select
+        from models.database import (Base, NetworkTraffic, RouterStatus,
+                                     _ensure_auto_vacuum, enable_incremental_vacuum)
+        from services.retention import Retention
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            # 新建的空库在建表前直接切换为增量模式
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'retention.db')}")
+            _ensure_auto_vacuum(engine)
+            Base.metadata.create_all(bind=engine)
+            with engine.connect() as conn:
+                assert conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+            start = datetime(2024, 1, 1)
+            with engine.begin() as conn:
+                conn.execute(insert(NetworkTraffic), [
+                    {"timestamp": start + timedelta(minutes=i), "upload_speed": 1.0, "download_speed": 2.0,
+                     "total_upload": float(i), "total_download": float(i)}
+                    for i in range(2000)
+                ])
+                conn.execute(insert(RouterStatus), [
+                    {"timestamp": start + timedelta(minutes=i), "cpu_usage": 10.0, "wan_status": "connected" * 20}
+                    for i in range(1000)
+                ])
+            threshold = start + timedelta(minutes=1500)
+            
+            # 时间预算为0时不删除任何行
+            report = asyncio.run(Retention(engine, [NetworkTraffic], time_budget=0).run(threshold))
+            assert not report["complete"] and report["deleted"]["network_traffic"] == 0
+            
+            retention = Retention(engine, [NetworkTraffic, RouterStatus], batch_rows=400, pause_ms=0, vacuum_pages=20)
+            report = asyncio.run(retention.run(threshold))
+            assert report["deleted"] == {"network_traffic": 1500, "router_status": 1000}, report
+            assert report["complete"] and report["batches"] == 7, report
+            assert report["reclaimedBytes"] > 0 and report["lockMs"]["max"] > 0, report
+            with engine.connect() as conn:
+                assert conn.execute(select(func.count()).select_from(NetworkTraffic)).scalar() == 500
+                assert conn.exec_driver_sql("PRAGMA freelist_count").scalar() == 0
+            
+            # 一次 incremental_vacuum 回收 vacuum_pages 页
+            with engine.begin() as conn:
+                conn.execute(insert(NetworkTraffic), [
+                    {"timestamp": start, "upload_speed": 1.0, "download_speed": 2.0,
+                     "total_upload": float(i), "total_download": float(i)}
+                    for i in range(3000)
+                ])
+            for _ in range(8):
+                retention.delete_batch(NetworkTraffic, threshold)
+            with engine.connect() as conn:
+                free_before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+                page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+            freed, _ = retention.vacuum_step()
+            with engine.connect() as conn:
+                free_after = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            assert free_before > 20 and free_before - free_after == 20, (free_before, free_after)
+            assert freed == 20 * page_size, freed
+            engine.dispose()
+            
+            # 已有的库启动时不转换，只能通过一次性迁移转换
+            legacy = create_engine(f"sqlite:///{os.path.join(tmp, 'legacy.db')}")
+            Base.metadata.create_all(bind=legacy)
+            _ensure_auto_vacuum(legacy)
+            with legacy.connect() as conn:
+                assert conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 0
+            before, after = enable_incremental_vacuum(legacy)
+            assert before > 0 and after > 0, (before, after)
+            with legacy.connect() as conn:
+                assert conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+            assert enable_incremental_vacuum(legacy) is None
+            legacy.dispose()
+        print(f"✅ 分{report['batches']}批删除，回收{report['reclaimedBytes']}字节，最长持锁{report['lockMs']['max']}ms")
+        return True
+    except Exception as e:
+        print(f"❌ 分批清理测试失败: {e}")
+        return False
+
+def test_fast_json():
+    """测试orjson响应的输出形状、毫秒时间戳精度和列式结构"""
+    print("\n🔍 测试JSON序列化...")
+    
+    try:
+        import json
+        from array import array
+        from datetime import datetime, timedelta
+        from utils.fast_json import FastJSONResponse, records, columnar, epoch_ms, format_ts
+        
+        moment = datetime(2024, 1, 1, 0, 0, 0, 123456)
+        rows = [(moment, "eth0", 1.5, None), (moment + timedelta(seconds=5), "wan", 2, 3.25)]
+        keys = ["timestamp", "name", "rx", "tx"]
+        
+        # 行格式：字段顺序与 keys 一致，datetime 输出为ISO字符串（UTC，不带时区），None 为 null
+        body = FastJSONResponse(records(rows, keys)).body
+        assert body.startswith(b'[{"timestamp":"2024-01-01T00:00:00.123456","name":"eth0","rx":1.5,"tx":null}'), body
+        assert json.loads(body)[1] == {"timestamp": "2024-01-01T00:00:05.123456", "name": "wan", "rx": 2, "tx": 3.25}
+        
+        # 毫秒格式：截断到毫秒，datetime 和 epoch秒结果一致
+        epoch = datetime(1970, 1, 1)
+        assert epoch_ms(moment) == 1704067200123 and epoch_ms(None) is None
+        assert epoch_ms(1704067200.5) == 1704067200500
+        for micros in (0, 1000, 999, 999999, 500500):
+            value = moment.replace(microsecond=micros)
+            expected = (value - epoch) // timedelta(milliseconds=1)
+            assert epoch_ms(value) == expected and epoch_ms((value - epoch).total_seconds()) == expected, micros
+        assert json.loads(FastJSONResponse(records(rows, keys, "ms")).body)[0]["timestamp"] == 1704067200123
+        # 内存存储的 epoch秒 在 iso 格式下转换为 datetime
+        assert format_ts(1704067200.0) == datetime(2024, 1, 1)
+        
+        # 列式结构：t 为时间列，数组列直接序列化为列表，列顺序保留
+        shape = columnar([1704067200.0, 1704067205.0], {"rx": array("d", [1.0, 2.5]), "tx": [None, 3]}, "ms")
+        assert FastJSONResponse(shape).body == b'{"t":[1704067200000,1704067205000],"rx":[1.0,2.5],"tx":[null,3]}'
+        assert json.loads(FastJSONResponse(columnar([moment], {"rx": [1]})).body) == {"t": ["2024-01-01T00:00:00.123456"], "rx": [1]}
+        print("✅ 行/列式输出形状和毫秒时间戳符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ JSON序列化测试失败: {e}")
+        return False
+
+def test_export_stream():
+    """测试流式导出：分块输出、归档与数据库不重复、列选择、格式和gzip"""
+    print("\n🔍 测试数据导出...")
+    
+    try:
+        import csv
+        import gzip
+        import io
+        import json
+        import tempfile
+        from datetime import datetime, timedelta
+        from fastapi.testclient import TestClient
+        from sqlalchemy import create_engine, insert
+        from sqlalchemy.orm import sessionmaker
+        from models.database import Base, NetworkLatency
+        from services import export
+        from services.archive import ColumnarArchive, archive_columns
+        import main as app_main
+        
+        day = datetime(2024, 1, 1)
+        rows = [
+            {"timestamp": day + timedelta(seconds=60 * i), "target": "8.8.8.8" if i % 2 else "1.1.1.1",
+             "latency": float(i), "packet_loss": 0.0}
+            for i in range(2 * 1440)
+        ]
+        original = export.SessionLocal, export.archive
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{tmp}/export.db")
+            Base.metadata.create_all(bind=engine)
+            with engine.begin() as conn:
+                conn.execute(insert(NetworkLatency), rows)
+            # 第一天已归档但还没有从数据库删除
+            archive = ColumnarArchive(os.path.join(tmp, "archive"))
+            columns = archive_columns(NetworkLatency)
+            archive.write_day("network_latency", day, columns, [
+                tuple(row.get(name) for name, _ in columns) for row in rows[:1440]
+            ])
+            try:
+                export.SessionLocal = sessionmaker(bind=engine)
+                export.archive = archive
+                
+                # 分块输出，归档和数据库重叠的一天不重复
+                names = export.resolve_columns(NetworkLatency, "latency")
+                chunks = list(export.export_stream("network_latency", names, day, day + timedelta(days=2)))
+                assert len(chunks) > 2, len(chunks)
+                lines = b"".join(chunks).decode().splitlines()
+                assert lines[0] == "timestamp,latency" and len(lines) == 1 + len(rows), len(lines)
+                assert lines[1441] == f"{day + timedelta(days=1):%Y-%m-%dT%H:%M:%S},1440.0", lines[1441]
+                compressed = list(export.export_stream("network_latency", names, day, day + timedelta(days=2), gzip=True))
+                assert gzip.decompress(b"".join(compressed)) == b"".join(chunks)
+                
+                client = TestClient(app_main.app)
+                params = {"start": "2024-01-01T08:00:00+08:00", "end": "2024-01-01T00:10:00"}
+                response = client.get("/api/export/network_latency", params=params)
+                assert response.status_code == 200 and response.headers["content-type"].startswith("text/csv")
+                table = list(csv.reader(io.StringIO(response.text)))
+                assert table[0] == export.default_columns(NetworkLatency) and len(table) == 11, table[:2]
+                
+                # 列选择：timestamp 总在第一列，未知列返回400
+                response = client.get("/api/export/network_latency", params=dict(params, columns="packet_loss,target"))
+                assert response.text.splitlines()[0] == "timestamp,packet_loss,target"
+                assert client.get("/api/export/network_latency", params={"columns": "nope"}).status_code == 400
+                assert client.get("/api/export/router_status", params={"target": "x"}).status_code == 400
+                
+                # NDJSON + 按目标过滤
+                response = client.get("/api/export/network_latency", params=dict(
+                    params, format="ndjson", target="8.8.8.8", columns="latency"
+                ))
+                records = [json.loads(line) for line in response.text.splitlines()]
+                assert response.headers["content-type"].startswith("application/x-ndjson")
+                assert [record["latency"] for record in records] == [1.0, 3.0, 5.0, 7.0, 9.0], records
+                assert set(records[0]) == {"timestamp", "latency"}
+                
+                # gzip=true 时返回gzip文件；只带 Accept-Encoding 时导出不经过压缩中间件
+                response = client.get("/api/export/network_latency", params=dict(params, gzip="true"))
+                assert response.headers["content-type"] == "application/gzip"
+                assert 'filename="network_latency.csv.gz"' in response.headers["content-disposition"]
+                assert "content-encoding" not in response.headers
+                assert list(csv.reader(io.StringIO(gzip.decompress(response.content).decode()))) == table
+                response = client.get("/api/export/network_latency", params=params, headers={"Accept-Encoding": "gzip"})
+                assert "content-encoding" not in response.headers and response.text.splitlines()[0].startswith("timestamp")
+            finally:
+                export.SessionLocal, export.archive = original
+                engine.dispose()
+        print("✅ 分块导出、列选择、NDJSON和gzip符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ 数据导出测试失败: {e}")
+        return False
+
+def test_device_list():
+    """测试设备列表的过滤、键集分页和不分页时的默认行为"""
+    print("\n🔍 测试设备列表...")
+    
+    try:
+        from datetime import datetime, timedelta, timezone
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import StaticPool
+        from models.database import Base, OnlineDevice, get_db
+        from api import router
+        
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+        base = datetime(2024, 1, 1)
+        for i in range(12):
+            hostname = ["iPhone-%d" % i, "ipad_%d" % i, "Laptop%d" % i][i % 3]
+            db.add(OnlineDevice(
+                mac_address="AA:BB:CC:00:00:%02X" % i, ip_address=f"192.168.1.{i}",
+                hostname=hostname, hostname_lower=hostname.lower(), device_type="mobile" if i % 3 < 2 else "computer",
+                is_online=i % 2 == 0,
+                # 每两台设备的 last_seen 相同，分页时按 id 区分
+                last_seen=base + timedelta(minutes=i // 2),
+            ))
+        db.commit()
+        
+        app = FastAPI()
+        app.include_router(router, prefix="/api")
+        
+        def override():
+            session = Session()
+            try:
+                yield session
+            finally:
+                session.close()
+        app.dependency_overrides[get_db] = override
+        client = TestClient(app)
+        
+        def macs(response):
+            return [device["macAddress"][-2:] for device in response.json()]
+        
+        # 不传 limit/cursor 时返回全部，不分页
+        response = client.get("/api/devices")
+        assert len(response.json()) == 12 and "x-next-cursor" not in response.headers
+        assert macs(response)[:3] == ["0B", "0A", "09"], macs(response)
+        
+        # 分页：逐页取完，页边界落在相同 last_seen 的两行之间也不重复、不遗漏
+        pages, cursor = [], None
+        while True:
+            response = client.get("/api/devices", params={"limit": 5, **({"cursor": cursor} if cursor else {})})
+            pages.append(macs(response))
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+        assert [len(page) for page in pages] == [5, 5, 2], pages
+        assert sum(pages, []) == macs(client.get("/api/devices"))
+        # 恰好整页时没有下一页
+        assert "x-next-cursor" not in client.get("/api/devices", params={"limit": 12}).headers
+        assert client.get("/api/devices", params={"cursor": "不是游标"}).status_code == 400
+        
+        # 过滤：前缀匹配主机名（不区分大小写）或MAC，特殊字符按字面匹配
+        assert sorted(macs(client.get("/api/devices", params={"prefix": "IP"}))) == \
+            ["%02X" % i for i in range(12) if i % 3 < 2]
+        assert macs(client.get("/api/devices", params={"prefix": "ipad_1"})) == ["0A", "01"]
+        assert client.get("/api/devices", params={"prefix": "ipad%"}).json() == []
+        assert macs(client.get("/api/devices", params={"prefix": "aa:bb:cc:00:00:0a"})) == ["0A"]
+        assert len(client.get("/api/devices", params={"online": "true", "device_type": "mobile"}).json()) == 4
+        seen = client.get("/api/devices", params={
+            "seen_after": (base + timedelta(minutes=2)).replace(tzinfo=timezone.utc).isoformat(),
+            "seen_before": (base + timedelta(hours=8, minutes=4)).replace(tzinfo=timezone(timedelta(hours=8))).isoformat(),
+            "fields": "macAddress",
+        })
+        assert seen.json() == [{"macAddress": "AA:BB:CC:00:00:%02X" % i} for i in (7, 6, 5, 4)], seen.json()
+        db.close()
+        print("✅ 过滤、分页边界和不分页的默认行为符合预期")
+        return True
+    except Exception as e:
+        print(f"❌ 设备列表测试失败: {e}")
+        return False
+
+def test_health_routes():
+    """测试健康检查路由不被前端SPA路由遮住，未就绪时返回503"""
+    print("\n🔍 测试健康检查路由...")
+    
+    try:
+        import os
+        import tempfile
+        from fastapi.testclient import TestClient
+        import main as app_main
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "index.html"), "w") as f:
+                f.write("<!doctype html><div id=app></div>")
+            app_main.mount_spa(tmp)
+            client = TestClient(app_main.app)
+            
+            response = client.get("/health/live")
+            assert response.status_code == 200 and response.json() == {"status": "ok"}, response.text
+            response = client.get("/health")
+            assert response.headers["content-type"].startswith("application/json"), response.headers
+            assert "storage" in response.json() and "retention" in response.json()
+            
+            # 数据库未初始化时未就绪
+            db_ready = app_main.db_ready
+            try:
+                app_main.db_ready = False
+                response = client.get("/health/ready")
+                assert response.status_code == 503 and response.json()["status"] == "starting", response.text
+                app_main.db_ready = True
+                assert client.get("/health/ready").status_code == 200
+            finally:
+                app_main.db_ready = db_ready
+            
+            # 其他路径仍回退到前端
+            response = client.get("/dashboard/devices")
+            assert response.status_code == 200 and response.headers["content-type"].startswith("text/html")
+        print("✅ /health、/health/live、/health/ready 优先于前端路由，未就绪时返回503")
+        return True
+    except Exception as e:
+        print(f"❌ 健康检查路由测试失败: {e}")
+        return False
+
+def test_spa_static_files():
+    """测试前端静态文件索引、编码协商和路径穿越"""
+    print("\n🔍 测试前端静态文件...")
+    
+    try:
+        import gzip
+        import os
+        import tempfile
+        from starlette.requests import Request
+        from utils.static_files import SPAStaticFiles, NO_CACHE, IMMUTABLE_CACHE
+        
+        def request(accept_encoding: str = "", if_none_match: str = ""):
+            headers = [(b"accept-encoding", accept_encoding.encode())]
+            if if_none_match:
+                headers.append((b"if-none-match", if_none_match.encode()))
+            return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            dist = os.path.join(tmp, "dist")
+            os.makedirs(os.path.join(dist, "assets"))
+            with open(os.path.join(dist, "index.html"), "w") as f:
+                f.write("<!doctype html>" + "<div></div>" * 100)
+            script = b"console.log('jarvis');" * 200
+            with open(os.path.join(dist, "assets", "app.1234.js"), "wb") as f:
+                f.write(script)
+            with open(os.path.join(dist, "assets", "app.1234.js.br"), "wb") as f:
+                f.write(b"brotli-bytes")
+            with open(os.path.join(tmp, "secret.txt"), "w") as f:
+                f.write("secret")
+            spa = SPAStaticFiles(dist)
+            
+            # 索引和回退
+            assert spa.lookup("") is spa.index and spa.lookup("/devices/42") is spa.index
+            assert spa.index.cache_control == NO_CACHE
+            assert spa.lookup("assets/app.1234.js").cache_control == IMMUTABLE_CACHE
+            assert spa.lookup("assets/missing.js") is None
+            assert "assets/app.1234.js.br" not in spa.entries
+            # 路径穿越只会命中内存索引，不会读取 dist 之外的文件
+            for path in ("../secret.txt", "/../secret.txt", "%2e%2e/secret.txt"):
+                assert spa.lookup(path) is spa.index, path
+            assert spa.lookup("assets/../../secret.txt") is None
+            
+            entry = spa.lookup("assets/app.1234.js")
+            br = spa.response(entry, request("gzip, br"))
+            assert br.headers["content-encoding"] == "br" and br.path.endswith("app.1234.js.br")
+            gz = spa.response(entry, request("gzip, br;q=0"))
+            assert gz.headers["content-encoding"] == "gzip" and gzip.decompress(gz.body) == script
+            plain = spa.response(entry, request())
+            assert "content-encoding" not in plain.headers and plain.body == script
+            etags = {br.headers["etag"], gz.headers["etag"], plain.headers["etag"]}
+            assert len(etags) == 3, etags
+            assert all(r.headers["vary"] == "Accept-Encoding" for r in (br, gz, plain))
+            
+            # 条件请求只匹配同一编码的ETag
+            assert spa.response(entry, request("gzip", gz.headers["etag"])).status_code == 304
+            assert spa.response(entry, request("", gz.headers["etag"])).status_code == 200
+            assert spa.response(entry, request("", "W/" + plain.headers["etag"])).status_code == 304
+        print("✅ 未知路由回退index.html，按编码选择版本，ETag按编码区分，路径穿越不读磁盘")
+        return True
+    except Exception as e:
+        print(f"❌ 前端静态文件测试失败: {e}")
+        return False
+
 def main():
     """主测试函数"""
     print("=" * 50)
@@ -80,6 +1463,81 @@ def main():
     # 测试数据库模型
     results.append(("数据库模型", test_database_models()))
     
+    # 测试延迟流式统计
+    results.append(("延迟流式统计", test_latency_stats()))
+    
+    # 测试内存时序存储
+    results.append(("内存时序存储", test_timeseries_store()))
+    
+    # 测试列式归档
+    results.append(("列式归档", test_columnar_archive()))
+    
+    # 测试旋转门压缩
+    results.append(("旋转门压缩", test_swinging_door()))
+    
+    # 测试在线状态跟踪
+    results.append(("在线状态跟踪", test_presence_tracker()))
+    
+    # 测试流式异常检测
+    results.append(("流式异常检测", test_anomaly_detector()))
+    
+    # 测试告警规则引擎
+    results.append(("告警规则引擎", test_alert_rules()))
+    
+    # 测试采集器主节点选举
+    results.append(("采集器主节点选举", test_collector_leader()))
+    
+    # 测试RPC录制与回放
+    results.append(("RPC录制与回放", test_capture_replay()))
+    
+    # 测试时间桶缓存
+    results.append(("时间桶缓存", test_bucket_cache()))
+    
+    # 测试用量累计
+    results.append(("用量累计", test_usage_accounting()))
+    
+    # 测试流量大户统计
+    results.append(("流量大户统计", test_top_talkers()))
+    
+    # 测试无线终端统计
+    results.append(("无线终端统计", test_wifi_stations()))
+    
+    # 测试MySQL按天分区
+    results.append(("MySQL按天分区", test_mysql_partitions()))
+    
+    # 测试写入队列
+    results.append(("写入队列", test_ingest_queue()))
+    
+    # 测试写入缓冲文件
+    results.append(("写入缓冲文件", test_spool()))
+    
+    # 测试高精度流量采样
+    results.append(("高精度流量采样", test_highres_traffic()))
+    
+    # 测试MAC厂商查询
+    results.append(("MAC厂商查询", test_oui_lookup()))
+    
+    # 测试热力图
+    results.append(("热力图", test_heatmap_cube()))
+    
+    # 测试分批清理
+    results.append(("分批清理", test_chunked_retention()))
+    
+    # 测试JSON序列化
+    results.append(("JSON序列化", test_fast_json()))
+    
+    # 测试数据导出
+    results.append(("数据导出", test_export_stream()))
+    
+    # 测试设备列表
+    results.append(("设备列表", test_device_list()))
+    
+    # 测试健康检查路由
+    results.append(("健康检查路由", test_health_routes()))
+    
+    # 测试前端静态文件
+    results.append(("前端静态文件", test_spa_static_files()))
+    
     # 打印结果
     print("\n" + "=" * 50)
     print("  测试结果")
@@ -0,0 +1,178 @@
+"""
+路由器RPC录制与回放
+录制：RecordingTransport 包装真实的httpx传输层，把每次RPC请求和响应连同时间、
+所属采集任务追加写入录制文件（CAPTURE_FILE 非空时 IStoreOSClient 自动启用）
+回放：ReplayTransport 按采集任务的一次调用为单位，把录制的响应按请求匹配交还给客户端
+
+文件格式: MAGIC(4) + 版本(1) + 帧*
+帧 = 长度(uint32 LE) + zlib(orjson(记录))，写入中断的最后一帧在读取时忽略
+"""
+import contextvars
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+import orjson
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FILE = os.getenv("CAPTURE_FILE", "")
+
+MAGIC = b"JVRC"
+VERSION = 1
+FRAME_HEADER = struct.Struct("<I")
+
+AUTH_PATH_SUFFIX = "/rpc/auth"
+
+# 当前正在执行的采集任务 (任务名, 开始时间)，由 DataCollector.run_job 设置
+current_job: contextvars.ContextVar[Optional[Tuple[str, float]]] = contextvars.ContextVar("current_job", default=None)
+
+
+def rpc_fields(path: str, content: bytes) -> Tuple[str, list]:
+    """请求体 -> (RPC方法, 用于匹配的参数)：去掉session token，登录请求去掉密码"""
+    try:
+        body = json.loads(content) if content else {}
+    except ValueError:
+        return "", []
+    method = body.get("method", "")
+    params = body.get("params") or []
+    if path.endswith(AUTH_PATH_SUFFIX):
+        return method, params[:1]
+    return method, params[1:]
+
+
+class CaptureWriter:
+    """追加写入录制帧，每帧写完即flush，进程中断最多丢失最后一帧"""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC + bytes([VERSION]))
+            self.file.flush()
+
+    def write(self, record: Dict):
+        payload = zlib.compress(orjson.dumps(record))
+        self.file.write(FRAME_HEADER.pack(len(payload)) + payload)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_capture(path: str) -> Iterator[Dict]:
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"不是录制文件: {path}")
+        if header[len(MAGIC)] != VERSION:
+            raise ValueError(f"不支持的录制文件版本: {header[len(MAGIC)]}")
+        while True:
+            frame_header = f.read(FRAME_HEADER.size)
+            if len(frame_header) < FRAME_HEADER.size:
+                return
+            (length,) = FRAME_HEADER.unpack(frame_header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield orjson.loads(zlib.decompress(payload))
+
+
+def group_invocations(records: Iterable[Dict]) -> List[Tuple[float, str, List[Dict]]]:
+    """按 (任务, 任务开始时间) 分组，返回按开始时间排序的 (开始时间, 任务名, 记录列表)"""
+    groups: Dict[Tuple[str, float], List[Dict]] = {}
+    for record in records:
+        if record.get("job"):
+            groups.setdefault((record["job"], record["jt"]), []).append(record)
+    return sorted(((started, job, items) for (job, started), items in groups.items()), key=lambda item: item[0])
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """透传请求到真实传输层，同时录制请求和响应"""
+
+    def __init__(self, path: str, inner: Optional[httpx.AsyncBaseTransport] = None):
+        self.writer = CaptureWriter(path)
+        self.inner = inner or httpx.AsyncHTTPTransport(verify=False)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.time()
+        job = current_job.get()
+        method, params = rpc_fields(request.url.path, request.content)
+        record = {
+            "t": started,
+            "job": job[0] if job else None,
+            "jt": job[1] if job else None,
+            "path": request.url.path,
+            "method": method,
+            "params": params,
+        }
+        try:
+            response = await self.inner.handle_async_request(request)
+            body = await response.aread()
+            await response.aclose()
+        except httpx.HTTPError as e:
+            record.update(ms=(time.time() - started) * 1000, error=str(e))
+            self._write(record)
+            raise
+        content_type = response.headers.get("content-type", "application/json")
+        record.update(
+            ms=(time.time() - started) * 1000,
+            status=response.status_code,
+            contentType=content_type,
+            body=body.decode("utf-8", errors="replace"),
+        )
+        self._write(record)
+        # aread() 已解码内容编码，只保留 content-type
+        return httpx.Response(response.status_code, headers={"content-type": content_type},
+                              content=body, request=request)
+
+    def _write(self, record: Dict):
+        try:
+            self.writer.write(record)
+        except Exception as e:
+            logger.error(f"写入录制文件失败: {e}")
+
+    async def aclose(self):
+        self.writer.close()
+        await self.inner.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    回放一次任务调用的录制响应：按 路径 + 方法 + 参数 匹配最早的未使用记录，
+    响应时把时钟设置为录制时收到响应的时间；匹配不到返回404（客户端按原有逻辑降级）
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock
+        self.pending: List[Dict] = []
+        self.served = 0
+        self.misses = 0
+
+    def load(self, records: List[Dict]):
+        self.pending = list(records)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        method, params = rpc_fields(path, request.content)
+        for index, record in enumerate(self.pending):
+            if record["path"] == path and record["method"] == method and record["params"] == params:
+                del self.pending[index]
+                break
+        else:
+            self.misses += 1
+            logger.warning(f"回放中没有匹配的录制响应: {path} {method} {params}")
+            return httpx.Response(404, request=request)
+
+        self.served += 1
+        if self.clock is not None:
+            self.clock.set(record["t"] + record["ms"] / 1000)
+        if "error" in record:
+            raise httpx.ConnectError(record["error"], request=request)
+        return httpx.Response(record["status"], headers={"content-type": record["contentType"]},
+                              content=record["body"].encode("utf-8"), request=request)
@@ -0,0 +1,37 @@
+"""
+可替换的时钟
+采集路径上的时间都从这里取：正常运行时就是系统时间，回放录制数据时由回放驱动
+设置为录制时的时间，保证速率计算、时间戳和保留期清理与原始运行一致
+"""
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+
+class Clock:
+    def __init__(self):
+        self.fixed: Optional[float] = None
+
+    def time(self) -> float:
+        """当前epoch秒"""
+        return self.fixed if self.fixed is not None else time.time()
+
+    def utcnow(self) -> datetime:
+        """当前UTC naive datetime"""
+        if self.fixed is None:
+            return datetime.utcnow()
+        return datetime.fromtimestamp(self.fixed, tz=timezone.utc).replace(tzinfo=None)
+
+    def set(self, ts: Optional[float]):
+        """固定到指定时间；None 恢复为系统时间"""
+        self.fixed = ts
+
+
+clock = Clock()
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """数据库中时间为UTC naive，带时区的参数先转换"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
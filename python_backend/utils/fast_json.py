@@ -0,0 +1,65 @@
+"""
+基于 orjson 的快速JSON响应
+直接序列化行元组 / 列数组，跳过 jsonable_encoder 和逐行 isoformat()
+"""
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from fastapi.responses import JSONResponse
+
+# 时间戳格式：ISO字符串（默认）或 epoch毫秒（紧凑）
+TS_FORMATS = ("iso", "ms")
+
+
+def _default(obj: Any):
+    if isinstance(obj, array):
+        return obj.tolist()
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson 序列化的 JSONResponse；处理函数直接返回本类以跳过 jsonable_encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def epoch_ms(value) -> Optional[int]:
+    """datetime(UTC naive) 或 epoch秒 -> epoch毫秒"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return int(value * 1000)
+
+
+def format_ts(value, ts_format: str = "iso"):
+    """按请求的格式输出时间戳；iso 格式直接交给 orjson 序列化 datetime"""
+    if ts_format == "ms":
+        return epoch_ms(value)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def records(rows: Iterable[Sequence], keys: Sequence[str], ts_format: str = "iso",
+            ts_keys: Sequence[str] = ("timestamp",)) -> List[Dict[str, Any]]:
+    """行元组 -> 字典列表，keys 与行中的列一一对应"""
+    ts_positions = [i for i, key in enumerate(keys) if key in ts_keys]
+    result = []
+    for row in rows:
+        values = list(row)
+        for i in ts_positions:
+            values[i] = format_ts(values[i], ts_format)
+        result.append(dict(zip(keys, values)))
+    return result
+
+
+def columnar(timestamps: Sequence, columns: Dict[str, Sequence], ts_format: str = "iso") -> Dict[str, list]:
+    """列式结构 {"t": [...], "列名": [...]}，用于图表序列"""
+    result = {"t": [format_ts(ts, ts_format) for ts in timestamps]}
+    for key, values in columns.items():
+        result[key] = values
+    return result
@@ -0,0 +1,24 @@
+"""
+API响应的gzip压缩中间件
+只压缩 /api 下的JSON响应，跳过流式导出等自行处理编码的路径；
+静态文件由 SPAStaticFiles 使用预压缩版本
+"""
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import Receive, Scope, Send
+
+# 不经过中间件压缩的路径前缀
+EXCLUDED_PREFIXES = (
+    "/api/export",
+    "/api/alerts/stream",
+)
+
+
+class ApiGZipMiddleware(GZipMiddleware):
+    """按路径前缀启用的 GZipMiddleware"""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "") if scope["type"] == "http" else ""
+        if not path.startswith("/api") or path.startswith(EXCLUDED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
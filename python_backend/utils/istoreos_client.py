@@ -5,23 +5,57 @@ iStoreOS路由器API客户端 - 真实数据对接版本
 import httpx
 import asyncio
 import re
-import time
-from typing import Dict, List, Optional, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import os
 import logging
 import json
+from utils.capture import CAPTURE_FILE, RecordingTransport
+from utils.clock import clock
+from utils.json_stream import ResultLineDecoder
+from utils.oui import classify_mac
 
 logger = logging.getLogger(__name__)
 
+# 一次调用遍历所有无线接口
+WIFI_STATIONS_COMMAND = (
+    "for dev in $(iw dev 2>/dev/null | awk '$1==\"Interface\"{print $2}'); "
+    "do iw dev $dev station dump; done"
+)
+
+# 同一次调用读取路由器uptime和接口计数器，速率按路由器时钟计算
+TRAFFIC_COUNTERS_COMMAND = "cat /proc/uptime /proc/net/dev"
+
+# iw station dump 字段 -> 终端统计字段（取数值部分）
+STATION_FIELDS = {
+    "signal": "signal",  # dBm
+    "signal avg": "signal_avg",
+    "tx bitrate": "tx_bitrate",  # MBit/s
+    "rx bitrate": "rx_bitrate",
+    "rx bytes": "rx_bytes",
+    "tx bytes": "tx_bytes",
+    "rx packets": "rx_packets",
+    "tx packets": "tx_packets",
+    "tx retries": "tx_retries",
+    "tx failed": "tx_failed",
+    "rx duration": "rx_duration",  # 微秒（空口占用时间）
+    "tx duration": "tx_duration",
+    "inactive time": "inactive_time",  # 毫秒
+    "connected time": "connected_time",  # 秒
+}
+
 class IStoreOSClient:
     """iStoreOS路由器API客户端"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
         self.router_url = os.getenv("ROUTER_URL", "http://192.168.100.1")
         self.username = os.getenv("ROUTER_USERNAME", "root")
         self.password = os.getenv("ROUTER_PASSWORD", "password")
         self.session_token = None
-        self.client = httpx.AsyncClient(timeout=10.0, verify=False)
+        # CAPTURE_FILE 非空时录制所有RPC请求和响应；回放时传入 ReplayTransport
+        if transport is None and CAPTURE_FILE:
+            transport = RecordingTransport(CAPTURE_FILE)
+            logger.info(f"[iStoreOS] 录制RPC请求和响应到 {CAPTURE_FILE}")
+        self.client = httpx.AsyncClient(timeout=10.0, verify=False, transport=transport)
         self.last_traffic_data = {}  # 用于计算流量速度
         self.last_traffic_time = 0
     
@@ -94,6 +128,38 @@ class IStoreOSClient:
             logger.error(f"[iStoreOS] 命令执行失败: {e}")
             return None
     
+    async def stream_command_lines(self, command: str) -> AsyncIterator[str]:
+        """执行系统命令并逐行产出输出，边接收响应边解码，不在内存中拼接整个输出"""
+        if not self.session_token:
+            if not await self.login():
+                return
+        
+        try:
+            async with self.client.stream(
+                "POST",
+                f"{self.router_url}/cgi-bin/luci/rpc/sys",
+                json={
+                    "id": 1,
+                    "method": "exec",
+                    "params": [self.session_token, command]
+                }
+            ) as response:
+                if response.status_code != 200:
+                    logger.error(f"[iStoreOS] 命令执行失败: HTTP {response.status_code}")
+                    return
+                decoder = ResultLineDecoder()
+                async for chunk in response.aiter_bytes():
+                    for line in decoder.feed(chunk):
+                        yield line
+                for line in decoder.finish():
+                    yield line
+                if not decoder.found:
+                    # 没有字符串结果，通常是token过期，下次调用时重新登录
+                    logger.error("[iStoreOS] 命令执行没有返回结果")
+                    self.session_token = None
+        except httpx.HTTPError as e:
+            logger.error(f"[iStoreOS] 命令执行失败: {e}")
+    
     async def get_network_traffic(self) -> Dict:
         """
         获取网络流量数据
@@ -128,7 +194,7 @@ class IStoreOSClient:
                 return self._get_mock_traffic()
             
             # 计算速度（需要两次采样）
-            current_time = time.time()
+            current_time = clock.time()
             rx_bytes = wan_interface['rx_bytes']
             tx_bytes = wan_interface['tx_bytes']
             
@@ -158,12 +224,37 @@ class IStoreOSClient:
                 "download_speed": download_speed,  # 字节/秒
                 "total_upload": tx_bytes,  # 总上传字节数
                 "total_download": rx_bytes,  # 总下载字节数
+                # 所有接口的原始字节计数器，用于用量累计
+                "interfaces": {
+                    name: (iface['rx_bytes'], iface['tx_bytes'])
+                    for name, iface in interfaces.items() if name != 'lo'
+                },
             }
             
         except Exception as e:
             logger.error(f"[iStoreOS] 获取网络流量失败: {e}")
             return self._get_mock_traffic()
     
+    async def get_traffic_counters(self) -> Optional[Tuple[float, Dict[str, Tuple[int, int]]]]:
+        """
+        读取路由器uptime（秒）和所有接口的字节计数器
+        返回 (uptime, {接口: (rx_bytes, tx_bytes)})；失败时返回None（不使用模拟数据）
+        """
+        result = await self.exec_command(TRAFFIC_COUNTERS_COMMAND)
+        if not result:
+            return None
+        uptime_line, _, net_dev = result.partition('\n')
+        try:
+            uptime = float(uptime_line.split()[0])
+        except (IndexError, ValueError):
+            logger.warning(f"[iStoreOS] 无法解析/proc/uptime: {uptime_line!r}")
+            return None
+        interfaces = self._parse_net_dev(net_dev)
+        return uptime, {
+            name: (iface['rx_bytes'], iface['tx_bytes'])
+            for name, iface in interfaces.items() if name != 'lo'
+        }
+    
     def _parse_net_dev(self, data: str) -> Dict[str, Dict]:
         """解析/proc/net/dev内容"""
         interfaces = {}
@@ -249,6 +340,7 @@ class IStoreOSClient:
                             "ip_address": ip,
                             "hostname": hostname,
                             "device_type": self._guess_device_type(hostname, mac),
+                            "vendor": classify_mac(mac)[0],
                             "is_online": True,
                             "upload_speed": 0,  # 需要额外的流量统计
                             "download_speed": 0,
@@ -262,7 +354,7 @@ class IStoreOSClient:
             return self._get_mock_devices()
     
     def _guess_device_type(self, hostname: str, mac: str) -> str:
-        """根据主机名和MAC地址猜测设备类型"""
+        """根据主机名和MAC地址猜测设备类型：主机名关键字优先，其次按OUI厂商"""
         hostname_lower = hostname.lower()
         
         if any(x in hostname_lower for x in ['iphone', 'ipad', 'android', 'phone']):
@@ -273,8 +365,14 @@ class IStoreOSClient:
             return 'tv'
         elif any(x in hostname_lower for x in ['nas', 'server']):
             return 'server'
-        else:
-            return 'other'
+        
+        vendor, vendor_type, randomized = classify_mac(mac)
+        if vendor_type:
+            return vendor_type
+        if randomized:
+            # 手机默认为每个网络使用随机的私有地址
+            return 'mobile'
+        return 'other'
     
     def _get_mock_devices(self) -> List[Dict]:
         """返回模拟设备数据"""
@@ -495,6 +593,47 @@ class IStoreOSClient:
             "jitter": random.uniform(1, 10),
         }
     
+    async def get_wifi_stations(self) -> List[Dict]:
+        """
+        获取所有无线接口上已关联终端的统计
+        一次命令调用遍历所有无线接口执行 iw station dump，终端数和射频数不增加调用次数
+        """
+        try:
+            result = await self.exec_command(WIFI_STATIONS_COMMAND)
+            if not result:
+                return []
+            return self._parse_station_dump(result)
+        except Exception as e:
+            logger.error(f"[iStoreOS] 获取无线终端失败: {e}")
+            return []
+    
+    def _parse_station_dump(self, data: str) -> List[Dict]:
+        """解析 iw dev <接口> station dump 输出"""
+        stations = []
+        station = None
+        for line in data.split('\n'):
+            if line.startswith('Station '):
+                # Station aa:bb:cc:dd:ee:ff (on wlan0)
+                parts = line.split()
+                station = {
+                    "mac_address": parts[1].upper(),
+                    "interface": parts[3].rstrip(')') if len(parts) > 3 else "",
+                }
+                stations.append(station)
+                continue
+            if station is None or ':' not in line:
+                continue
+            key, _, value = line.strip().partition(':')
+            field = STATION_FIELDS.get(key)
+            value = value.split()
+            if field is None or not value:
+                continue
+            try:
+                station[field] = float(value[0])
+            except ValueError:
+                continue
+        return stations
+    
     async def get_connection_quality(self) -> Dict:
         """
         获取连接质量
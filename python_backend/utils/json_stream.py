@@ -0,0 +1,105 @@
+"""
+JSON-RPC 响应的流式解码
+命令输出以JSON字符串的形式放在响应的 result 字段中，大输出（如数万行的conntrack表）
+不必先拼成完整字符串再解析：按块喂入原始字节，边反转义边按行产出
+"""
+import re
+from typing import List, Optional
+
+RESULT_KEY = re.compile(rb'"result"\s*:\s*')
+SPECIAL = re.compile(rb'[\\"]')
+
+ESCAPES = {
+    ord('"'): b'"',
+    ord('\\'): b'\\',
+    ord('/'): b'/',
+    ord('t'): b'\t',
+    ord('r'): b'\r',
+    ord('b'): b'\b',
+    ord('f'): b'\f',
+}
+
+# 未找到 result 时保留的尾部字节数（键可能跨块）
+SEEK_TAIL = 64
+
+
+class ResultLineDecoder:
+    """增量解码 {"result": "..."} 中的字符串，按 \\n 切分为行"""
+
+    def __init__(self):
+        self.seeking = True
+        self.found = False
+        self.done = False
+        self.buffer = b""
+        self.line = bytearray()
+        self.high_surrogate: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[str]:
+        if self.done:
+            return []
+        if self.seeking:
+            self.buffer += chunk
+            match = RESULT_KEY.search(self.buffer)
+            if match is None or match.end() >= len(self.buffer):
+                if match is None:
+                    self.buffer = self.buffer[-SEEK_TAIL:]
+                return []
+            self.seeking = False
+            if self.buffer[match.end()] != ord('"'):
+                # result 不是字符串（null或出错）
+                self.done = True
+                return []
+            self.found = True
+            chunk = self.buffer[match.end() + 1:]
+            self.buffer = b""
+        return self._decode(self.buffer + chunk)
+
+    def finish(self) -> List[str]:
+        """响应结束：返回最后一个没有换行结尾的行"""
+        if self.line:
+            line = self.line.decode("utf-8", errors="replace")
+            self.line = bytearray()
+            return [line]
+        return []
+
+    def _decode(self, data: bytes) -> List[str]:
+        lines = []
+        pos = 0
+        self.buffer = b""
+        while True:
+            match = SPECIAL.search(data, pos)
+            if match is None:
+                self.line += data[pos:]
+                return lines
+            index = match.start()
+            self.line += data[pos:index]
+            if data[index] == ord('"'):
+                self.done = True
+                lines.extend(self.finish())
+                return lines
+            if index + 1 >= len(data):
+                self.buffer = data[index:]
+                return lines
+            code = data[index + 1]
+            if code == ord('n'):
+                lines.append(self.line.decode("utf-8", errors="replace"))
+                self.line = bytearray()
+                pos = index + 2
+            elif code == ord('u'):
+                if index + 6 > len(data):
+                    self.buffer = data[index:]
+                    return lines
+                self._append_codepoint(int(data[index + 2:index + 6], 16))
+                pos = index + 6
+            else:
+                self.line += ESCAPES.get(code, bytes([code]))
+                pos = index + 2
+
+    def _append_codepoint(self, value: int):
+        if 0xD800 <= value < 0xDC00:
+            self.high_surrogate = value
+            return
+        if 0xDC00 <= value < 0xE000 and self.high_surrogate is not None:
+            value = 0x10000 + ((self.high_surrogate - 0xD800) << 10) + (value - 0xDC00)
+        self.high_surrogate = None
+        self.line += chr(value).encode("utf-8", errors="replace")
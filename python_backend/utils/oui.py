@@ -0,0 +1,247 @@
+"""
+MAC地址厂商（OUI）查询
+厂商表按前缀长度（MA-L 24位、MA-M 28位、MA-S 36位）分别存为有序整数数组，
+查询时从最长前缀开始二分查找；厂商名去重后只保存一份。表在第一次查询时加载，
+每个MAC的分类结果有LRU缓存。
+
+内置的 oui_vendors.tsv.gz 是 MA-L/MA-M/MA-S/IAB 注册表的完整快照，由本模块生成并随代码提交；
+刷新时手动执行（后面的文件覆盖前面的同一前缀）：
+    python -m utils.oui --download                           # 从IEEE下载CSV
+    python -m utils.oui oui.csv mam.csv oui36.csv            # 已下载的IEEE CSV
+    python -m utils.oui manuf oui.txt iab.txt                # Wireshark manuf + IEEE文本格式
+"""
+import csv
+import gzip
+import io
+import os
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+
+BUNDLED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "oui_vendors.tsv.gz")
+
+# 厂商表（每行 "十六进制前缀<TAB>厂商"，可为 .gz）
+OUI_FILE = os.getenv("OUI_FILE", BUNDLED_FILE)
+# 按MAC缓存的分类结果数量
+OUI_CACHE_SIZE = int(os.getenv("OUI_CACHE_SIZE", "4096"))
+
+# IEEE注册表（MA-L、MA-M、MA-S）
+IEEE_REGISTRY_URLS = (
+    "https://standards-oui.ieee.org/oui/oui.csv",
+    "https://standards-oui.ieee.org/oui28/mam.csv",
+    "https://standards-oui.ieee.org/oui36/oui36.csv",
+)
+
+# 前缀十六进制位数 -> 前缀位数
+PREFIX_BITS = {6: 24, 7: 28, 9: 36}
+
+# 厂商名关键字 -> 设备类型（按顺序匹配）
+VENDOR_TYPES = (
+    (("raspberry pi", "synology", "qnap", "vmware", "virtualbox"), "server"),
+    (("espressif", "tuya", "philips lighting", "signify", "nest labs", "sonos", "amazon"), "iot"),
+    (("hikvision", "dahua"), "camera"),
+    (("ubiquiti", "tp-link", "cisco", "netgear", "linksys"), "network"),
+    (("nintendo", "sony interactive"), "console"),
+    (("roku",), "tv"),
+    (("apple", "xiaomi", "huawei", "samsung", "oneplus", "oppo", "vivo", "honor"), "mobile"),
+)
+
+
+def parse_mac(mac: str) -> Optional[int]:
+    """任意分隔符的MAC -> 48位整数"""
+    digits = "".join(ch for ch in mac if ch not in ":-. ")
+    if len(digits) != 12:
+        return None
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+def is_locally_administered(value: int) -> bool:
+    """第一个字节的 U/L 位：随机MAC（手机私有地址等）和虚拟网卡"""
+    return bool((value >> 40) & 0x02)
+
+
+class OUITable:
+    def __init__(self, path: str = OUI_FILE):
+        self.path = path
+        self.loaded = False
+        self.vendors: List[str] = []
+        # 前缀位数 -> (有序前缀, 厂商序号)，从长到短
+        self.prefixes: List[Tuple[int, array, array]] = []
+
+    def load(self):
+        entries: Dict[int, List[Tuple[int, int]]] = {bits: [] for bits in PREFIX_BITS.values()}
+        index: Dict[str, int] = {}
+        if os.path.exists(self.path):
+            opener = gzip.open if self.path.endswith(".gz") else open
+            with opener(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip() or line.startswith("#"):
+                        continue
+                    prefix, _, vendor = line.rstrip("\n").partition("\t")
+                    bits = PREFIX_BITS.get(len(prefix))
+                    if bits is None or not vendor:
+                        continue
+                    if vendor not in index:
+                        index[vendor] = len(self.vendors)
+                        self.vendors.append(vendor)
+                    entries[bits].append((int(prefix, 16), index[vendor]))
+        for bits in sorted(entries, reverse=True):
+            rows = sorted(entries[bits])
+            self.prefixes.append((bits, array("Q", (p for p, _ in rows)), array("I", (v for _, v in rows))))
+        self.loaded = True
+
+    def lookup(self, value: int) -> Optional[str]:
+        if not self.loaded:
+            self.load()
+        for bits, keys, vendors in self.prefixes:
+            key = value >> (48 - bits)
+            pos = bisect_left(keys, key)
+            if pos < len(keys) and keys[pos] == key:
+                return self.vendors[vendors[pos]]
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(keys.itemsize * len(keys) + vendors.itemsize * len(vendors) for _, keys, vendors in self.prefixes)
+
+
+oui_table = OUITable()
+
+
+@lru_cache(maxsize=OUI_CACHE_SIZE)
+def classify_mac(mac: str) -> Tuple[Optional[str], Optional[str], bool]:
+    """MAC -> (厂商, 按厂商推断的设备类型, 是否本地管理地址)"""
+    value = parse_mac(mac)
+    if value is None:
+        return None, None, False
+    if is_locally_administered(value):
+        return None, None, True
+    vendor = oui_table.lookup(value)
+    if vendor is None:
+        return None, None, False
+    lowered = vendor.lower()
+    for keywords, device_type in VENDOR_TYPES:
+        if any(keyword in lowered for keyword in keywords):
+            return vendor, device_type, False
+    return vendor, None, False
+
+
+def _read_ieee_csv(path: str) -> Iterator[Tuple[str, str]]:
+    """IEEE注册表CSV（Registry,Assignment,Organization Name,...）"""
+    with open(path, newline="", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            yield record["Assignment"].strip().upper(), record["Organization Name"]
+
+
+def _read_ieee_text(path: str) -> Iterator[Tuple[str, str]]:
+    """
+    IEEE注册表文本格式（oui.txt、mam.txt、oui36.txt、iab.txt）：
+    "XX-XX-XX (hex)" 行给出前3个字节，"(base 16)" 行为 MA-L 的6位前缀，
+    或 MA-M/MA-S/IAB 的区间（如 "0D7000-0D7FFF"，起止相同的部分接在前3个字节之后）
+    """
+    head = ""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if "(hex)" in line:
+                head = line.split("(hex)")[0].strip().replace("-", "").upper()
+            elif "(base 16)" in line:
+                assignment, _, vendor = line.partition("(base 16)")
+                assignment = assignment.strip().upper()
+                if "-" in assignment:
+                    start, _, end = assignment.partition("-")
+                    common = 0
+                    while common < len(start) and start[common] == end[common]:
+                        common += 1
+                    assignment = head + start[:common]
+                yield assignment, vendor
+
+
+def _read_manuf(path: str) -> Iterator[Tuple[str, str]]:
+    """Wireshark manuf（"00:55:DA:10:00:00/28<TAB>简称<TAB>全称"，没有掩码的3字节地址为24位前缀）"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            address, _, bits = fields[0].partition("/")
+            digits = "".join(ch for ch in address if ch not in ":-.").upper()
+            bits = int(bits) if bits else len(digits) * 4
+            if bits in PREFIX_BITS.values() and len(fields) > 1:
+                yield digits[:bits // 4], fields[-1]
+
+
+def build(paths: Iterable[str], out_path: str) -> int:
+    """
+    把注册表文件转换为厂商表，返回条目数；支持IEEE的CSV（.csv）和文本格式（.txt），
+    以及 Wireshark 的 manuf 文件。同一前缀以后面的文件为准
+    """
+    rows = {}
+    sources = []
+    for path in paths:
+        name = os.path.basename(path)
+        if name.endswith(".csv"):
+            reader = _read_ieee_csv
+        elif name.startswith("manuf"):
+            reader = _read_manuf
+        else:
+            reader = _read_ieee_text
+        for prefix, vendor in reader(path):
+            vendor = " ".join(vendor.split())
+            if len(prefix) in PREFIX_BITS and vendor:
+                rows[prefix] = vendor
+        sources.append(name)
+    if out_path.endswith(".gz"):
+        # 固定gzip头中的时间，相同的输入生成相同的文件
+        output = io.TextIOWrapper(gzip.GzipFile(out_path, "wb", mtime=0), encoding="utf-8")
+    else:
+        output = open(out_path, "w", encoding="utf-8")
+    with output as f:
+        f.write(f"# python -m utils.oui 生成，来源: {', '.join(sources)}\n")
+        for prefix in sorted(rows):
+            f.write(f"{prefix}\t{rows[prefix]}\n")
+    return len(rows)
+
+
+def download(out_path: str, urls: Iterable[str] = IEEE_REGISTRY_URLS, transport=None) -> int:
+    """下载IEEE注册表CSV并生成厂商表，返回条目数；任一文件下载失败时抛出异常，不覆盖已有的表"""
+    with tempfile.TemporaryDirectory() as tmp, httpx.Client(
+        transport=transport, timeout=60, follow_redirects=True
+    ) as client:
+        paths = []
+        for url in urls:
+            path = os.path.join(tmp, url.rsplit("/", 1)[-1])
+            with client.stream("GET", url) as response:
+                response.raise_for_status()
+                with open(path, "wb") as f:
+                    for chunk in response.iter_bytes():
+                        f.write(chunk)
+            paths.append(path)
+        # 保留扩展名（决定是否gzip），写完后替换
+        partial = os.path.join(os.path.dirname(out_path), ".partial-" + os.path.basename(out_path))
+        count = build(paths, partial)
+        os.replace(partial, out_path)
+        return count
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    out = BUNDLED_FILE
+    if "--out" in args:
+        position = args.index("--out")
+        out = args[position + 1]
+        del args[position:position + 2]
+    if args == ["--download"]:
+        print(f"已写入 {download(out)} 条到 {out}")
+    elif args and "--download" not in args:
+        print(f"已写入 {build(args, out)} 条到 {out}")
+    else:
+        print("用法: python -m utils.oui (--download | 注册表文件...) [--out utils/oui_vendors.tsv.gz]")
+        sys.exit(1)
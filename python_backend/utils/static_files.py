@@ -0,0 +1,145 @@
+"""
+前端SPA静态文件服务
+启动时为 client/dist 建立内存索引，请求时只查字典，不访问文件系统路径，
+带哈希的 /assets 文件长期缓存，按 Accept-Encoding 选择预压缩的 br / gzip 版本
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+logger = logging.getLogger(__name__)
+
+# 小于该大小的文件直接缓存在内存中
+MEMORY_CACHE_LIMIT = 1024 * 1024
+
+# 没有预压缩文件时，启动时为这些类型生成gzip版本
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json",
+    "application/xml", "image/svg+xml", "application/manifest+json",
+)
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+DEFAULT_CACHE = "public, max-age=3600"
+NO_CACHE = "no-cache"
+
+
+class StaticEntry:
+    """索引中的单个文件"""
+
+    def __init__(self, rel_path: str, abs_path: str, media_type: str, cache_control: str):
+        self.rel_path = rel_path
+        self.abs_path = abs_path
+        self.media_type = media_type
+        self.cache_control = cache_control
+        stat = os.stat(abs_path)
+        self.size = stat.st_size
+        self.etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        self.body: Optional[bytes] = None
+        self.variants: Dict[str, object] = {}  # 编码 -> 内存bytes 或 文件路径
+
+        if self.size <= MEMORY_CACHE_LIMIT:
+            with open(abs_path, "rb") as f:
+                self.body = f.read()
+            self.etag = '"' + hashlib.md5(self.body).hexdigest() + '"'
+
+
+class SPAStaticFiles:
+    """client/dist 的内存索引"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.entries: Dict[str, StaticEntry] = {}
+        self._build_index()
+        self.index = self.entries.get("index.html")
+
+    def _build_index(self):
+        precompressed = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                abs_path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(abs_path, self.root).replace(os.sep, "/")
+                if rel_path.endswith(".br") or rel_path.endswith(".gz"):
+                    precompressed[rel_path] = abs_path
+                    continue
+                media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                if rel_path == "index.html":
+                    cache_control = NO_CACHE
+                elif rel_path.startswith("assets/"):
+                    cache_control = IMMUTABLE_CACHE
+                else:
+                    cache_control = DEFAULT_CACHE
+                self.entries[rel_path] = StaticEntry(rel_path, abs_path, media_type, cache_control)
+
+        for rel_path, entry in self.entries.items():
+            for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                variant = precompressed.get(rel_path + suffix)
+                if variant:
+                    entry.variants[encoding] = variant
+            if "gzip" not in entry.variants and entry.body and entry.media_type.startswith(COMPRESSIBLE_TYPES):
+                compressed = gzip.compress(entry.body, compresslevel=9, mtime=0)
+                if len(compressed) < len(entry.body):
+                    entry.variants["gzip"] = compressed
+
+        logger.info(f"前端静态文件索引完成: {len(self.entries)}个文件")
+
+    @staticmethod
+    def _accepted_encodings(request: Request) -> set:
+        accepted = set()
+        for item in request.headers.get("accept-encoding", "").split(","):
+            parts = item.strip().split(";")
+            if len(parts) > 1 and parts[1].strip() in ("q=0", "q=0.0"):
+                continue
+            if parts[0]:
+                accepted.add(parts[0].strip().lower())
+        return accepted
+
+    def lookup(self, path: str) -> Optional[StaticEntry]:
+        """按请求路径查找文件；未命中的前端路由回退到 index.html，缺失的 assets 返回 None"""
+        entry = self.entries.get(path.lstrip("/"))
+        if entry is not None:
+            return entry
+        if path.lstrip("/").startswith("assets/"):
+            return None
+        return self.index
+
+    @staticmethod
+    def _etag_matches(request: Request, etag: str) -> bool:
+        header = request.headers.get("if-none-match")
+        if not header:
+            return False
+        return any(
+            tag.strip() in ("*", etag) or tag.strip() == "W/" + etag
+            for tag in header.split(",")
+        )
+
+    def response(self, entry: StaticEntry, request: Request) -> Response:
+        """按 Accept-Encoding 选择版本；ETag 按编码区分，避免缓存把一种编码的304用于另一种编码"""
+        accepted = self._accepted_encodings(request)
+        encoding = next(
+            (name for name in ("br", "gzip") if name in entry.variants and name in accepted), None
+        )
+        etag = entry.etag if encoding is None else f'{entry.etag[:-1]}-{encoding}"'
+        headers = {
+            "Cache-Control": entry.cache_control,
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+        }
+        if self._etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            variant = entry.variants[encoding]
+            headers["Content-Encoding"] = encoding
+            if isinstance(variant, bytes):
+                return Response(variant, media_type=entry.media_type, headers=headers)
+            return FileResponse(variant, media_type=entry.media_type, headers=headers)
+
+        if entry.body is not None:
+            return Response(entry.body, media_type=entry.media_type, headers=headers)
+        return FileResponse(entry.abs_path, media_type=entry.media_type, headers=headers)